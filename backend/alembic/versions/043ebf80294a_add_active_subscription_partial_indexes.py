@@ -0,0 +1,54 @@
+"""add_active_subscription_partial_indexes
+
+Revision ID: 043ebf80294a
+Revises: f442ff599901
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '043ebf80294a'
+down_revision: Union[str, None] = 'f442ff599901'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        # Активная подписка пользователя - одна проба индекса без чтения таблицы
+        op.create_index(
+            'idx_user_subscriptions_active_user_id',
+            'user_subscriptions',
+            ['user_id'],
+            postgresql_where=sa.text("status = 'active'"),
+            postgresql_include=['plan_id', 'current_period_end'],
+            postgresql_concurrently=True
+        )
+        # Поиск истекших активных подписок для фонового перевода статуса
+        op.create_index(
+            'idx_user_subscriptions_active_period_end',
+            'user_subscriptions',
+            ['current_period_end'],
+            postgresql_where=sa.text("status = 'active'"),
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'idx_user_subscriptions_active_period_end',
+            table_name='user_subscriptions',
+            postgresql_concurrently=True
+        )
+        op.drop_index(
+            'idx_user_subscriptions_active_user_id',
+            table_name='user_subscriptions',
+            postgresql_concurrently=True
+        )
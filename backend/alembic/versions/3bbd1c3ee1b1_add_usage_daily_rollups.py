@@ -0,0 +1,74 @@
+"""add_usage_daily_rollups
+
+Revision ID: 3bbd1c3ee1b1
+Revises: 5943cbad82b6
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3bbd1c3ee1b1'
+down_revision: Union[str, None] = '5943cbad82b6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'usage_daily_rollups',
+        sa.Column('id', UUID(), server_default=sa.text('gen_random_uuid()'), nullable=False),
+        sa.Column('user_id', UUID(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('usage_type', sa.String(20), nullable=False),
+        sa.Column('events', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('tokens', sa.BigInteger(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.PrimaryKeyConstraint('id'),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.UniqueConstraint('user_id', 'day', 'usage_type', name='uq_usage_daily_rollups_user_day_type')
+    )
+    # Сводки по всем пользователям за период
+    op.create_index('idx_usage_daily_rollups_day', 'usage_daily_rollups', ['day'])
+
+    op.create_table(
+        'usage_rollup_watermarks',
+        sa.Column('id', UUID(), server_default=sa.text('gen_random_uuid()'), nullable=False),
+        sa.Column('source', sa.String(50), nullable=False),
+        sa.Column('last_created_at', sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column('last_id', UUID(), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('source')
+    )
+
+    # Инкрементальная агрегация читает источники по (created_at, id) после водяной метки
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_user_images_created_at_id',
+            'user_images',
+            ['created_at', 'id'],
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'idx_tool_usage_created_at_id',
+            'tool_usage',
+            ['created_at', 'id'],
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('idx_tool_usage_created_at_id', table_name='tool_usage', postgresql_concurrently=True)
+        op.drop_index('idx_user_images_created_at_id', table_name='user_images', postgresql_concurrently=True)
+    op.drop_table('usage_rollup_watermarks')
+    op.drop_index('idx_usage_daily_rollups_day', table_name='usage_daily_rollups')
+    op.drop_table('usage_daily_rollups')
@@ -0,0 +1,48 @@
+"""add_image_storage_columns
+
+Revision ID: 40bd365f078e
+Revises: bd1a63700e95
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '40bd365f078e'
+down_revision: Union[str, None] = 'bd1a63700e95'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Файлы изображений переносятся в хранилище, в таблице остаются ключ, размер и хэш.
+    # Существующие строки переносит скрипт migrate_image_storage.py
+    op.add_column('user_images', sa.Column('storage_key', sa.String(255), nullable=True))
+    op.add_column('user_images', sa.Column('size_bytes', sa.Integer(), nullable=True))
+    op.add_column('user_images', sa.Column('content_hash', sa.String(64), nullable=True))
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_user_images_storage_key',
+            'user_images',
+            ['storage_key'],
+            postgresql_where=sa.text("storage_key IS NOT NULL"),
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'idx_user_images_storage_key',
+            table_name='user_images',
+            postgresql_concurrently=True
+        )
+
+    op.drop_column('user_images', 'content_hash')
+    op.drop_column('user_images', 'size_bytes')
+    op.drop_column('user_images', 'storage_key')
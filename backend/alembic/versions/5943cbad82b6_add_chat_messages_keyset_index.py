@@ -0,0 +1,50 @@
+"""add_chat_messages_keyset_index
+
+Revision ID: 5943cbad82b6
+Revises: e08f0bd5283d
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5943cbad82b6'
+down_revision: Union[str, None] = 'e08f0bd5283d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_chat_messages_chat_id_created_at_id',
+            'chat_messages',
+            ['chat_id', sa.text('created_at DESC'), sa.text('id DESC')],
+            postgresql_concurrently=True
+        )
+        # Покрывается префиксом составного индекса
+        op.drop_index(
+            'idx_chat_messages_chat_id',
+            table_name='chat_messages',
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_chat_messages_chat_id',
+            'chat_messages',
+            ['chat_id'],
+            postgresql_concurrently=True
+        )
+        op.drop_index(
+            'idx_chat_messages_chat_id_created_at_id',
+            table_name='chat_messages',
+            postgresql_concurrently=True
+        )
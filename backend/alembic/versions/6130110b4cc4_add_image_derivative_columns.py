@@ -0,0 +1,32 @@
+"""add_image_derivative_columns
+
+Revision ID: 6130110b4cc4
+Revises: 40bd365f078e
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6130110b4cc4'
+down_revision: Union[str, None] = '40bd365f078e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('user_images', sa.Column('thumbnail_url', sa.Text(), nullable=True))
+    op.add_column('user_images', sa.Column('thumbnail_key', sa.String(255), nullable=True))
+    op.add_column('user_images', sa.Column('preview_url', sa.Text(), nullable=True))
+    op.add_column('user_images', sa.Column('preview_key', sa.String(255), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('user_images', 'preview_key')
+    op.drop_column('user_images', 'preview_url')
+    op.drop_column('user_images', 'thumbnail_key')
+    op.drop_column('user_images', 'thumbnail_url')
@@ -0,0 +1,44 @@
+"""add_image_bfl_task_id
+
+Revision ID: 9a2602f8907a
+Revises: 6130110b4cc4
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a2602f8907a'
+down_revision: Union[str, None] = '6130110b4cc4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('user_images', sa.Column('bfl_task_id', sa.String(64), nullable=True))
+
+    with op.get_context().autocommit_block():
+        # Поиск изображения по задаче BFL при обработке webhook
+        op.create_index(
+            'idx_user_images_bfl_task_id',
+            'user_images',
+            ['bfl_task_id'],
+            unique=True,
+            postgresql_where=sa.text("bfl_task_id IS NOT NULL"),
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'idx_user_images_bfl_task_id',
+            table_name='user_images',
+            postgresql_concurrently=True
+        )
+
+    op.drop_column('user_images', 'bfl_task_id')
@@ -0,0 +1,52 @@
+"""add_image_derivative_key_indexes
+
+Revision ID: bbdc3b414d87
+Revises: f1febb06eab4
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'bbdc3b414d87'
+down_revision: Union[str, None] = 'f1febb06eab4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY нельзя выполнять внутри транзакции
+    with op.get_context().autocommit_block():
+        # Сборка мусора хранилища проверяет ссылки и на производные файлы
+        op.create_index(
+            'idx_user_images_thumbnail_key',
+            'user_images',
+            ['thumbnail_key'],
+            postgresql_where=sa.text("thumbnail_key IS NOT NULL"),
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'idx_user_images_preview_key',
+            'user_images',
+            ['preview_key'],
+            postgresql_where=sa.text("preview_key IS NOT NULL"),
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'idx_user_images_preview_key',
+            table_name='user_images',
+            postgresql_concurrently=True
+        )
+        op.drop_index(
+            'idx_user_images_thumbnail_key',
+            table_name='user_images',
+            postgresql_concurrently=True
+        )
@@ -0,0 +1,47 @@
+"""add_image_generation_job_status
+
+Revision ID: bd1a63700e95
+Revises: 043ebf80294a
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'bd1a63700e95'
+down_revision: Union[str, None] = '043ebf80294a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Изображение появляется только после завершения фоновой генерации
+    op.alter_column('user_images', 'image_url', existing_type=sa.Text(), nullable=True)
+    op.add_column('user_images', sa.Column('error', sa.Text(), nullable=True))
+
+    with op.get_context().autocommit_block():
+        # Поиск брошенных незавершенных генераций
+        op.create_index(
+            'idx_user_images_active_updated_at',
+            'user_images',
+            ['updated_at'],
+            postgresql_where=sa.text("status IN ('pending', 'processing')"),
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'idx_user_images_active_updated_at',
+            table_name='user_images',
+            postgresql_concurrently=True
+        )
+
+    op.execute("DELETE FROM user_images WHERE image_url IS NULL")
+    op.drop_column('user_images', 'error')
+    op.alter_column('user_images', 'image_url', existing_type=sa.Text(), nullable=False)
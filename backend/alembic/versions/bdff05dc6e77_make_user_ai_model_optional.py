@@ -0,0 +1,45 @@
+"""make_user_ai_model_optional
+
+Revision ID: bdff05dc6e77
+Revises: f2f134c146d5
+Create Date: 2026-10-18 20:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'bdff05dc6e77'
+down_revision: Union[str, None] = 'f2f134c146d5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Значения по умолчанию, которые колонка получала при создании пользователя
+COLUMN_DEFAULTS = ('claude-3-5-sonnet-20241022', 'claude-3-opus-20240229')
+
+
+def upgrade() -> None:
+    # NULL - пользователь модель не выбирал, используется модель по умолчанию
+    op.alter_column(
+        'users',
+        'ai_model',
+        existing_type=sa.String(50),
+        nullable=True,
+        server_default=None
+    )
+    defaults = ", ".join(f"'{model}'" for model in COLUMN_DEFAULTS)
+    op.execute(f"UPDATE users SET ai_model = NULL WHERE ai_model IN ({defaults})")
+
+
+def downgrade() -> None:
+    op.execute(f"UPDATE users SET ai_model = '{COLUMN_DEFAULTS[0]}' WHERE ai_model IS NULL")
+    op.alter_column(
+        'users',
+        'ai_model',
+        existing_type=sa.String(50),
+        nullable=False,
+        server_default=COLUMN_DEFAULTS[0]
+    )
@@ -0,0 +1,40 @@
+"""add_chat_summaries
+
+Revision ID: e08f0bd5283d
+Revises: 82d5dcbe1d12
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e08f0bd5283d'
+down_revision: Union[str, None] = '82d5dcbe1d12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'chat_summaries',
+        sa.Column('id', UUID(), server_default=sa.text('gen_random_uuid()'), nullable=False),
+        sa.Column('chat_id', UUID(), nullable=False),
+        sa.Column('summary', sa.Text(), nullable=False),
+        sa.Column('summarized_until', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('last_message_id', UUID(), nullable=False),
+        sa.Column('messages_summarized', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('CURRENT_TIMESTAMP')),
+        sa.PrimaryKeyConstraint('id'),
+        sa.ForeignKeyConstraint(['chat_id'], ['chats.id'], ondelete='CASCADE'),
+        sa.UniqueConstraint('chat_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('chat_summaries')
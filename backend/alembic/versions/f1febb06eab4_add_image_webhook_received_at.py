@@ -0,0 +1,26 @@
+"""add_image_webhook_received_at
+
+Revision ID: f1febb06eab4
+Revises: bdff05dc6e77
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1febb06eab4'
+down_revision: Union[str, None] = 'bdff05dc6e77'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('user_images', sa.Column('webhook_received_at', sa.TIMESTAMP(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('user_images', 'webhook_received_at')
@@ -0,0 +1,32 @@
+"""count_image_quota_from_api_usage
+
+Revision ID: f2f134c146d5
+Revises: c548ad24a72b
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2f134c146d5'
+down_revision: Union[str, None] = 'c548ad24a72b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _reset_image_rollups() -> None:
+    # Агрегаты изображений пересчитываются из нового источника с начала истории
+    op.execute("DELETE FROM usage_daily_rollups WHERE usage_type = 'image'")
+    op.execute("DELETE FROM usage_rollup_watermarks WHERE source IN ('user_images', 'api_usage_images')")
+
+
+def upgrade() -> None:
+    # Источник агрегатов изображений - события api_usage вместо строк user_images
+    _reset_image_rollups()
+
+
+def downgrade() -> None:
+    _reset_image_rollups()
@@ -0,0 +1,81 @@
+"""add_token_usage_and_cost
+
+Revision ID: f442ff599901
+Revises: 3bbd1c3ee1b1
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f442ff599901'
+down_revision: Union[str, None] = '3bbd1c3ee1b1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TOKEN_COLUMNS = (
+    'input_tokens',
+    'output_tokens',
+    'cache_creation_input_tokens',
+    'cache_read_input_tokens',
+)
+
+
+def upgrade() -> None:
+    for table in ('chat_messages', 'api_usage'):
+        op.add_column(table, sa.Column('model', sa.String(100), nullable=True))
+        for column in TOKEN_COLUMNS:
+            op.add_column(table, sa.Column(column, sa.Integer(), nullable=True))
+        op.add_column(table, sa.Column('cost_usd', sa.Numeric(12, 6), nullable=True))
+
+    # Стоимость вызовов LLM агрегируется по моделям
+    op.add_column(
+        'usage_daily_rollups',
+        sa.Column('model', sa.String(100), nullable=False, server_default='')
+    )
+    op.add_column(
+        'usage_daily_rollups',
+        sa.Column('cost_usd', sa.Numeric(14, 6), nullable=False, server_default='0')
+    )
+    op.drop_constraint('uq_usage_daily_rollups_user_day_type', 'usage_daily_rollups', type_='unique')
+    op.create_unique_constraint(
+        'uq_usage_daily_rollups_user_day_type_model',
+        'usage_daily_rollups',
+        ['user_id', 'day', 'usage_type', 'model']
+    )
+
+    # Агрегация вызовов LLM читает api_usage по (created_at, id) после водяной метки
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'idx_api_usage_created_at_id',
+            'api_usage',
+            ['created_at', 'id'],
+            postgresql_concurrently=True
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('idx_api_usage_created_at_id', table_name='api_usage', postgresql_concurrently=True)
+
+    op.execute("DELETE FROM usage_daily_rollups WHERE usage_type = 'llm'")
+    op.execute("DELETE FROM usage_rollup_watermarks WHERE source = 'api_usage'")
+    op.drop_constraint('uq_usage_daily_rollups_user_day_type_model', 'usage_daily_rollups', type_='unique')
+    op.create_unique_constraint(
+        'uq_usage_daily_rollups_user_day_type',
+        'usage_daily_rollups',
+        ['user_id', 'day', 'usage_type']
+    )
+    op.drop_column('usage_daily_rollups', 'cost_usd')
+    op.drop_column('usage_daily_rollups', 'model')
+
+    for table in ('chat_messages', 'api_usage'):
+        op.drop_column(table, 'cost_usd')
+        for column in reversed(TOKEN_COLUMNS):
+            op.drop_column(table, column)
+        op.drop_column(table, 'model')
@@ -1,16 +1,30 @@
 from .images import router as images_router 
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from app.core.config import settings
+from app.core.rate_limit import RateLimiter
 from .auth import router as auth_router
 from .subscription import router as subscription_router
 from .chat import router as chat_router
 from .user import router as user_router
+from .webhooks import router as webhooks_router
+
+# Лимиты частоты запросов по группам роутов; дорогие ручки Claude/BFL ограничены дополнительно
+auth_limits = [
+    Depends(RateLimiter("auth", times=settings.RATE_LIMIT_AUTH_PER_IP, per="ip"))
+]
+api_limits = [
+    Depends(RateLimiter("api-user", times=settings.RATE_LIMIT_API_PER_USER, per="user")),
+    Depends(RateLimiter("api-ip", times=settings.RATE_LIMIT_API_PER_IP, per="ip"))
+]
 
 api_router = APIRouter()
-api_router.include_router(auth_router, prefix="/auth", tags=["auth"])
-api_router.include_router(subscription_router, prefix="/subscriptions", tags=["subscriptions"])
-api_router.include_router(chat_router, prefix="/chats", tags=["chats"])
-api_router.include_router(images_router, prefix="/images", tags=["images"])
-api_router.include_router(user_router, prefix="/users", tags=["users"])
+api_router.include_router(auth_router, prefix="/auth", tags=["auth"], dependencies=auth_limits)
+api_router.include_router(subscription_router, prefix="/subscriptions", tags=["subscriptions"], dependencies=api_limits)
+api_router.include_router(chat_router, prefix="/chats", tags=["chats"], dependencies=api_limits)
+api_router.include_router(images_router, prefix="/images", tags=["images"], dependencies=api_limits)
+api_router.include_router(user_router, prefix="/users", tags=["users"], dependencies=api_limits)
+# Вызовы внешних сервисов проверяются секретом и не ограничиваются лимитами пользователей
+api_router.include_router(webhooks_router, prefix="/webhooks", tags=["webhooks"])
 
 
 
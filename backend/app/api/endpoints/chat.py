@@ -1,13 +1,27 @@
 from app.models.chat import Chat, ChatFolder, ChatMessage
 from app.services.limits import limits_service
 from app.services.anthropic import anthropic_service
-from typing import List, Dict, Any
-from fastapi import APIRouter, Depends, HTTPException
+from app.services.chat_titles import chat_title_service
+from app.services.context import context_builder
+from app.services.summaries import chat_summary_service
+from app.services.idempotency import idempotency_service
+from app.services.usage import usage_recorder
+from app.services.pricing import cost_usd
+from app.services.jobs import job_runner
+from app.services.entitlements import get_entitlements, Entitlements
+import asyncio
+import json
+import logging
+from typing import List, Dict, Any, Tuple, AsyncIterator, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from uuid import UUID
 
 from app.core.database import get_db
 from app.core.auth import get_current_user
+from app.core.config import settings
+from app.core.rate_limit import RateLimiter
 from app.crud.chats import chat
 from app.schemas.chat import (
     ChatFolderCreate,
@@ -17,12 +31,18 @@ from app.schemas.chat import (
     ChatUpdate,
     ChatInDB,
     ChatMessageCreate,
-    ChatMessageInDB
+    ChatMessageInDB,
+    ChatMessagePage
 )
 from app.models.user import User
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+# Каждое сообщение - запрос к Claude, поэтому лимит строже общего
+message_rate_limit = RateLimiter("chat-messages", times=settings.RATE_LIMIT_CHAT_MESSAGES_PER_USER, per="user")
+
 # Папки чатов
 @router.post("/folders/", response_model=ChatFolderInDB)
 async def create_chat_folder(
@@ -153,79 +173,160 @@ async def get_chat_limits(
 
 
 # Сообщения
-@router.post("/{chat_id}/messages/", response_model=ChatMessageInDB)
-async def create_message(
-    *,
-    db: Session = Depends(get_db),
+async def _prepare_turn(
+    db: Session,
     chat_id: UUID,
-    message_in: ChatMessageCreate,
-    current_user: User = Depends(get_current_user)
-):
+    content: str,
+    current_user: User,
+    entitlements: Entitlements,
+    endpoint: str
+) -> Tuple[Chat, List[Dict[str, str]], List[str], Optional[asyncio.Task]]:
     """
-    Добавить сообщение в чат и получить ответ от Claude.
+    Общая подготовка хода диалога: проверка лимитов и прав, сохранение
+    сообщения пользователя, запуск генерации названия и сбор контекста для Claude.
     """
-    # Проверяем лимиты перед отправкой сообщения
-    limits = await limits_service.check_chat_limits(db, str(current_user.id))
-    
+    # Ход диалога коммитит несколько раз, а чат и пользователь в нем не меняются:
+    # не перечитываем их из БД после каждого commit
+    db.expire_on_commit = False
     chat_obj = chat.get_chat(db=db, chat_id=chat_id)
     if not chat_obj:
         raise HTTPException(status_code=404, detail="Chat not found")
     if chat_obj.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    # Сохраняем сообщение пользователя
-    user_message = chat.add_message(
+    # Проверяем и списываем дневной лимит одной атомарной операцией
+    try:
+        await limits_service.consume_chat_message(db, str(current_user.id))
+    except ValueError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+    # Сохраняем сообщение пользователя; в том же запросе узнаем, первое ли оно
+    user_message, is_first = chat.add_user_message(
         db=db,
         chat_id=chat_id,
-        role="user",
-        content=message_in.content
+        content=content
     )
 
-    # Проверяем, первое ли это сообщение
-    messages_count = db.query(ChatMessage).filter(
-        ChatMessage.chat_id == chat_id
-    ).count()
-
-    if messages_count == 1:  # Только что добавленное сообщение - первое
-        try:
-            await chat.update_chat_title_from_content(
-                db=db,
-                chat_id=chat_id,
-                content=message_in.content
-            )
-        except Exception as e:
-            print(f"Error updating chat title: {str(e)}")
-            # Продолжаем выполнение даже если не удалось обновить название
+    # Название чата генерируется в фоне и не задерживает ответ Claude
+    title_task = None
+    if is_first:
+        title_task = chat_title_service.schedule(chat_id, content, current_user.id)
 
     # Обновляем статистику использования
-    await limits_service.update_usage(db, str(current_user.id), 'chat')
+    await limits_service.update_usage(db, str(current_user.id), 'chat', endpoint=endpoint)
+
+    # Получаем историю сообщений в пределах бюджета токенов
+    messages = []
+    summary = None
+    if chat_obj.is_memory_enabled:
+        budget = context_builder.token_budget(entitlements.model, entitlements.plan_name)
+        messages, summary = context_builder.build(db, chat_id, budget)
+    else:
+        messages = [{"role": "user", "content": content}]
+
+    # Получаем системный промпт в зависимости от стиля бота
+    # Стиль и пересказ - отдельные блоки, чтобы стабильный префикс попадал в кэш промпта
+    system_prompt = [anthropic_service.get_system_prompt_by_style(chat_obj.bot_style)]
+    if summary:
+        system_prompt.append(f"Краткое содержание предыдущей части разговора:\n{summary}")
+
+    return chat_obj, messages, system_prompt, title_task
+
+
+def _sse_event(event: str, data: str) -> str:
+    """
+    Сформировать одно событие в формате text/event-stream.
+    """
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+@router.post(
+    "/{chat_id}/messages/",
+    response_model=ChatMessageInDB,
+    dependencies=[Depends(message_rate_limit)]
+)
+async def create_message(
+    *,
+    db: Session = Depends(get_db),
+    chat_id: UUID,
+    message_in: ChatMessageCreate,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    current_user: User = Depends(get_current_user),
+    entitlements: Entitlements = Depends(get_entitlements)
+):
+    """
+    Добавить сообщение в чат и получить ответ от Claude.
+    Повтор запроса с тем же заголовком Idempotency-Key не вызывает Claude повторно,
+    а возвращает ответ исходного запроса.
+    """
+    async def run() -> ChatMessageInDB:
+        # С ключом ошибка Claude должна быть ошибкой ответа, иначе ее сохранят и повтор ее же и получит
+        message = await _send_message(
+            db, chat_id, message_in.content, current_user, entitlements,
+            raise_on_error=bool(idempotency_key)
+        )
+        return ChatMessageInDB.model_validate(message)
+
+    result, replayed = await idempotency_service.run(
+        key=idempotency_key,
+        scope=f"{current_user.id}:chat-message:{chat_id}",
+        payload=message_in,
+        func=run
+    )
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+async def _send_message(
+    db: Session,
+    chat_id: UUID,
+    content: str,
+    current_user: User,
+    entitlements: Entitlements,
+    raise_on_error: bool = False
+) -> ChatMessage:
+    """
+    Один ход диалога без потоковой передачи: возвращает сохраненный ответ Claude.
+    При ошибке Claude в чат сохраняется сообщение об ошибке; с raise_on_error
+    вместо его возврата поднимается HTTPException 502.
+    """
+    chat_obj, messages, system_prompt, _ = await _prepare_turn(
+        db, chat_id, content, current_user, entitlements, endpoint="/chats/{chat_id}/messages/"
+    )
 
     try:
-        # Получаем историю сообщений
-        messages = []
-        if chat_obj.is_memory_enabled:
-            previous_messages = chat.get_chat_messages(db=db, chat_id=chat_id)
-            messages = [{"role": msg.role, "content": msg.content} 
-                       for msg in reversed(previous_messages)]
-        else:
-            messages = [{"role": "user", "content": message_in.content}]
-
-        # Получаем системный промпт в зависимости от стиля бота
-        system_prompt = anthropic_service.get_system_prompt_by_style(chat_obj.bot_style)
-        
         # Отправляем запрос к Claude
         response = await anthropic_service.send_message(
             messages=messages,
-            system=system_prompt
+            system=system_prompt,
+            model=entitlements.model,
+            cache_history=chat_obj.is_memory_enabled
         )
         
+        # Учитываем токены и стоимость вызова
+        cost = await usage_recorder.record_llm_call(
+            str(current_user.id),
+            "chat",
+            response["model"],
+            response["usage"],
+            endpoint="/chats/{chat_id}/messages/"
+        )
+
         # Сохраняем ответ от Claude
         assistant_message = chat.add_message(
             db=db,
             chat_id=chat_id,
             role="assistant",
-            content=response["content"][0]["text"]
+            content=response["content"][0]["text"],
+            model=response["model"],
+            usage=response["usage"],
+            cost_usd=cost
         )
+
+        # Обновляем пересказ длинного чата в фоне
+        if chat_obj.is_memory_enabled:
+            chat_summary_service.schedule(chat_id, current_user.id)
         
         return assistant_message
 
@@ -238,19 +339,165 @@ async def create_message(
             role="assistant",
             content=f"Извините, произошла ошибка при обработке сообщения. Пожалуйста, попробуйте позже."
         )
+        if raise_on_error:
+            raise HTTPException(
+                status_code=502,
+                detail="Failed to get a response from Claude, retry the request"
+            )
         return error_message
 
-@router.get("/{chat_id}/messages/", response_model=List[ChatMessageInDB])
+@router.post("/{chat_id}/messages/stream/", dependencies=[Depends(message_rate_limit)])
+async def create_message_stream(
+    *,
+    db: Session = Depends(get_db),
+    chat_id: UUID,
+    message_in: ChatMessageCreate,
+    current_user: User = Depends(get_current_user),
+    entitlements: Entitlements = Depends(get_entitlements)
+):
+    """
+    Добавить сообщение в чат и получить ответ от Claude потоком (SSE).
+
+    События: `delta` — очередной фрагмент текста, `title` — название и эмодзи
+    нового чата, если оно успело сгенерироваться, `done` — сохраненное
+    сообщение ассистента, `error` — сохраненное сообщение об ошибке.
+    Если клиент отключился до конца ответа, сохраняется полученная часть.
+    """
+    chat_obj, messages, system_prompt, title_task = await _prepare_turn(
+        db, chat_id, message_in.content, current_user, entitlements,
+        endpoint="/chats/{chat_id}/messages/stream/"
+    )
+
+    def title_event() -> Optional[str]:
+        nonlocal title_task
+        if title_task is None or not title_task.done():
+            return None
+        result = title_task.result() if not title_task.cancelled() else None
+        title_task = None
+        if not result:
+            return None
+        title, emoji = result
+        return _sse_event("title", json.dumps({"title": title, "emoji": emoji}, ensure_ascii=False))
+
+    async def event_stream() -> AsyncIterator[str]:
+        parts: List[str] = []
+        usage: Dict[str, int] = {}
+        saved = False
+        try:
+            try:
+                async for text in anthropic_service.stream_message(
+                    messages=messages,
+                    system=system_prompt,
+                    model=entitlements.model,
+                    cache_history=chat_obj.is_memory_enabled,
+                    usage=usage
+                ):
+                    parts.append(text)
+                    yield _sse_event("delta", json.dumps({"text": text}, ensure_ascii=False))
+                    event = title_event()
+                    if event:
+                        yield event
+            except Exception as e:
+                logger.error(f"Error in create_message_stream: {str(e)}", exc_info=True)
+                error_message = chat.add_message(
+                    db=db,
+                    chat_id=chat_id,
+                    role="assistant",
+                    content="Извините, произошла ошибка при обработке сообщения. Пожалуйста, попробуйте позже."
+                )
+                saved = True
+                yield _sse_event("error", ChatMessageInDB.model_validate(error_message).model_dump_json())
+                return
+
+            model = entitlements.model
+            cost = await usage_recorder.record_llm_call(
+                str(current_user.id),
+                "chat",
+                model,
+                usage,
+                endpoint="/chats/{chat_id}/messages/stream/"
+            )
+            assistant_message = chat.add_message(
+                db=db,
+                chat_id=chat_id,
+                role="assistant",
+                content="".join(parts),
+                model=model,
+                usage=usage,
+                cost_usd=cost
+            )
+            saved = True
+            if chat_obj.is_memory_enabled:
+                chat_summary_service.schedule(chat_id, current_user.id)
+            event = title_event()
+            if event:
+                yield event
+            yield _sse_event("done", ChatMessageInDB.model_validate(assistant_message).model_dump_json())
+        finally:
+            # Клиент отключился посреди ответа - учитываем вызов и сохраняем то, что успели получить
+            if not saved:
+                _save_interrupted_reply(db, chat_id, current_user, entitlements.model, "".join(parts), usage)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+def _save_interrupted_reply(
+    db: Session,
+    chat_id: UUID,
+    current_user: User,
+    model: str,
+    content: str,
+    usage: Dict[str, int]
+) -> None:
+    """
+    Учесть оборванный потоковый ответ: вызов Claude оплачивается и без последнего события.
+    Выполняется в finally отменяемого генератора, поэтому без await:
+    событие использования пишется отдельной фоновой задачей.
+    """
+    if not usage and not content:
+        # Поток оборвался до начала ответа
+        return
+    # Выходные токены приходят только в конце потока - оцениваем по полученному тексту
+    usage["output_tokens"] = max(usage.get("output_tokens", 0), context_builder.estimate_tokens(content))
+    job_runner.submit(
+        usage_recorder.record_llm_call(
+            str(current_user.id),
+            "chat",
+            model,
+            usage,
+            endpoint="/chats/{chat_id}/messages/stream/"
+        ),
+        name=f"usage-interrupted-{chat_id}"
+    )
+    if content:
+        chat.add_message(
+            db=db,
+            chat_id=chat_id,
+            role="assistant",
+            content=content,
+            model=model,
+            usage=usage,
+            cost_usd=cost_usd(model, usage)
+        )
+
+@router.get("/{chat_id}/messages/", response_model=ChatMessagePage)
 async def get_messages(
     *,
     db: Session = Depends(get_db),
     chat_id: UUID,
-    limit: int = 50,
-    before_id: UUID = None,
+    limit: int = Query(50, gt=0, le=100),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user)
 ):
     """
-    Получить сообщения чата с пагинацией.
+    Получить сообщения чата с пагинацией по курсору (от новых к старым).
+    Для следующей страницы передайте next_cursor из предыдущего ответа.
     """
     chat_obj = chat.get_chat(db=db, chat_id=chat_id)
     if not chat_obj:
@@ -258,10 +505,18 @@ async def get_messages(
     if chat_obj.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    return chat.get_chat_messages(
-        db=db, 
-        chat_id=chat_id,
-        limit=limit,
-        before_id=before_id
-    )
+    try:
+        items, next_cursor = chat.get_chat_messages(
+            db=db, 
+            chat_id=chat_id,
+            limit=limit,
+            cursor=cursor
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
+    return {
+        "items": items,
+        "has_more": next_cursor is not None,
+        "next_cursor": next_cursor
+    }
@@ -3,7 +3,7 @@ from sqlalchemy.orm import Session
 from typing import List
 
 from app.core.database import get_db
-from app.crud.subscription import subscription
+from app.crud.subscriptions import subscription
 from app.schemas.subscription import (
     SubscriptionPlanCreate,
     SubscriptionPlanUpdate,
@@ -13,6 +13,7 @@ from app.schemas.subscription import (
 )
 from app.models.user import User
 from app.core.auth import get_current_user, get_current_active_user, get_current_admin_user
+from app.services.entitlements import entitlements_service, get_entitlements, Entitlements
 
 router = APIRouter()
 
@@ -63,11 +64,13 @@ async def create_subscription(
             detail="Subscription plan not found or inactive"
         )
     
-    return subscription.create_subscription(
+    db_obj = subscription.create_subscription(
         db=db,
         user_id=current_user.id,
         **subscription_in.dict()
     )
+    entitlements_service.invalidate(current_user.id)
+    return db_obj
 
 @router.get("/my-subscription/", response_model=UserSubscriptionInDB)
 async def get_my_subscription(
@@ -100,14 +103,27 @@ async def cancel_my_subscription(
             detail="No active subscription found"
         )
     
-    return subscription.cancel_subscription(db=db, subscription_id=active_sub.id)
+    db_obj = subscription.cancel_subscription(db=db, subscription_id=active_sub.id)
+    entitlements_service.invalidate(current_user.id)
+    return db_obj
 
 @router.get("/my-limits/", response_model=dict)
 async def get_my_limits(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    entitlements: Entitlements = Depends(get_entitlements)
 ):
     """
-    Get current user's subscription limits.
+    Get current user's subscription limits and remaining usage.
     """
-    return subscription.check_limits(db=db, user_id=current_user.id)
+    return {
+        "has_active_subscription": entitlements.plan is not None,
+        "plan_name": entitlements.plan_name,
+        "period_end": entitlements.period_end,
+        "chat_requests_daily": entitlements.chat_daily_limit,
+        "chat_requests_remaining": entitlements.chat_remaining,
+        "image_generations_monthly": entitlements.image_monthly_limit,
+        "image_generations_remaining": entitlements.images_remaining,
+        "tool_cards_monthly": entitlements.tool_cards_monthly_limit,
+        "tool_cards_remaining": entitlements.tool_cards_remaining,
+        "allowed_models": list(entitlements.allowed_models),
+        "model": entitlements.model
+    }
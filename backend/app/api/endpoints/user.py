@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from app.core.database import get_db
-from app.core.auth import get_current_user
+from app.core.auth import get_current_user, get_current_admin_user
+from app.crud.usage import usage
 from app.models.user import User
 from app.schemas.user_settings import UserSettings, UserSettingsUpdate
+from app.services.entitlements import entitlements_service
 
 router = APIRouter()
 
@@ -51,5 +55,61 @@ async def update_user_settings(
     if settings.default_bot_style:
         current_user.default_bot_style = settings.default_bot_style
         db.commit()
+        entitlements_service.invalidate(current_user.id)
     
     return await get_user_settings(current_user)
+
+@router.get("/usage/", response_model=Dict[str, Any])
+async def get_my_usage(
+    days: int = Query(30, gt=0, le=366),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Статистика использования текущего пользователя по дням (из дневных агрегатов)
+    """
+    end = datetime.now(timezone.utc).date()
+    start = end - timedelta(days=days - 1)
+    return {
+        "start": start,
+        "end": end,
+        "totals": usage.get_user_totals(db, current_user.id, start, end),
+        "daily": [
+            {
+                "day": row.day,
+                "usage_type": row.usage_type,
+                "model": row.model,
+                "events": row.events,
+                "tokens": row.tokens,
+                "cost_usd": row.cost_usd
+            }
+            for row in usage.get_user_daily(db, current_user.id, start, end)
+        ],
+        "models": usage.get_llm_costs(db, start, end, user_id=current_user.id)
+    }
+
+@router.get("/usage/summary/", response_model=List[Dict[str, Any]])
+async def get_usage_summary(
+    days: int = Query(30, gt=0, le=366),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Сводка использования по всем пользователям по дням (только для администраторов)
+    """
+    end = datetime.now(timezone.utc).date()
+    start = end - timedelta(days=days - 1)
+    return usage.get_daily_totals(db, start, end)
+
+@router.get("/usage/models/", response_model=List[Dict[str, Any]])
+async def get_model_costs(
+    days: int = Query(30, gt=0, le=366),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """
+    Вызовы моделей и их стоимость по всем пользователям (только для администраторов)
+    """
+    end = datetime.now(timezone.utc).date()
+    start = end - timedelta(days=days - 1)
+    return usage.get_llm_costs(db, start, end)
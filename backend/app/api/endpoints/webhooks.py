@@ -0,0 +1,32 @@
+import hmac
+import logging
+from typing import Any, Dict, Optional
+from uuid import UUID
+from fastapi import APIRouter, HTTPException, Query
+from app.core.config import settings
+from app.services.image_jobs import image_job_service
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.post("/bfl")
+async def bfl_webhook(
+    payload: Dict[str, Any],
+    token: str = Query(...),
+    image_id: Optional[UUID] = Query(None)
+):
+    """
+    Уведомление BFL о завершении задачи генерации.
+    Секрет передается в URL, который мы сами отдаем BFL при отправке задачи.
+    """
+    if not settings.BFL_WEBHOOK_SECRET:
+        raise HTTPException(404, "Not found")
+    if not hmac.compare_digest(token, settings.BFL_WEBHOOK_SECRET):
+        raise HTTPException(403, "Invalid webhook token")
+
+    if not await image_job_service.complete_from_webhook(payload, image_id):
+        # Неизвестная или уже обработанная задача - отвечаем 200, чтобы BFL не повторял доставку
+        logger.info(f"BFL webhook ignored for task {payload.get('id') or payload.get('task_id')}")
+        return {"status": "ignored"}
+    return {"status": "ok"}
@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, List, Optional
 
 class Settings(BaseSettings):
     # App settings
@@ -24,6 +24,127 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str
     BFL_API_KEY: str
 
+    # Anthropic HTTP client settings
+    ANTHROPIC_TIMEOUT: float = 120.0
+    ANTHROPIC_CONNECT_TIMEOUT: float = 10.0
+    ANTHROPIC_MAX_CONNECTIONS: int = 100
+    ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    ANTHROPIC_KEEPALIVE_EXPIRY: float = 30.0
+
+    # Redis (необязателен; нужен для общих кэшей и лимитов между воркерами)
+    REDIS_URL: Optional[str] = None
+
+    # Conversation cache settings
+    CONVERSATION_CACHE_CHATS: int = 1000
+    CONVERSATION_CACHE_WINDOW: int = 50
+    CONVERSATION_CACHE_TTL: int = 3600
+
+    # Quota settings
+    QUOTA_RECONCILE_INTERVAL: int = 300
+
+    # Idempotency-Key settings
+    IDEMPOTENCY_TTL: int = 600
+    IDEMPOTENCY_CACHE_SIZE: int = 10000
+    IDEMPOTENCY_LOCK_TIMEOUT: int = 180
+
+    # Rate limit settings (запросов в минуту)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_AUTH_PER_IP: int = 20
+    RATE_LIMIT_API_PER_USER: int = 120
+    RATE_LIMIT_API_PER_IP: int = 300
+    RATE_LIMIT_CHAT_MESSAGES_PER_USER: int = 20
+    RATE_LIMIT_IMAGE_GENERATIONS_PER_USER: int = 5
+
+    # BFL client settings
+    BFL_MAX_CONNECTIONS: int = 100
+    BFL_MAX_CONNECTIONS_PER_HOST: int = 50
+    BFL_DNS_CACHE_TTL: int = 300
+    BFL_KEEPALIVE_TIMEOUT: float = 30.0
+    BFL_CONNECT_TIMEOUT: float = 10.0
+    BFL_REQUEST_TIMEOUT: float = 60.0
+
+    # BFL result polling: first check after the typical generation time, then backoff with jitter.
+    # A share of generations is polled from the start to measure the typical time
+    BFL_POLL_INITIAL_DELAY: float = 8.0
+    BFL_POLL_MAX_INITIAL_DELAY: float = 30.0
+    BFL_POLL_PROBE_RATE: float = 0.1
+    BFL_POLL_PERCENTILE: float = 50.0
+    BFL_POLL_STATS_WINDOW: int = 200
+    BFL_POLL_STATS_MIN_SAMPLES: int = 10
+    BFL_POLL_MIN_INTERVAL: float = 1.0
+    BFL_POLL_MAX_INTERVAL: float = 5.0
+    BFL_POLL_BACKOFF: float = 1.5
+
+    # BFL webhook: public URL of /webhooks/bfl and a shared secret; polling is used when unset
+    BFL_WEBHOOK_URL: Optional[str] = None
+    BFL_WEBHOOK_SECRET: Optional[str] = None
+
+    # Image storage settings
+    STORAGE_BACKEND: str = "local"
+    MEDIA_ROOT: str = "media"
+    MEDIA_URL: str = "/media"
+    STORAGE_MIGRATION_BATCH: int = 20
+    IMAGE_DERIVATIVE_WORKERS: int = 2
+    IMAGE_DERIVATIVE_QUALITY: int = 80
+    # Unreferenced files are removed by a periodic sweep once older than the grace period,
+    # which must stay well above IMAGE_JOB_TIMEOUT (a job stores files before saving the row)
+    STORAGE_GC_INTERVAL: int = 3600
+    STORAGE_GC_GRACE: int = 86400
+    STORAGE_GC_BATCH: int = 500
+
+    # Prompt translation cache (in-memory LRU in front of prompt_translations)
+    TRANSLATION_CACHE_SIZE: int = 5000
+
+    # Image generation job settings
+    IMAGE_JOB_CONCURRENCY: int = 8
+    IMAGE_JOB_TIMEOUT: int = 180
+    IMAGE_JOB_SWEEP_INTERVAL: int = 60
+    IMAGE_EVENTS_POLL_INTERVAL: float = 2.0
+
+    # Subscription expiry sweeper settings
+    SUBSCRIPTION_SWEEP_INTERVAL: int = 60
+    SUBSCRIPTION_SWEEP_BATCH: int = 500
+
+    # Plan catalog settings
+    PLAN_CATALOG_TTL: int = 600
+    PLAN_CATALOG_VERSION_CHECK_INTERVAL: float = 5.0
+
+    # Entitlements snapshot settings
+    ENTITLEMENTS_TTL: int = 30
+    ENTITLEMENTS_CACHE_SIZE: int = 10000
+
+    # Claude models by plan name: "free" - without a subscription, "default" - plans not listed
+    PLAN_MODELS: Dict[str, List[str]] = {
+        "free": ["claude-3-haiku-20240307"],
+        "default": [
+            "claude-3-haiku-20240307",
+            "claude-3-5-haiku-20241022",
+            "claude-3-5-sonnet-20241022"
+        ]
+    }
+
+    # Usage rollup settings
+    ROLLUP_INTERVAL: int = 300
+    ROLLUP_BATCH_SIZE: int = 20000
+    ROLLUP_MAX_BATCHES: int = 50
+    ROLLUP_LAG: int = 120
+
+    # Usage events settings
+    USAGE_BUFFER_SIZE: int = 10000
+    USAGE_FLUSH_BATCH: int = 500
+    USAGE_FLUSH_INTERVAL: float = 5.0
+    USAGE_ENQUEUE_TIMEOUT: float = 0.05
+
+    # Chat context settings (в токенах истории на один запрос)
+    CONTEXT_TOKEN_BUDGET_FREE: int = 2000
+    CONTEXT_TOKEN_BUDGET_PAID: int = 8000
+
+    # Rolling summary settings
+    SUMMARY_TRIGGER_MESSAGES: int = 30
+    SUMMARY_KEEP_RECENT: int = 10
+    SUMMARY_MODEL: str = "claude-3-haiku-20240307"
+    SUMMARY_MAX_TOKENS: int = 1024
+
     class Config:
         env_file = ".env"
         
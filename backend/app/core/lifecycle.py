@@ -0,0 +1,70 @@
+import asyncio
+import logging
+from app.services.anthropic import anthropic_service
+from app.services.openai_service import openai_service
+from app.services.bfl import bfl_client
+from app.services.jobs import job_runner
+from app.core.redis import close_redis
+from app.core.config import settings
+from app.services.quota import quota_engine
+from app.services.usage import usage_recorder
+from app.services.plans import plan_catalog
+from app.services.rollups import usage_rollup_service
+from app.services.subscription_sweeper import subscription_sweeper
+from app.services.image_jobs import image_job_service
+from app.services.derivatives import derivative_service
+from app.services.blob_gc import blob_garbage_collector
+
+logger = logging.getLogger(__name__)
+
+
+async def on_startup() -> None:
+    """
+    Инициализация общих ресурсов приложения.
+    """
+    await usage_recorder.start()
+    await bfl_client.start()
+    try:
+        await asyncio.to_thread(plan_catalog.load)
+    except Exception as e:
+        # Каталог загрузится при первом обращении
+        logger.warning(f"Failed to preload plan catalog: {str(e)}")
+    job_runner.start_periodic(
+        lambda: quota_engine.reconcile(lock_ttl=settings.QUOTA_RECONCILE_INTERVAL),
+        interval=settings.QUOTA_RECONCILE_INTERVAL,
+        name="quota-reconcile"
+    )
+    job_runner.start_periodic(
+        usage_rollup_service.run,
+        interval=settings.ROLLUP_INTERVAL,
+        name="usage-rollup"
+    )
+    job_runner.start_periodic(
+        subscription_sweeper.sweep,
+        interval=settings.SUBSCRIPTION_SWEEP_INTERVAL,
+        name="subscription-sweep"
+    )
+    job_runner.start_periodic(
+        image_job_service.fail_stale,
+        interval=settings.IMAGE_JOB_SWEEP_INTERVAL,
+        name="image-job-sweep"
+    )
+    job_runner.start_periodic(
+        blob_garbage_collector.sweep,
+        interval=settings.STORAGE_GC_INTERVAL,
+        name="storage-gc"
+    )
+
+
+async def on_shutdown() -> None:
+    """
+    Освобождение общих ресурсов приложения (пулы соединений и т.п.).
+    """
+    await job_runner.shutdown()
+    # Фоновые задачи могли записать события - сбрасываем буфер после них
+    await usage_recorder.stop()
+    await anthropic_service.close()
+    await openai_service.close()
+    await bfl_client.close()
+    derivative_service.shutdown()
+    await close_redis()
@@ -0,0 +1,136 @@
+import logging
+import math
+import threading
+import time
+from typing import Optional, Tuple
+from fastapi import HTTPException, Request, status
+from jose import JWTError, jwt
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.redis import get_async_redis
+from app.core.security import ALGORITHM
+
+logger = logging.getLogger(__name__)
+
+# (разрешен ли запрос, через сколько секунд появится следующий токен)
+Decision = Tuple[bool, float]
+
+class InMemoryTokenBucketBackend:
+    """
+    Корзины токенов в памяти процесса - для одного воркера.
+    Давно не использовавшиеся корзины вытесняются (полная корзина и отсутствующая равнозначны).
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self._buckets: LRUCache[Tuple[float, float]] = LRUCache(maxsize=max_keys)
+        self._lock = threading.Lock()
+
+    async def take(self, key: str, capacity: int, rate: float) -> Decision:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key) or (float(capacity), now)
+            tokens = min(float(capacity), tokens + (now - updated_at) * rate)
+            if tokens >= 1:
+                self._buckets.set(key, (tokens - 1, now), ttl=capacity / rate)
+                return True, 0.0
+            self._buckets.set(key, (tokens, now), ttl=capacity / rate)
+            return False, (1 - tokens) / rate
+
+class RedisTokenBucketBackend:
+    """
+    Корзины токенов в Redis, общие для всех воркеров.
+    Пополнение и списание - один Lua-скрипт по часам Redis, поэтому расхождение часов воркеров не влияет.
+    """
+
+    TAKE_SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate / 1000)
+    local allowed = 0
+    local retry_ms = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+        allowed = 1
+    else
+        retry_ms = math.ceil((1 - tokens) * 1000 / rate)
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+    redis.call('PEXPIRE', KEYS[1], math.ceil(capacity * 1000 / rate) + 1000)
+    return {allowed, retry_ms}
+    """
+
+    def __init__(self, client):
+        self._take = client.register_script(self.TAKE_SCRIPT)
+
+    async def take(self, key: str, capacity: int, rate: float) -> Decision:
+        allowed, retry_ms = await self._take(keys=[key], args=[capacity, rate])
+        return bool(int(allowed)), int(retry_ms) / 1000
+
+_backend = None
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        client = get_async_redis()
+        _backend = RedisTokenBucketBackend(client) if client is not None else InMemoryTokenBucketBackend()
+    return _backend
+
+class RateLimiter:
+    """
+    Зависимость FastAPI: ограничение частоты запросов по алгоритму token bucket.
+    per="user" - по пользователю из Bearer-токена (без токена - по IP), per="ip" - по адресу клиента.
+    Допускается всплеск до times запросов, дальше - не чаще times за seconds.
+    При превышении - 429 с заголовком Retry-After.
+    """
+
+    def __init__(self, name: str, *, times: int, seconds: int = 60, per: str = "user"):
+        if per not in ("user", "ip"):
+            raise ValueError(f"Unknown rate limit identity: {per}")
+        self.name = name
+        self.capacity = times
+        self.rate = times / seconds
+        self.per = per
+
+    @staticmethod
+    def _client_ip(request: Request) -> str:
+        return request.client.host if request.client else "unknown"
+
+    @staticmethod
+    def _user_id(request: Request) -> Optional[str]:
+        # Подпись проверяем, но пользователя из БД не читаем - это сделает сама ручка
+        scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return None
+        try:
+            return jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+        except JWTError:
+            return None
+
+    def identity(self, request: Request) -> str:
+        if self.per == "user":
+            user_id = self._user_id(request)
+            if user_id:
+                return f"user:{user_id}"
+        return f"ip:{self._client_ip(request)}"
+
+    async def __call__(self, request: Request) -> None:
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        key = f"ratelimit:{self.name}:{self.identity(request)}"
+        try:
+            allowed, retry_after = await get_backend().take(key, self.capacity, self.rate)
+        except Exception as e:
+            # Сбой хранилища лимитов не должен ронять API
+            logger.warning(f"Rate limit check failed for {key}: {str(e)}")
+            return
+        if not allowed:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
@@ -0,0 +1,45 @@
+import logging
+from typing import Any, Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[Any] = None
+_async_client: Optional[Any] = None
+
+def get_redis() -> Optional[Any]:
+    """
+    Синхронный клиент Redis или None, если REDIS_URL не задан
+    (однопроцессный режим без общего хранилища).
+    """
+    global _client
+    if not settings.REDIS_URL:
+        return None
+    if _client is None:
+        import redis
+        _client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _client
+
+def get_async_redis() -> Optional[Any]:
+    """
+    Асинхронный клиент Redis или None, если REDIS_URL не задан.
+    """
+    global _async_client
+    if not settings.REDIS_URL:
+        return None
+    if _async_client is None:
+        import redis.asyncio as redis
+        _async_client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _async_client
+
+async def close_redis() -> None:
+    """
+    Закрыть соединения с Redis (вызывается при остановке приложения).
+    """
+    global _client, _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+    if _client is not None:
+        _client.close()
+        _client = None
@@ -1,10 +1,15 @@
-from typing import List, Optional
+import base64
+from decimal import Decimal
+from typing import Dict, Iterator, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
-from uuid import UUID
-from datetime import datetime
+from sqlalchemy import desc, insert, select, tuple_, update
+from sqlalchemy.engine import Row
+from uuid import UUID, uuid4
+from datetime import datetime, timezone
 from app.services.openai_service import openai_service
-from app.models.chat import Chat, ChatFolder, ChatMessage
+from app.services.conversation_cache import conversation_cache
+from app.services.pricing import total_tokens
+from app.models.chat import Chat, ChatFolder, ChatMessage, ChatSummary
 
 class CRUDChat:
     @staticmethod
@@ -65,25 +70,28 @@ class CRUDChat:
         db: Session,
         *,
         chat_id: UUID,
-        content: str
-    ) -> Chat:
+        content: str,
+        usage: Optional[Dict[str, int]] = None
+    ) -> Tuple[str, str]:
         """
-        Обновляет название и эмодзи чата на основе содержимого сообщения
+        Обновляет название и эмодзи чата на основе содержимого сообщения.
+        Запись - один UPDATE ... RETURNING без повторного чтения чата.
+        В словарь usage записываются счетчики токенов запроса к модели.
         """
-        chat_obj = db.query(Chat).filter(Chat.id == chat_id).first()
-        if not chat_obj:
-            raise ValueError("Chat not found")
-
         # Генерируем название и эмодзи
-        title, emoji = await openai_service.generate_chat_title(content)
-        
-        chat_obj.title = title
-        chat_obj.emoji = emoji
-        db.add(chat_obj)
+        title, emoji = await openai_service.generate_chat_title(content, usage=usage)
+
+        row = db.execute(
+            update(Chat)
+            .where(Chat.id == chat_id)
+            .values(title=title, emoji=emoji)
+            .returning(Chat.title, Chat.emoji)
+        ).first()
         db.commit()
-        db.refresh(chat_obj)
-        
-        return chat_obj
+        if row is None:
+            raise ValueError("Chat not found")
+
+        return row.title, row.emoji
 
     @staticmethod
     def add_message(
@@ -92,19 +100,98 @@ class CRUDChat:
         chat_id: UUID,
         role: str,
         content: str,
-        tokens_used: Optional[int] = None
+        tokens_used: Optional[int] = None,
+        model: Optional[str] = None,
+        usage: Optional[Dict[str, int]] = None,
+        cost_usd: Optional[Decimal] = None
     ) -> ChatMessage:
-        db_obj = ChatMessage(
+        """
+        Сохраняет сообщение одним INSERT ... RETURNING и фиксирует транзакцию.
+        Возвращает объект, не привязанный к сессии, - повторное чтение строки не нужно.
+        Для ответа ассистента usage - счетчики токенов вызова модели (формат AnthropicService).
+        """
+        db_obj, _ = CRUDChat._insert_message(
+            db,
             chat_id=chat_id,
             role=role,
             content=content,
-            tokens_used=tokens_used
+            tokens_used=tokens_used,
+            model=model,
+            usage=usage,
+            cost_usd=cost_usd
         )
-        db.add(db_obj)
-        db.commit()
-        db.refresh(db_obj)
         return db_obj
 
+    @staticmethod
+    def add_user_message(
+        db: Session,
+        *,
+        chat_id: UUID,
+        content: str
+    ) -> Tuple[ChatMessage, bool]:
+        """
+        Сохраняет сообщение пользователя и в том же запросе определяет,
+        первое ли оно в чате. Возвращает (сообщение, is_first).
+        """
+        return CRUDChat._insert_message(
+            db,
+            chat_id=chat_id,
+            role="user",
+            content=content,
+            check_first=True
+        )
+
+    @staticmethod
+    def _insert_message(
+        db: Session,
+        *,
+        chat_id: UUID,
+        role: str,
+        content: str,
+        tokens_used: Optional[int] = None,
+        model: Optional[str] = None,
+        usage: Optional[Dict[str, int]] = None,
+        cost_usd: Optional[Decimal] = None,
+        check_first: bool = False
+    ) -> Tuple[ChatMessage, bool]:
+        values = {
+            "id": uuid4(),
+            "chat_id": chat_id,
+            "role": role,
+            "content": content,
+            "tokens_used": tokens_used,
+            "model": model,
+            "cost_usd": cost_usd,
+            "created_at": datetime.now(timezone.utc)
+        }
+        if usage:
+            values.update(
+                input_tokens=usage.get("input_tokens", 0),
+                output_tokens=usage.get("output_tokens", 0),
+                cache_creation_input_tokens=usage.get("cache_creation_input_tokens", 0),
+                cache_read_input_tokens=usage.get("cache_read_input_tokens", 0)
+            )
+            if tokens_used is None:
+                values["tokens_used"] = total_tokens(usage)
+        returning = [ChatMessage.created_at]
+        if check_first:
+            # Подзапрос в RETURNING видит снимок до вставки,
+            # поэтому только что добавленная строка в нем не учитывается
+            previous = ChatMessage.__table__.alias("previous")
+            returning.append(
+                ~select(previous.c.id).where(previous.c.chat_id == chat_id).exists()
+            )
+
+        row = db.execute(
+            insert(ChatMessage).values(**values).returning(*returning)
+        ).first()
+        db.commit()
+
+        values["created_at"] = row[0]
+        db_obj = ChatMessage(**values)
+        conversation_cache.append(chat_id, db_obj)
+        return db_obj, bool(row[1]) if check_first else False
+
     @staticmethod
     def get_chat(db: Session, chat_id: UUID) -> Optional[Chat]:
         return db.query(Chat).filter(Chat.id == chat_id).first()
@@ -133,23 +220,136 @@ class CRUDChat:
             query = query.filter(Chat.folder_id == folder_id)
         return query.order_by(desc(Chat.created_at)).all()
 
+    @staticmethod
+    def encode_cursor(created_at: datetime, message_id: UUID) -> str:
+        """
+        Непрозрачный курсор пагинации: позиция сообщения (created_at, id).
+        """
+        raw = f"{created_at.isoformat()}|{message_id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+        """
+        Разобрать курсор пагинации. ValueError, если курсор поврежден.
+        """
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            created_at, message_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+            return datetime.fromisoformat(created_at), UUID(message_id)
+        except Exception:
+            raise ValueError("Invalid cursor")
+
     @staticmethod
     def get_chat_messages(
         db: Session,
         chat_id: UUID,
         limit: int = 50,
-        before_id: Optional[UUID] = None
-    ) -> List[ChatMessage]:
+        cursor: Optional[str] = None
+    ) -> Tuple[List[ChatMessage], Optional[str]]:
+        """
+        Страница сообщений чата от новых к старым.
+        Keyset-пагинация по (created_at, id): один проход по индексу
+        (chat_id, created_at DESC, id DESC) независимо от глубины.
+        Возвращает (сообщения, курсор следующей страницы или None).
+        """
         query = db.query(ChatMessage).filter(
             ChatMessage.chat_id == chat_id
         )
-        if before_id:
-            before_message = db.query(ChatMessage).get(before_id)
-            if before_message:
+        if cursor:
+            query = query.filter(
+                tuple_(ChatMessage.created_at, ChatMessage.id) < CRUDChat.decode_cursor(cursor)
+            )
+        rows = query.order_by(
+            desc(ChatMessage.created_at), desc(ChatMessage.id)
+        ).limit(limit + 1).all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = CRUDChat.encode_cursor(rows[-1].created_at, rows[-1].id)
+        return rows, next_cursor
+
+    @staticmethod
+    def iter_recent_messages(
+        db: Session,
+        chat_id: UUID,
+        batch_size: int = 20,
+        before: Optional[Tuple[datetime, UUID]] = None
+    ) -> Iterator[Row]:
+        """
+        Отдает сообщения чата от новых к старым порциями по batch_size,
+        начиная с сообщений старше before=(created_at, id), если он задан.
+        Загружаются только нужные колонки; следующая порция запрашивается,
+        только если вызывающий код продолжает итерацию.
+        """
+        columns = (
+            ChatMessage.id,
+            ChatMessage.role,
+            ChatMessage.content,
+            ChatMessage.created_at
+        )
+        while True:
+            query = db.query(*columns).filter(ChatMessage.chat_id == chat_id)
+            if before is not None:
                 query = query.filter(
-                    ChatMessage.created_at < before_message.created_at
+                    tuple_(ChatMessage.created_at, ChatMessage.id) < before
                 )
-        return query.order_by(desc(ChatMessage.created_at)).limit(limit).all()
+            rows = query.order_by(
+                desc(ChatMessage.created_at), desc(ChatMessage.id)
+            ).limit(batch_size).all()
+            yield from rows
+            if len(rows) < batch_size:
+                return
+            before = (rows[-1].created_at, rows[-1].id)
+
+    @staticmethod
+    def get_messages_after(
+        db: Session,
+        chat_id: UUID,
+        after: Optional[Tuple[datetime, UUID]] = None,
+        limit: int = 50
+    ) -> List[Row]:
+        """
+        Сообщения чата новее after=(created_at, id) от старых к новым, только нужные колонки.
+        """
+        query = db.query(
+            ChatMessage.id,
+            ChatMessage.role,
+            ChatMessage.content,
+            ChatMessage.created_at
+        ).filter(ChatMessage.chat_id == chat_id)
+        if after is not None:
+            query = query.filter(
+                tuple_(ChatMessage.created_at, ChatMessage.id) > after
+            )
+        return query.order_by(ChatMessage.created_at, ChatMessage.id).limit(limit).all()
+
+    @staticmethod
+    def get_summary(db: Session, chat_id: UUID) -> Optional[ChatSummary]:
+        return db.query(ChatSummary).filter(ChatSummary.chat_id == chat_id).first()
+
+    @staticmethod
+    def save_summary(
+        db: Session,
+        *,
+        chat_id: UUID,
+        summary: str,
+        summarized_until: datetime,
+        last_message_id: UUID,
+        messages_added: int
+    ) -> ChatSummary:
+        db_obj = db.query(ChatSummary).filter(ChatSummary.chat_id == chat_id).first()
+        if db_obj is None:
+            db_obj = ChatSummary(chat_id=chat_id, messages_summarized=0)
+        db_obj.summary = summary
+        db_obj.summarized_until = summarized_until
+        db_obj.last_message_id = last_message_id
+        db_obj.messages_summarized = (db_obj.messages_summarized or 0) + messages_added
+        db.add(db_obj)
+        db.commit()
+        db.refresh(db_obj)
+        return db_obj
 
     @staticmethod
     def update_chat(
@@ -1,6 +1,6 @@
-from typing import List, Optional
+from typing import List, Optional, Set
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy import func, or_, select, union
 from app.models.user import User
 from app.models.user_images import UserImage
 from uuid import UUID
@@ -14,9 +14,10 @@ class CRUDImage:
         user_id: UUID,
         prompt: str,
         translated_prompt: str,
-        image_url: str,
+        image_url: Optional[str] = None,
         aspect_ratio: str = "1:1",
-        style: Optional[str] = None
+        style: Optional[str] = None,
+        status: str = "completed"
     ) -> UserImage:
         db_obj = UserImage(
             user_id=user_id,
@@ -24,7 +25,8 @@ class CRUDImage:
             translated_prompt=translated_prompt,
             image_url=image_url,
             aspect_ratio=aspect_ratio,
-            style=style
+            style=style,
+            status=status
         )
         db.add(db_obj)
         db.commit()
@@ -54,7 +56,11 @@ class CRUDImage:
         skip: int = 0,
         limit: int = 20
     ) -> List[UserImage]:
-        query = db.query(UserImage).filter(UserImage.user_id == user_id)
+        # В галерее только готовые изображения
+        query = db.query(UserImage).filter(
+            UserImage.user_id == user_id,
+            UserImage.status == "completed"
+        )
         
         if style:
             query = query.filter(UserImage.style == style)
@@ -86,7 +92,11 @@ class CRUDImage:
         end_date: Optional[datetime] = None,
         search: Optional[str] = None
     ) -> int:
-        query = db.query(UserImage).filter(UserImage.user_id == user_id)
+        # В галерее только готовые изображения
+        query = db.query(UserImage).filter(
+            UserImage.user_id == user_id,
+            UserImage.status == "completed"
+        )
         
         if style:
             query = query.filter(UserImage.style == style)
@@ -112,6 +122,39 @@ class CRUDImage:
     def get_image(db: Session, image_id: UUID) -> Optional[UserImage]:
         return db.query(UserImage).filter(UserImage.id == image_id).first()
 
+    @staticmethod
+    def get_user_image(db: Session, image_id: UUID, user_id: UUID) -> Optional[UserImage]:
+        return db.query(UserImage).filter(
+            UserImage.id == image_id,
+            UserImage.user_id == user_id
+        ).first()
+
+    @staticmethod
+    def referenced_storage_keys(db: Session, keys: List[str]) -> Set[str]:
+        """
+        Ключи из keys, на которые ссылается хотя бы одно изображение (оригинал или производные).
+        """
+        if not keys:
+            return set()
+        query = union(
+            select(UserImage.storage_key).where(UserImage.storage_key.in_(keys)),
+            select(UserImage.thumbnail_key).where(UserImage.thumbnail_key.in_(keys)),
+            select(UserImage.preview_key).where(UserImage.preview_key.in_(keys))
+        )
+        return set(db.execute(query).scalars())
+
+    @staticmethod
+    def count_active_generations(db: Session, user_id: UUID, since: datetime) -> int:
+        """
+        Незавершенные генерации пользователя с момента since: квота за них уже
+        зарезервирована, а событие использования появится только после завершения.
+        """
+        return db.query(func.count(UserImage.id)).filter(
+            UserImage.user_id == user_id,
+            UserImage.status.in_(("pending", "processing")),
+            UserImage.created_at >= since
+        ).scalar()
+
     @staticmethod
     def delete_image(db: Session, image_id: UUID, user_id: UUID) -> bool:
         image = db.query(UserImage).filter(
@@ -1,7 +1,9 @@
 from typing import List, Optional
 from datetime import datetime, timedelta
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
 from app.models.subscription import SubscriptionPlan, UserSubscription
+from app.services.plans import plan_catalog, PlanInfo
 from uuid import UUID
 
 class CRUDSubscription:
@@ -35,19 +37,21 @@ class CRUDSubscription:
         db.add(db_obj)
         db.commit()
         db.refresh(db_obj)
+        # Планы кэшируются в каталоге - сбрасываем его во всех воркерах
+        plan_catalog.invalidate()
         return db_obj
 
     @staticmethod
-    def get_plan(db: Session, plan_id: UUID) -> Optional[SubscriptionPlan]:
-        return db.query(SubscriptionPlan).filter(SubscriptionPlan.id == plan_id).first()
+    def get_plan(db: Session, plan_id: UUID) -> Optional[PlanInfo]:
+        return plan_catalog.get(plan_id, db)
 
     @staticmethod
-    def get_plan_by_name(db: Session, name: str) -> Optional[SubscriptionPlan]:
-        return db.query(SubscriptionPlan).filter(SubscriptionPlan.name == name).first()
+    def get_plan_by_name(db: Session, name: str) -> Optional[PlanInfo]:
+        return plan_catalog.get_by_name(name, db)
 
     @staticmethod
-    def get_all_active_plans(db: Session) -> List[SubscriptionPlan]:
-        return db.query(SubscriptionPlan).filter(SubscriptionPlan.is_active == True).all()
+    def get_all_active_plans(db: Session) -> List[PlanInfo]:
+        return plan_catalog.active(db)
 
     @staticmethod
     def create_subscription(
@@ -63,8 +67,10 @@ class CRUDSubscription:
             start_date = datetime.utcnow()
 
         # Получаем план для определения периода
-        plan = db.query(SubscriptionPlan).filter(SubscriptionPlan.id == plan_id).first()
-        
+        plan = plan_catalog.get(plan_id, db)
+        if not plan:
+            raise ValueError("Subscription plan not found")
+
         # Определяем дату окончания подписки
         if plan.period_type == "monthly":
             end_date = start_date + timedelta(days=30)
@@ -97,6 +103,22 @@ class CRUDSubscription:
             UserSubscription.current_period_end > datetime.utcnow()
         ).first()
 
+    @staticmethod
+    def get_active_subscription_row(db: Session, user_id: UUID) -> Optional[Row]:
+        """
+        id, plan_id и current_period_end активной подписки.
+        Читается только из частичного индекса idx_user_subscriptions_active_user_id.
+        """
+        return db.query(
+            UserSubscription.id,
+            UserSubscription.plan_id,
+            UserSubscription.current_period_end
+        ).filter(
+            UserSubscription.user_id == user_id,
+            UserSubscription.status == "active",
+            UserSubscription.current_period_end > datetime.utcnow()
+        ).limit(1).first()
+
     @staticmethod
     def cancel_subscription(db: Session, subscription_id: UUID) -> Optional[UserSubscription]:
         db_obj = db.query(UserSubscription).filter(UserSubscription.id == subscription_id).first()
@@ -106,30 +128,4 @@ class CRUDSubscription:
             db.refresh(db_obj)
         return db_obj
 
-    @staticmethod
-    def check_limits(db: Session, user_id: UUID) -> dict:
-        """Проверяет лимиты пользователя на основе его подписки"""
-        subscription = db.query(UserSubscription).filter(
-            UserSubscription.user_id == user_id,
-            UserSubscription.status == "active",
-            UserSubscription.current_period_end > datetime.utcnow()
-        ).first()
-
-        if not subscription:
-            return {
-                "has_active_subscription": False,
-                "chat_requests_remaining": 0,
-                "image_generations_remaining": 0,
-                "tool_cards_remaining": 0
-            }
-
-        plan = subscription.plan
-        # Здесь можно добавить логику подсчета использованных запросов
-        return {
-            "has_active_subscription": True,
-            "chat_requests_remaining": plan.chat_requests_daily,
-            "image_generations_remaining": plan.image_generations_monthly,
-            "tool_cards_remaining": plan.tool_cards_monthly
-        }
-
 subscription = CRUDSubscription()
@@ -0,0 +1,132 @@
+from datetime import date
+from decimal import Decimal
+from typing import Dict, List, Optional
+from uuid import UUID
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.models.usage_rollup import UsageDailyRollup
+
+class CRUDUsage:
+    """
+    Чтение статистики использования из дневных агрегатов (usage_daily_rollups).
+    Агрегаты отстают от сырых таблиц на интервал фоновой агрегации.
+    """
+
+    @staticmethod
+    def get_user_daily(
+        db: Session,
+        user_id: UUID,
+        start: date,
+        end: date,
+        usage_type: Optional[str] = None
+    ) -> List[UsageDailyRollup]:
+        """
+        Агрегаты пользователя по дням за период [start, end].
+        """
+        query = db.query(UsageDailyRollup).filter(
+            UsageDailyRollup.user_id == user_id,
+            UsageDailyRollup.day >= start,
+            UsageDailyRollup.day <= end
+        )
+        if usage_type:
+            query = query.filter(UsageDailyRollup.usage_type == usage_type)
+        return query.order_by(UsageDailyRollup.day, UsageDailyRollup.usage_type).all()
+
+    @staticmethod
+    def get_user_totals(
+        db: Session,
+        user_id: UUID,
+        start: date,
+        end: date
+    ) -> Dict[str, Dict[str, object]]:
+        """
+        Итоги пользователя за период: {usage_type: {"events": ..., "tokens": ..., "cost_usd": ...}}.
+        """
+        rows = db.query(
+            UsageDailyRollup.usage_type,
+            func.sum(UsageDailyRollup.events),
+            func.sum(UsageDailyRollup.tokens),
+            func.sum(UsageDailyRollup.cost_usd)
+        ).filter(
+            UsageDailyRollup.user_id == user_id,
+            UsageDailyRollup.day >= start,
+            UsageDailyRollup.day <= end
+        ).group_by(UsageDailyRollup.usage_type).all()
+        return {
+            usage_type: {"events": int(events or 0), "tokens": int(tokens or 0), "cost_usd": cost or Decimal(0)}
+            for usage_type, events, tokens, cost in rows
+        }
+
+    @staticmethod
+    def get_daily_totals(
+        db: Session,
+        start: date,
+        end: date,
+        usage_type: Optional[str] = None
+    ) -> List[Dict[str, object]]:
+        """
+        Сводка по всем пользователям по дням: активные пользователи, события, токены, стоимость.
+        """
+        query = db.query(
+            UsageDailyRollup.day,
+            UsageDailyRollup.usage_type,
+            func.count(func.distinct(UsageDailyRollup.user_id)),
+            func.sum(UsageDailyRollup.events),
+            func.sum(UsageDailyRollup.tokens),
+            func.sum(UsageDailyRollup.cost_usd)
+        ).filter(
+            UsageDailyRollup.day >= start,
+            UsageDailyRollup.day <= end
+        )
+        if usage_type:
+            query = query.filter(UsageDailyRollup.usage_type == usage_type)
+        rows = query.group_by(
+            UsageDailyRollup.day, UsageDailyRollup.usage_type
+        ).order_by(UsageDailyRollup.day, UsageDailyRollup.usage_type).all()
+        return [
+            {
+                "day": day,
+                "usage_type": row_type,
+                "users": users,
+                "events": int(events or 0),
+                "tokens": int(tokens or 0),
+                "cost_usd": cost or Decimal(0)
+            }
+            for day, row_type, users, events, tokens, cost in rows
+        ]
+
+    @staticmethod
+    def get_llm_costs(
+        db: Session,
+        start: date,
+        end: date,
+        user_id: Optional[UUID] = None
+    ) -> List[Dict[str, object]]:
+        """
+        Вызовы моделей за период по моделям: число вызовов, токены, стоимость.
+        Без user_id - по всем пользователям.
+        """
+        query = db.query(
+            UsageDailyRollup.model,
+            func.sum(UsageDailyRollup.events),
+            func.sum(UsageDailyRollup.tokens),
+            func.sum(UsageDailyRollup.cost_usd)
+        ).filter(
+            UsageDailyRollup.usage_type == "llm",
+            UsageDailyRollup.day >= start,
+            UsageDailyRollup.day <= end
+        )
+        if user_id:
+            query = query.filter(UsageDailyRollup.user_id == user_id)
+        rows = query.group_by(UsageDailyRollup.model).order_by(func.sum(UsageDailyRollup.cost_usd).desc()).all()
+        return [
+            {
+                "model": model,
+                "calls": int(calls or 0),
+                "tokens": int(tokens or 0),
+                "cost_usd": cost or Decimal(0)
+            }
+            for model, calls, tokens, cost in rows
+        ]
+
+usage = CRUDUsage()
@@ -1,7 +1,9 @@
 from typing import Optional, List
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
+from app.models.chat import Chat
 from app.models.user import User
+from app.services.conversation_cache import conversation_cache
 from app.core.security import verify_password, get_password_hash
 
 class CRUDUser:
@@ -67,8 +69,12 @@ class CRUDUser:
         user = db.query(User).filter(User.id == user_id).first()
         if not user:
             return False
+        # Чаты и сообщения удаляются каскадом - их окна в кэше диалогов тоже нужно сбросить
+        chat_ids = [row.id for row in db.query(Chat.id).filter(Chat.user_id == user.id)]
         db.delete(user)
         db.commit()
+        for chat_id in chat_ids:
+            conversation_cache.invalidate(chat_id)
         return True
 
 user = CRUDUser()
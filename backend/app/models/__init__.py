@@ -1,10 +1,13 @@
 from .base import Base
 from .user import User
-from .chat import ChatFolder, Chat, ChatMessage
+from .chat import ChatFolder, Chat, ChatMessage, ChatSummary
 from .subscription import SubscriptionPlan, UserSubscription
 from .tool_usage import ToolUsage
+from .api_usage import ApiUsage
+from .usage_rollup import UsageDailyRollup, UsageRollupWatermark
 from .payment import Payment
 from .user_images import UserImage
+from .prompt_translation import PromptTranslation
 
 
 __all__ = [
@@ -13,9 +16,14 @@ __all__ = [
     "ChatFolder",
     "Chat",
     "ChatMessage",
+    "ChatSummary",
     "SubscriptionPlan",
     "UserSubscription",
     "ToolUsage",
+    "ApiUsage",
+    "UsageDailyRollup",
+    "UsageRollupWatermark",
     "UserImage",
+    "PromptTranslation",
     "Payment"
 ]
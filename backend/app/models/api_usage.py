@@ -0,0 +1,23 @@
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+from sqlalchemy import String, Integer, ForeignKey, Numeric
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.dialects.postgresql import UUID
+from .base import Base
+
+class ApiUsage(Base):
+    __tablename__ = 'api_usage'
+
+    user_id: Mapped[Optional[UUID]] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'))
+    ip_address: Mapped[Optional[str]] = mapped_column(String(45))
+    endpoint: Mapped[str] = mapped_column(String(255), nullable=False)
+    request_type: Mapped[str] = mapped_column(String(50), nullable=False)
+    tokens_used: Mapped[Optional[int]] = mapped_column(Integer)
+    # Заполняются для вызовов LLM: модель, счетчики токенов и стоимость
+    model: Mapped[Optional[str]] = mapped_column(String(100))
+    input_tokens: Mapped[Optional[int]] = mapped_column(Integer)
+    output_tokens: Mapped[Optional[int]] = mapped_column(Integer)
+    cache_creation_input_tokens: Mapped[Optional[int]] = mapped_column(Integer)
+    cache_read_input_tokens: Mapped[Optional[int]] = mapped_column(Integer)
+    cost_usd: Mapped[Optional[Decimal]] = mapped_column(Numeric(12, 6))
@@ -1,6 +1,7 @@
 from datetime import datetime
+from decimal import Decimal
 from typing import Optional, List
-from sqlalchemy import Boolean, String, Integer, ForeignKey, Text, ARRAY
+from sqlalchemy import Boolean, String, Integer, ForeignKey, Text, ARRAY, Index, Numeric
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.dialects.postgresql import UUID
 from .base import Base
@@ -44,6 +45,7 @@ class Chat(Base):
     user: Mapped["User"] = relationship("User", back_populates="chats")
     folder: Mapped[Optional["ChatFolder"]] = relationship("ChatFolder", back_populates="chats")
     messages: Mapped[List["ChatMessage"]] = relationship("ChatMessage", back_populates="chat", cascade="all, delete-orphan")
+    summary: Mapped[Optional["ChatSummary"]] = relationship("ChatSummary", back_populates="chat", uselist=False, cascade="all, delete-orphan")
 
 class ChatMessage(Base):
     __tablename__ = 'chat_messages'
@@ -52,6 +54,39 @@ class ChatMessage(Base):
     role: Mapped[str] = mapped_column(String(20), nullable=False)
     content: Mapped[str] = mapped_column(Text, nullable=False)
     tokens_used: Mapped[Optional[int]] = mapped_column(Integer)
+    # Модель и счетчики токенов ответа ассистента
+    model: Mapped[Optional[str]] = mapped_column(String(100))
+    input_tokens: Mapped[Optional[int]] = mapped_column(Integer)
+    output_tokens: Mapped[Optional[int]] = mapped_column(Integer)
+    cache_creation_input_tokens: Mapped[Optional[int]] = mapped_column(Integer)
+    cache_read_input_tokens: Mapped[Optional[int]] = mapped_column(Integer)
+    cost_usd: Mapped[Optional[Decimal]] = mapped_column(Numeric(12, 6))
 
     # Отношения
     chat: Mapped["Chat"] = relationship("Chat", back_populates="messages")
+
+# Keyset-пагинация и сбор контекста: последние сообщения чата одним проходом по индексу
+Index(
+    'idx_chat_messages_chat_id_created_at_id',
+    ChatMessage.chat_id,
+    ChatMessage.created_at.desc(),
+    ChatMessage.id.desc()
+)
+
+class ChatSummary(Base):
+    __tablename__ = 'chat_summaries'
+
+    chat_id: Mapped[UUID] = mapped_column(ForeignKey('chats.id', ondelete='CASCADE'), unique=True, nullable=False)
+    summary: Mapped[str] = mapped_column(Text, nullable=False)
+    # Последнее сообщение, вошедшее в пересказ (created_at, id)
+    summarized_until: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    last_message_id: Mapped[UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
+    messages_summarized: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow
+    )
+
+    # Отношения
+    chat: Mapped["Chat"] = relationship("Chat", back_populates="summary")
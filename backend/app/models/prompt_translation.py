@@ -0,0 +1,23 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import DateTime, Integer, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+from .base import Base
+
+class PromptTranslation(Base):
+    """
+    Кэш переводов промптов генерации изображений на английский.
+    prompt_hash - sha256 нормализованного промпта (см. app.services.translations).
+    """
+    __tablename__ = 'prompt_translations'
+
+    prompt_hash: Mapped[str] = mapped_column(String(64), unique=True, nullable=False)
+    source_text: Mapped[str] = mapped_column(Text, nullable=False)
+    translated_text: Mapped[str] = mapped_column(Text, nullable=False)
+    model: Mapped[Optional[str]] = mapped_column(String(100))
+    hits: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    last_used_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=datetime.utcnow,
+        nullable=False
+    )
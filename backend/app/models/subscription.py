@@ -1,6 +1,6 @@
 from datetime import datetime
 from typing import Optional, List
-from sqlalchemy import Boolean, String, Integer, ForeignKey, Text, Numeric, DateTime
+from sqlalchemy import Boolean, String, Integer, ForeignKey, Text, Numeric, DateTime, Index, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.dialects.postgresql import UUID
 from .base import Base
@@ -45,3 +45,18 @@ class UserSubscription(Base):
     user: Mapped["User"] = relationship("User", back_populates="subscriptions")
     plan: Mapped["SubscriptionPlan"] = relationship("SubscriptionPlan", back_populates="subscriptions")
     payments: Mapped[List["Payment"]] = relationship("Payment", back_populates="subscription")
+
+# Поиск активной подписки пользователя (проверка лимитов на каждый запрос)
+Index(
+    'idx_user_subscriptions_active_user_id',
+    UserSubscription.user_id,
+    postgresql_where=text("status = 'active'"),
+    postgresql_include=['plan_id', 'current_period_end']
+)
+
+# Поиск истекших активных подписок
+Index(
+    'idx_user_subscriptions_active_period_end',
+    UserSubscription.current_period_end,
+    postgresql_where=text("status = 'active'")
+)
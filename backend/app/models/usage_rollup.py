@@ -0,0 +1,47 @@
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Optional
+from sqlalchemy import BigInteger, Date, DateTime, ForeignKey, Integer, Numeric, String, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.dialects.postgresql import UUID
+from .base import Base
+
+class UsageDailyRollup(Base):
+    """
+    Агрегаты использования по пользователю, дню (UTC), типу и модели.
+    Типы: 'chat', 'image', 'tool' - events это сообщения пользователя, изображения
+    или карточки инструментов; 'llm' - вызовы моделей со стоимостью, model заполнен.
+    Для остальных типов model - пустая строка.
+    """
+    __tablename__ = 'usage_daily_rollups'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'day', 'usage_type', 'model', name='uq_usage_daily_rollups_user_day_type_model'),
+    )
+
+    user_id: Mapped[UUID] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    day: Mapped[date] = mapped_column(Date, nullable=False)
+    usage_type: Mapped[str] = mapped_column(String(20), nullable=False)
+    model: Mapped[str] = mapped_column(String(100), default='', nullable=False)
+    events: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    tokens: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    cost_usd: Mapped[Decimal] = mapped_column(Numeric(14, 6), default=0, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow
+    )
+
+class UsageRollupWatermark(Base):
+    """
+    Позиция (created_at, id) последней строки источника, учтенной в агрегатах.
+    """
+    __tablename__ = 'usage_rollup_watermarks'
+
+    source: Mapped[str] = mapped_column(String(50), unique=True, nullable=False)
+    last_created_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    last_id: Mapped[Optional[UUID]] = mapped_column(UUID(as_uuid=True))
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=datetime.utcnow,
+        onupdate=datetime.utcnow
+    )
@@ -25,11 +25,8 @@ class User(Base):
         default=datetime.utcnow,
         onupdate=datetime.utcnow
     )
-    ai_model: Mapped[str] = mapped_column(
-        String(50), 
-        default="claude-3-5-sonnet-20241022",
-        nullable=False
-    )
+    # Модель, выбранная пользователем; None - модель по умолчанию (anthropic_service.default_model)
+    ai_model: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
     default_bot_style: Mapped[str] = mapped_column(
         String(50), 
         default="standard",
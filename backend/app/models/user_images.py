@@ -1,6 +1,6 @@
 from datetime import datetime
 from typing import Optional
-from sqlalchemy import String, ForeignKey, Text, DateTime
+from sqlalchemy import String, ForeignKey, Text, DateTime, Integer, Index, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.dialects.postgresql import UUID
 from .base import Base
@@ -11,10 +11,26 @@ class UserImage(Base):
     user_id: Mapped[UUID] = mapped_column(ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     prompt: Mapped[str] = mapped_column(Text, nullable=False)
     translated_prompt: Mapped[str] = mapped_column(Text, nullable=False)
-    image_url: Mapped[str] = mapped_column(Text, nullable=False)
+    # Заполняется, когда генерация завершена
+    image_url: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    # Сам файл лежит в хранилище (app.services.storage), в таблице - только ключ и метаданные
+    storage_key: Mapped[Optional[str]] = mapped_column(String(255))
+    size_bytes: Mapped[Optional[int]] = mapped_column(Integer)
+    content_hash: Mapped[Optional[str]] = mapped_column(String(64))
+    # Уменьшенные копии в WebP для галереи (app.services.derivatives)
+    thumbnail_url: Mapped[Optional[str]] = mapped_column(Text)
+    thumbnail_key: Mapped[Optional[str]] = mapped_column(String(255))
+    preview_url: Mapped[Optional[str]] = mapped_column(Text)
+    preview_key: Mapped[Optional[str]] = mapped_column(String(255))
     aspect_ratio: Mapped[str] = mapped_column(String(10), default='1:1')
     style: Mapped[Optional[str]] = mapped_column(String(50))
+    # pending -> processing -> completed | failed
     status: Mapped[str] = mapped_column(String(20), default='completed')
+    # Задача BFL, результат которой ожидается через webhook
+    bfl_task_id: Mapped[Optional[str]] = mapped_column(String(64))
+    # Когда получен webhook о завершении; заполненное значение - генерацию уже завершает обработчик
+    webhook_received_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True))
+    error: Mapped[Optional[str]] = mapped_column(Text)
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         default=datetime.utcnow,
@@ -23,3 +39,35 @@ class UserImage(Base):
 
     # Отношения
     user: Mapped["User"] = relationship("User", back_populates="images")
+
+    __table_args__ = (
+        # Поиск брошенных незавершенных генераций
+        Index(
+            'idx_user_images_active_updated_at',
+            'updated_at',
+            postgresql_where=text("status IN ('pending', 'processing')")
+        ),
+        # Поиск изображения по задаче BFL при обработке webhook
+        Index(
+            'idx_user_images_bfl_task_id',
+            'bfl_task_id',
+            unique=True,
+            postgresql_where=text("bfl_task_id IS NOT NULL")
+        ),
+        # Проверка ссылок на файлы хранилища при сборке мусора
+        Index(
+            'idx_user_images_storage_key',
+            'storage_key',
+            postgresql_where=text("storage_key IS NOT NULL")
+        ),
+        Index(
+            'idx_user_images_thumbnail_key',
+            'thumbnail_key',
+            postgresql_where=text("thumbnail_key IS NOT NULL")
+        ),
+        Index(
+            'idx_user_images_preview_key',
+            'preview_key',
+            postgresql_where=text("preview_key IS NOT NULL")
+        ),
+    )
@@ -37,6 +37,11 @@ class ChatMessageInDB(ChatMessageBase):
     class Config:
         from_attributes = True
 
+class ChatMessagePage(BaseModel):
+    items: List[ChatMessageInDB]
+    has_more: bool
+    next_cursor: Optional[str] = None
+
 class ChatBase(BaseModel):
     title: Optional[str] = None
     emoji: Optional[str] = None
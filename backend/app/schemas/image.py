@@ -41,7 +41,11 @@ class ImageInDB(ImageBase):
     id: UUID4
     user_id: UUID4
     translated_prompt: str
-    image_url: str
+    image_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    preview_url: Optional[str] = None
+    status: str
+    error: Optional[str] = None
     created_at: datetime
 
     class Config:
@@ -1,62 +1,161 @@
-from anthropic import Anthropic
-from typing import Optional, Dict, Any, List
+import logging
+import httpx
+from anthropic import AsyncAnthropic
+from typing import Optional, Dict, Any, List, AsyncIterator, Union
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
 class AnthropicService:
     def __init__(self):
-        self.client = Anthropic(api_key=settings.ANTHROPIC_API_KEY)
+        # Один долгоживущий пул соединений на процесс: запросы к Claude
+        # не блокируют event loop и переиспользуют keep-alive соединения
+        self.http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                settings.ANTHROPIC_TIMEOUT,
+                connect=settings.ANTHROPIC_CONNECT_TIMEOUT
+            ),
+            limits=httpx.Limits(
+                max_connections=settings.ANTHROPIC_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.ANTHROPIC_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.ANTHROPIC_KEEPALIVE_EXPIRY
+            )
+        )
+        self.client = AsyncAnthropic(
+            api_key=settings.ANTHROPIC_API_KEY,
+            http_client=self.http_client
+        )
         self.default_model = "claude-3-haiku-20240307"
 
-    def prepare_context(self, messages: List[Dict[str, str]], max_context: int = 2) -> List[Dict[str, str]]:
+    async def close(self) -> None:
+        """
+        Закрыть пул HTTP-соединений (вызывается при остановке приложения).
+        """
+        await self.client.close()
+
+    @staticmethod
+    def _build_request(
+        messages: List[Dict[str, str]],
+        system: Optional[Union[str, List[str]]],
+        cache_history: bool
+    ) -> Dict[str, Any]:
+        """
+        Сформировать тело запроса с точками кэширования промпта.
+        Системный промпт кэшируется всегда; в чатах с памятью точка ставится
+        и на последнее сообщение, чтобы следующий ход переиспользовал всю
+        предыдущую историю как готовый префикс.
+        """
+        request_body: Dict[str, Any] = {
+            "messages": messages
+        }
+
+        if system:
+            parts = [system] if isinstance(system, str) else [part for part in system if part]
+            blocks = [{"type": "text", "text": part} for part in parts]
+            blocks[-1]["cache_control"] = {"type": "ephemeral"}
+            request_body["system"] = blocks
+
+        if cache_history and messages:
+            last = messages[-1]
+            request_body["messages"] = messages[:-1] + [{
+                "role": last["role"],
+                "content": [{
+                    "type": "text",
+                    "text": last["content"],
+                    "cache_control": {"type": "ephemeral"}
+                }]
+            }]
+
+        return request_body
+
+    @staticmethod
+    def usage_to_dict(usage: Any) -> Dict[str, int]:
         """
-        Подготовить контекст для отправки в Claude.
-        Берем последние max_context пар сообщений (user + assistant) + текущее сообщение.
+        Счетчики токенов запроса, включая чтение и запись кэша промпта.
         """
-        if len(messages) <= (max_context * 2 + 1):
-            return messages
-            
-        # Берем только последние сообщения
-        start_idx = -(max_context * 2 + 1)
-        return messages[start_idx:]
+        return {
+            "input_tokens": getattr(usage, "input_tokens", None) or 0,
+            "output_tokens": getattr(usage, "output_tokens", None) or 0,
+            "cache_creation_input_tokens": getattr(usage, "cache_creation_input_tokens", None) or 0,
+            "cache_read_input_tokens": getattr(usage, "cache_read_input_tokens", None) or 0
+        }
 
     async def send_message(
         self,
         messages: List[Dict[str, str]],
-        system: Optional[str] = None,
+        system: Optional[Union[str, List[str]]] = None,
         max_tokens: int = 1024,
         temperature: float = 0.7,
-        model: Optional[str] = None
+        model: Optional[str] = None,
+        cache_history: bool = False
     ) -> Dict[str, Any]:
         """
         Отправить сообщение в Claude API.
+        Возвращает текст ответа, модель и счетчики токенов в ключе usage.
         """
         try:
-            # Подготавливаем контекст
-            context_messages = self.prepare_context(messages)
-            
             # Формируем тело запроса
-            request_body = {
-                "messages": context_messages
-            }
-            
-            if system:
-                request_body["system"] = system
+            request_body = self._build_request(messages, system, cache_history)
 
             # Отправляем запрос
-            response = self.client.messages.create(
+            response = await self.client.messages.create(
                 model=model or self.default_model,
                 max_tokens=max_tokens,
                 temperature=temperature,
                 **request_body
             )
 
+            usage = self.usage_to_dict(response.usage)
+            logger.info(f"Claude usage ({response.model}): {usage}")
+
             return {
-                "content": [{"text": response.content[-1].text}]
+                "content": [{"text": response.content[-1].text}],
+                "model": response.model,
+                "usage": usage
             }
 
         except Exception as e:
             raise ValueError(f"Failed to send message: {str(e)}")
 
+    async def stream_message(
+        self,
+        messages: List[Dict[str, str]],
+        system: Optional[Union[str, List[str]]] = None,
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        model: Optional[str] = None,
+        cache_history: bool = False,
+        usage: Optional[Dict[str, int]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Отправить сообщение в Claude API в потоковом режиме.
+        Отдает текстовые фрагменты ответа по мере их поступления.
+        Если передан словарь usage, по завершении потока в него записываются счетчики токенов.
+        Счетчики входных токенов записываются уже с первым фрагментом, поэтому при обрыве
+        потока (например, клиент отключился) они известны; выходные токены Claude сообщает
+        только в конце ответа.
+        """
+        request_body = self._build_request(messages, system, cache_history)
+
+        async with self.client.messages.stream(
+            model=model or self.default_model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            **request_body
+        ) as stream:
+            started = False
+            async for text in stream.text_stream:
+                if not started and usage is not None:
+                    started = True
+                    usage.update(self.usage_to_dict(stream.current_message_snapshot.usage))
+                yield text
+            final_message = await stream.get_final_message()
+
+        stream_usage = self.usage_to_dict(final_message.usage)
+        logger.info(f"Claude usage ({final_message.model}, stream): {stream_usage}")
+        if usage is not None:
+            usage.update(stream_usage)
+
     def get_system_prompt_by_style(self, style: str) -> str:
         """
         Получить системный промпт в зависимости от выбранного стиля.
@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+import aiohttp
+from fastapi import HTTPException
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class GenerationTimeStats:
+    """
+    Время генерации по соотношению сторон за последние BFL_POLL_STATS_WINDOW генераций
+    в этом процессе. По нему выбирается задержка перед первым опросом статуса.
+    Учитываются только точные замеры: генерации, опрашиваемые с самого начала
+    (доля BFL_POLL_PROBE_RATE), и уведомления webhook. Время генерации, первый опрос
+    которой был после задержки, известно лишь как "не больше задержки" -
+    с такими замерами медиана могла бы только расти.
+    """
+
+    def __init__(self):
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def observe(self, aspect_ratio: str, seconds: float) -> None:
+        samples = self._samples.get(aspect_ratio)
+        if samples is None:
+            samples = self._samples[aspect_ratio] = deque(maxlen=settings.BFL_POLL_STATS_WINDOW)
+        samples.append(seconds)
+
+    def percentile(self, aspect_ratio: str, q: float) -> Optional[float]:
+        samples = self._samples.get(aspect_ratio)
+        if not samples or len(samples) < settings.BFL_POLL_STATS_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def initial_delay(self, aspect_ratio: str) -> float:
+        typical = self.percentile(aspect_ratio, settings.BFL_POLL_PERCENTILE)
+        if typical is None:
+            return settings.BFL_POLL_INITIAL_DELAY
+        return min(typical, settings.BFL_POLL_MAX_INITIAL_DELAY)
+
+    @staticmethod
+    def should_probe() -> bool:
+        """
+        Опрашивать ли эту генерацию с самого начала, чтобы точно измерить ее время.
+        """
+        return random.random() < settings.BFL_POLL_PROBE_RATE
+
+generation_times = GenerationTimeStats()
+
+class BFLClient:
+    def __init__(self, api_key: str, base_url: str = "https://api.bfl.ml"):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.headers = {
+            "X-Key": api_key,
+            "Content-Type": "application/json"
+        }
+        # Один пул соединений на процесс: отправка задачи, опрос статуса и загрузка
+        # результата переиспользуют keep-alive соединения вместо новых TCP+TLS рукопожатий
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        """
+        Создать пул соединений (вызывается при старте приложения).
+        """
+        await self.get_session()
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        if self._session is not None and not self._session.closed:
+            return self._session
+        async with self._session_lock:
+            if self._session is None or self._session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit=settings.BFL_MAX_CONNECTIONS,
+                    limit_per_host=settings.BFL_MAX_CONNECTIONS_PER_HOST,
+                    ttl_dns_cache=settings.BFL_DNS_CACHE_TTL,
+                    keepalive_timeout=settings.BFL_KEEPALIVE_TIMEOUT
+                )
+                # Общее время генерации ограничивает задача генерации, здесь - отдельные запросы
+                timeout = aiohttp.ClientTimeout(
+                    total=settings.BFL_REQUEST_TIMEOUT,
+                    connect=settings.BFL_CONNECT_TIMEOUT
+                )
+                self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def close(self) -> None:
+        """
+        Закрыть пул соединений (вызывается при остановке приложения).
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _get_dimensions(self, aspect_ratio: str):
+        """
+        Возвращает размеры изображения на основе соотношения сторон.
+        Убедитесь, что и ширина, и высота кратны 32.
+        """
+        ratios = {
+            "1:1": (1024, 1024),
+            "16:9": (1408, 800),
+            "9:16": (800, 1408),
+            "4:5": (1024, 1280),
+            "5:4": (1280, 1024),
+            "3:2": (1440, 960),
+            "2:3": (960, 1440)
+        }
+        return ratios.get(aspect_ratio, (1024, 1024))
+
+    async def submit(
+        self,
+        prompt: str,
+        aspect_ratio: str = "1:1",
+        webhook_url: Optional[str] = None
+    ) -> str:
+        """
+        Отправить задачу на генерацию. Возвращает id задачи BFL.
+        С webhook_url BFL сам сообщит о готовности, опрашивать статус не нужно.
+        """
+        width, height = self._get_dimensions(aspect_ratio)
+        payload = {
+            "prompt": prompt,
+            "width": width,
+            "height": height,
+            "steps": 40,
+            "prompt_upsampling": False,
+            "guidance": 2,
+            "safety_tolerance": 2,
+            "interval": 2,
+            "output_format": "png"
+        }
+        if webhook_url:
+            payload["webhook_url"] = webhook_url
+            if settings.BFL_WEBHOOK_SECRET:
+                payload["webhook_secret"] = settings.BFL_WEBHOOK_SECRET
+
+        logger.info(f"BFL: Submitting generation, aspect ratio {aspect_ratio}")
+        session = await self.get_session()
+        async with session.post(
+            f"{self.base_url}/v1/flux-dev",
+            headers=self.headers,
+            json=payload
+        ) as response:
+            if response.status != 200:
+                response_text = await response.text()
+                logger.error(f"BFL: Initial request failed: {response.status} {response_text}")
+                raise HTTPException(status_code=500, detail="Initial request to image API failed.")
+            result = await response.json()
+
+        task_id = result.get("id")
+        if not task_id:
+            logger.error("BFL: No task ID in response")
+            raise HTTPException(status_code=500, detail="No task ID returned by image API.")
+        return task_id
+
+    async def get_result(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Текущий статус задачи или None, если статус получить не удалось.
+        """
+        session = await self.get_session()
+        try:
+            async with session.get(
+                f"{self.base_url}/v1/get_result",
+                params={"id": task_id},
+                headers=self.headers
+            ) as response:
+                if response.status != 200:
+                    logger.warning(f"BFL: Status check for {task_id} failed: {response.status}")
+                    return None
+                return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.warning(f"BFL: Status check for {task_id} failed: {str(e)}")
+            return None
+
+    @staticmethod
+    def sample_url(result: Dict[str, Any]) -> Optional[str]:
+        """
+        URL готового изображения из ответа get_result или webhook.
+        None - задача еще выполняется. Ошибка генерации или модерация - HTTPException.
+        """
+        status = result.get("status")
+        if status == "Ready":
+            sample_url = (result.get("result") or {}).get("sample")
+            if not sample_url:
+                logger.error(f"BFL: No sample URL in result: {result}")
+                raise HTTPException(status_code=500, detail="No image URL returned by API.")
+            return sample_url
+        if status in ("Request Moderated", "Content Moderated"):
+            raise HTTPException(status_code=400, detail="Content moderated by API.")
+        if status in ("Error", "Failed"):
+            error_message = result.get("error") or result.get("details") or "Unknown error"
+            raise HTTPException(status_code=500, detail=f"Image generation failed: {error_message}")
+        return None
+
+    async def wait_for_result(self, task_id: str, aspect_ratio: str) -> str:
+        """
+        Дождаться готовности задачи опросом и вернуть URL изображения.
+        Первый опрос - через типичное время генерации для этого соотношения сторон
+        (перцентиль по недавним генерациям), дальше интервал растет с джиттером.
+        Небольшая доля генераций опрашивается с начала с минимальным интервалом -
+        только они пополняют статистику времени генерации.
+        Общее время ожидания ограничивает вызывающий код.
+        """
+        started = time.monotonic()
+        probe = generation_times.should_probe()
+        if not probe:
+            await asyncio.sleep(generation_times.initial_delay(aspect_ratio))
+        interval = settings.BFL_POLL_MIN_INTERVAL
+        attempts = 0
+        while True:
+            attempts += 1
+            result = await self.get_result(task_id)
+            if result is not None:
+                sample_url = self.sample_url(result)
+                if sample_url:
+                    elapsed = time.monotonic() - started
+                    if probe:
+                        generation_times.observe(aspect_ratio, elapsed)
+                    logger.info(f"BFL: Task {task_id} ready in {elapsed:.1f}s after {attempts} status checks")
+                    return sample_url
+            # Полный джиттер: параллельные генерации не опрашивают API синхронно
+            await asyncio.sleep(random.uniform(interval / 2, interval))
+            if not probe:
+                interval = min(interval * settings.BFL_POLL_BACKOFF, settings.BFL_POLL_MAX_INTERVAL)
+
+    async def download(self, url: str) -> bytes:
+        session = await self.get_session()
+        async with session.get(url) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                logger.error(f"BFL: Failed to download image: {error_text}")
+                raise HTTPException(status_code=500, detail="Failed to download image.")
+            return await response.read()
+
+    async def create_image(self, prompt: str, aspect_ratio: str = "1:1") -> Optional[bytes]:
+        """
+        Генерирует изображение с помощью BFL API и возвращает байты изображения.
+        """
+        try:
+            task_id = await self.submit(prompt, aspect_ratio)
+            sample_url = await self.wait_for_result(task_id, aspect_ratio)
+            return await self.download(sample_url)
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"BFL: Error in create_image: {e}", exc_info=True)
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error during image generation: {e}"
+            )
+
+bfl_client = BFLClient(api_key=settings.BFL_API_KEY)
@@ -0,0 +1,65 @@
+import asyncio
+import logging
+import time
+from typing import Callable, List, Set
+from app.core.config import settings
+from app.core.redis import get_async_redis
+from app.crud.images import image
+from app.db.session import SessionLocal
+from app.services.storage import blob_store, BlobStore
+
+logger = logging.getLogger(__name__)
+
+# Ключи из списка, на которые ссылается хотя бы одно изображение
+ReferencedKeys = Callable[[List[str]], Set[str]]
+
+def referenced_storage_keys(keys: List[str]) -> Set[str]:
+    db = SessionLocal()
+    try:
+        return image.referenced_storage_keys(db, keys)
+    finally:
+        db.close()
+
+class BlobGarbageCollector:
+    """
+    Удаление файлов хранилища, на которые не ссылается ни одно изображение.
+    Одинаковые файлы общие для изображений, поэтому удаление изображения файлы не трогает,
+    а проход раз в STORAGE_GC_INTERVAL обходит хранилище по шардам и удаляет
+    файлы без ссылок. Файлы моложе STORAGE_GC_GRACE не трогаются: генерация сохраняет
+    файл до коммита ссылки на него, а повторная запись того же содержимого
+    обновляет время файла. Время проверяется еще раз непосредственно перед удалением.
+    """
+
+    # За один интервал хранилище обходит только один воркер
+    LOCK = "storage-gc:lock"
+
+    def __init__(self, store: BlobStore, referenced: ReferencedKeys):
+        self.store = store
+        self.referenced = referenced
+
+    async def sweep(self) -> int:
+        """
+        Один проход сборки мусора. Возвращает число удаленных файлов.
+        """
+        client = get_async_redis()
+        if client is not None and not await client.set(
+            self.LOCK, "1", nx=True, ex=settings.STORAGE_GC_INTERVAL
+        ):
+            return 0
+
+        before = time.time() - settings.STORAGE_GC_GRACE
+        removed = 0
+        for shard in range(256):
+            entries = await self.store.list_keys(f"{shard:02x}")
+            candidates = [key for key, modified_at in entries if modified_at < before]
+            for start in range(0, len(candidates), settings.STORAGE_GC_BATCH):
+                batch = candidates[start:start + settings.STORAGE_GC_BATCH]
+                used = await asyncio.to_thread(self.referenced, batch)
+                for key in batch:
+                    if key not in used and await self.store.delete_if_older(key, before):
+                        removed += 1
+        if removed:
+            logger.info(f"Storage GC: {removed} unreferenced files removed")
+        return removed
+
+blob_garbage_collector = BlobGarbageCollector(blob_store, referenced_storage_keys)
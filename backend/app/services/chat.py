@@ -1,15 +1,18 @@
 # app/services/chat.py
 
-from typing import List, Tuple, Optional
-import anthropic
-from app.core.config import settings
+from decimal import Decimal
+from typing import Dict, List, Tuple, Optional
+from app.services.anthropic import anthropic_service
+from app.services.pricing import cost_usd
+from app.services.usage import usage_recorder
 import logging
 
 logger = logging.getLogger(__name__)
 
 class ChatService:
     def __init__(self):
-        self.client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
+        # Используем общий асинхронный клиент с пулом соединений
+        self.client = anthropic_service.client
         self.MODEL_NAME = "claude-3-haiku-20240307"
     
     async def process_message(
@@ -19,7 +22,7 @@ class ChatService:
         message: str,
         previous_messages: List[dict],
         user_settings: dict
-    ) -> Tuple[str, int]:
+    ) -> Tuple[str, Decimal]:
         """
         Обрабатывает сообщение пользователя и возвращает ответ от Claude
         """
@@ -48,7 +51,7 @@ class ChatService:
                 max_tokens = 4096
 
             # Отправляем запрос к API
-            response = self.client.messages.create(
+            response = await self.client.messages.create(
                 model=self.MODEL_NAME,
                 max_tokens=max_tokens,
                 temperature=0.7,
@@ -59,8 +62,10 @@ class ChatService:
             # Получаем ответ
             response_text = response.content[0].text
 
-            # Вычисляем стоимость
-            cost = self._calculate_cost(model, length, user_settings.get('memory_multiplier', 1))
+            # Вычисляем стоимость по фактическим счетчикам токенов
+            usage = anthropic_service.usage_to_dict(response.usage)
+            cost = self._calculate_cost(response.model, usage)
+            await usage_recorder.record_llm_call(str(user_id), "chat", response.model, usage)
 
             return response_text, cost
 
@@ -68,17 +73,8 @@ class ChatService:
             logger.error(f"Error processing message: {str(e)}")
             raise
 
-    def _calculate_cost(self, model: str, length: str, memory_multiplier: int) -> int:
+    def _calculate_cost(self, model: str, usage: Dict[str, int]) -> Decimal:
         """
-        Вычисляет стоимость ответа в МБ
+        Вычисляет стоимость ответа в долларах по прайсу модели
         """
-        # Базовая стоимость
-        if model in ['haiku3', 'haiku3.5']:
-            base_cost = 1
-        elif model == 'sonnet3.5':
-            base_cost = 4
-        else:
-            base_cost = 1
-
-        # Умножаем на множитель памяти
-        return base_cost * memory_multiplier
+        return cost_usd(model, usage)
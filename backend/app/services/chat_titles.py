@@ -0,0 +1,47 @@
+import asyncio
+from typing import Dict, Optional, Tuple
+from uuid import UUID
+from app.db.session import SessionLocal
+from app.crud.chats import chat
+from app.services.jobs import job_runner
+from app.services.openai_service import openai_service
+from app.services.usage import usage_recorder
+
+class ChatTitleService:
+    """
+    Автоматическое название чата по первому сообщению, в фоне.
+    Клиент получает результат событием `title` в SSE-потоке
+    или повторным запросом GET /chats/{chat_id}.
+    """
+
+    def schedule(self, chat_id: UUID, content: str, user_id: UUID) -> asyncio.Task:
+        """
+        Запустить генерацию названия в фоне. Результат задачи - (title, emoji) или None.
+        """
+        return job_runner.submit(
+            self._update_title(chat_id, content, user_id),
+            name=f"chat-title-{chat_id}"
+        )
+
+    async def _update_title(
+        self,
+        chat_id: UUID,
+        content: str,
+        user_id: UUID
+    ) -> Optional[Tuple[str, str]]:
+        # Запрос уже завершился, поэтому работаем в собственной сессии
+        db = SessionLocal()
+        usage: Dict[str, int] = {}
+        try:
+            return await chat.update_chat_title_from_content(
+                db=db,
+                chat_id=chat_id,
+                content=content,
+                usage=usage
+            )
+        finally:
+            db.close()
+            if usage:
+                await usage_recorder.record_llm_call(str(user_id), "chat_title", openai_service.model, usage)
+
+chat_title_service = ChatTitleService()
@@ -0,0 +1,149 @@
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.crud.chats import chat
+from app.services.conversation_cache import conversation_cache, Window
+
+class ContextBuilder:
+    """
+    Собирает историю чата для Claude в пределах бюджета токенов.
+    Читает сообщения от новых к старым и останавливается, как только бюджет исчерпан.
+    """
+
+    # Размер контекстного окна моделей (в токенах)
+    MODEL_CONTEXT_WINDOWS = {
+        "claude-3-haiku-20240307": 200000,
+        "claude-3-5-haiku-20241022": 200000,
+        "claude-3-5-sonnet-20241022": 200000,
+        "claude-3-opus-20240229": 200000,
+    }
+    DEFAULT_CONTEXT_WINDOW = 200000
+
+    def __init__(self, batch_size: int = 10):
+        self.batch_size = batch_size
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """
+        Грубая оценка числа токенов без обращения к API.
+        Для кириллицы выходит примерно 3 символа на токен, плюс служебные токены сообщения.
+        """
+        return len(text) // 3 + 4
+
+    def token_budget(
+        self,
+        model: str,
+        plan_name: Optional[str] = None,
+        max_tokens: int = 1024
+    ) -> int:
+        """
+        Бюджет токенов на историю: зависит от плана и ограничен окном модели.
+        """
+        budget = settings.CONTEXT_TOKEN_BUDGET_PAID if plan_name else settings.CONTEXT_TOKEN_BUDGET_FREE
+        window = self.MODEL_CONTEXT_WINDOWS.get(model, self.DEFAULT_CONTEXT_WINDOW)
+        return min(budget, window - max_tokens)
+
+    def build(
+        self,
+        db: Session,
+        chat_id: UUID,
+        budget: int
+    ) -> Tuple[List[Dict[str, str]], Optional[str]]:
+        """
+        Загрузить последние сообщения чата, помещающиеся в бюджет, и пересказ
+        более ранней части разговора, если он есть.
+        Самое новое сообщение (текущий вопрос пользователя) включается всегда.
+        Сначала используется кэш последних сообщений, к БД обращаемся только
+        за тем, чего в нем нет; прочитанное из БД окно кладется обратно в кэш.
+        """
+        summary = chat.get_summary(db, chat_id)
+        summary_text = None
+        boundary = None
+        if summary:
+            # Сообщения, вошедшие в пересказ, повторно не отправляем
+            summary_text = summary.summary
+            budget -= self.estimate_tokens(summary_text)
+            boundary = (summary.summarized_until, summary.last_message_id)
+
+        cached = conversation_cache.get(chat_id)
+        selected = []
+        read: List[Dict[str, Any]] = []
+        used = 0
+        exhausted = True
+        for message in self._history(db, chat_id, cached):
+            if boundary is not None and self._position(message) <= boundary:
+                exhausted = False
+                break
+            read.append(message)
+            cost = self.estimate_tokens(message["content"])
+            if selected and used + cost > budget:
+                exhausted = False
+                break
+            selected.append({"role": message["role"], "content": message["content"]})
+            used += cost
+
+        if cached is None or (not cached[1] and len(read) > len(cached[0])):
+            read.reverse()
+            conversation_cache.fill(chat_id, read, complete=exhausted)
+
+        selected.reverse()
+        return self.normalize(selected), summary_text
+
+    @staticmethod
+    def _position(message: Dict[str, Any]) -> Tuple[datetime, UUID]:
+        return datetime.fromisoformat(message["created_at"]), UUID(message["id"])
+
+    def _history(
+        self,
+        db: Session,
+        chat_id: UUID,
+        cached: Optional[Window]
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Сообщения чата от новых к старым: сначала из кэша, затем из БД.
+        """
+        before = None
+        if cached is not None:
+            messages, complete = cached
+            yield from reversed(messages)
+            if complete:
+                return
+            if messages:
+                before = (
+                    datetime.fromisoformat(messages[0]["created_at"]),
+                    UUID(messages[0]["id"])
+                )
+
+        for row in chat.iter_recent_messages(
+            db, chat_id, batch_size=self.batch_size, before=before
+        ):
+            yield conversation_cache.to_entry(row)
+
+    @staticmethod
+    def normalize(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """
+        Привести историю к формату, который принимает Anthropic:
+        первое и последнее сообщения от пользователя, роли строго чередуются.
+        Подряд идущие сообщения одной роли склеиваются.
+        """
+        result: List[Dict[str, str]] = []
+        for message in messages:
+            if message["role"] not in ("user", "assistant") or not message["content"].strip():
+                continue
+            if not result and message["role"] != "user":
+                continue
+            if result and result[-1]["role"] == message["role"]:
+                result[-1] = {
+                    "role": message["role"],
+                    "content": f"{result[-1]['content']}\n\n{message['content']}"
+                }
+            else:
+                result.append(dict(message))
+
+        while result and result[-1]["role"] != "user":
+            result.pop()
+        return result
+
+context_builder = ContextBuilder()
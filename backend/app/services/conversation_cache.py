@@ -0,0 +1,205 @@
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Окно последних сообщений чата: (сообщения от старых к новым, вся ли история чата в окне)
+Window = Tuple[List[Dict[str, Any]], bool]
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def position_key(message: Dict[str, Any]) -> str:
+    """
+    Позиция сообщения (created_at, id) строкой фиксированной ширины:
+    строки сравниваются в том же порядке, в каком сообщения читаются из БД.
+    """
+    created_at = datetime.fromisoformat(message["created_at"])
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    micros = (created_at - EPOCH) // timedelta(microseconds=1)
+    return f"{micros:020d}:{message['id']}"
+
+class InMemoryConversationBackend:
+    """
+    Окна сообщений в памяти процесса. Подходит для одного воркера.
+    """
+
+    def __init__(self, max_chats: int, window: int, ttl: int):
+        self.window = window
+        self._cache: LRUCache[Window] = LRUCache(maxsize=max_chats, ttl=ttl)
+
+    def get(self, chat_id: str) -> Optional[Window]:
+        cached = self._cache.get(chat_id)
+        if cached is None:
+            return None
+        messages, complete = cached
+        return list(messages), complete
+
+    def set(self, chat_id: str, messages: List[Dict[str, Any]], complete: bool) -> None:
+        self._cache.set(chat_id, (list(messages[-self.window:]), complete and len(messages) <= self.window))
+
+    def append(self, chat_id: str, message: Dict[str, Any]) -> None:
+        cached = self._cache.get(chat_id)
+        if cached is None:
+            # Окно без начала истории не заводим - оно заполнится при следующем чтении
+            return
+        messages, complete = cached
+        if messages and position_key(message) < position_key(messages[-1]):
+            # Параллельный ход сохранил более новое сообщение раньше - окно перечитаем из БД
+            self.invalidate(chat_id)
+            return
+        messages = messages + [message]
+        if len(messages) > self.window:
+            messages = messages[-self.window:]
+            complete = False
+        self._cache.set(chat_id, (messages, complete))
+
+    def invalidate(self, chat_id: str) -> None:
+        self._cache.pop(chat_id)
+
+class RedisConversationBackend:
+    """
+    Окна сообщений в Redis, общие для всех воркеров.
+    Ключ meta - признак наличия окна и его полноты, список хранит сообщения в JSON,
+    tail - позиция последнего сообщения окна (position_key).
+    """
+
+    APPEND_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return 0
+    end
+    local tail = redis.call('GET', KEYS[3])
+    if tail and ARGV[4] < tail then
+        redis.call('DEL', KEYS[1], KEYS[2], KEYS[3])
+        return -1
+    end
+    redis.call('RPUSH', KEYS[2], ARGV[1])
+    if redis.call('LLEN', KEYS[2]) > tonumber(ARGV[2]) then
+        redis.call('LTRIM', KEYS[2], -tonumber(ARGV[2]), -1)
+        redis.call('SET', KEYS[1], '0')
+    end
+    redis.call('SET', KEYS[3], ARGV[4], 'EX', ARGV[3])
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    redis.call('EXPIRE', KEYS[2], ARGV[3])
+    return 1
+    """
+
+    def __init__(self, client: Any, window: int, ttl: int):
+        self.client = client
+        self.window = window
+        self.ttl = ttl
+        self._append = client.register_script(self.APPEND_SCRIPT)
+
+    @staticmethod
+    def _keys(chat_id: str) -> Tuple[str, str, str]:
+        return f"chat:{chat_id}:meta", f"chat:{chat_id}:recent", f"chat:{chat_id}:tail"
+
+    def get(self, chat_id: str) -> Optional[Window]:
+        meta_key, list_key, _ = self._keys(chat_id)
+        pipe = self.client.pipeline()
+        pipe.get(meta_key)
+        pipe.lrange(list_key, 0, -1)
+        meta, raw = pipe.execute()
+        if meta is None:
+            return None
+        return [json.loads(item) for item in raw], meta == "1"
+
+    def set(self, chat_id: str, messages: List[Dict[str, Any]], complete: bool) -> None:
+        meta_key, list_key, tail_key = self._keys(chat_id)
+        complete = complete and len(messages) <= self.window
+        pipe = self.client.pipeline()
+        pipe.delete(list_key, tail_key)
+        window = messages[-self.window:]
+        if window:
+            pipe.rpush(list_key, *[json.dumps(message, ensure_ascii=False) for message in window])
+            pipe.expire(list_key, self.ttl)
+            pipe.set(tail_key, position_key(window[-1]), ex=self.ttl)
+        pipe.set(meta_key, "1" if complete else "0", ex=self.ttl)
+        pipe.execute()
+
+    def append(self, chat_id: str, message: Dict[str, Any]) -> None:
+        self._append(
+            keys=list(self._keys(chat_id)),
+            args=[json.dumps(message, ensure_ascii=False), self.window, self.ttl, position_key(message)]
+        )
+
+    def invalidate(self, chat_id: str) -> None:
+        self.client.delete(*self._keys(chat_id))
+
+class ConversationCache:
+    """
+    Кэш последних сообщений активных чатов.
+    Пополняется в CRUDChat.add_message, поэтому последующие ходы диалога
+    собирают контекст без обращения к таблице chat_messages.
+    Сообщение, которое старше последнего в окне (параллельные ходы в одном чате),
+    сбрасывает окно, а не дописывается не по порядку.
+    При удалении чатов окна нужно сбрасывать через invalidate.
+    Сбои кэша не ломают запрос - это просто промах.
+    """
+
+    def __init__(self):
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            client = get_redis()
+            if client is not None:
+                self._backend = RedisConversationBackend(
+                    client,
+                    window=settings.CONVERSATION_CACHE_WINDOW,
+                    ttl=settings.CONVERSATION_CACHE_TTL
+                )
+            else:
+                self._backend = InMemoryConversationBackend(
+                    max_chats=settings.CONVERSATION_CACHE_CHATS,
+                    window=settings.CONVERSATION_CACHE_WINDOW,
+                    ttl=settings.CONVERSATION_CACHE_TTL
+                )
+        return self._backend
+
+    @staticmethod
+    def to_entry(message: Any) -> Dict[str, Any]:
+        """
+        Представление сообщения (ORM-объекта или строки запроса) в кэше.
+        """
+        return {
+            "id": str(message.id),
+            "role": message.role,
+            "content": message.content,
+            "created_at": message.created_at.isoformat()
+        }
+
+    def get(self, chat_id: UUID) -> Optional[Window]:
+        try:
+            return self.backend.get(str(chat_id))
+        except Exception as e:
+            logger.warning(f"Conversation cache read failed for chat {chat_id}: {str(e)}")
+            return None
+
+    def fill(self, chat_id: UUID, messages: List[Dict[str, Any]], complete: bool) -> None:
+        try:
+            self.backend.set(str(chat_id), messages, complete)
+        except Exception as e:
+            logger.warning(f"Conversation cache fill failed for chat {chat_id}: {str(e)}")
+
+    def append(self, chat_id: UUID, message: Any) -> None:
+        try:
+            self.backend.append(str(chat_id), self.to_entry(message))
+        except Exception as e:
+            logger.warning(f"Conversation cache append failed for chat {chat_id}: {str(e)}")
+            self.invalidate(chat_id)
+
+    def invalidate(self, chat_id: UUID) -> None:
+        try:
+            self.backend.invalidate(str(chat_id))
+        except Exception as e:
+            logger.warning(f"Conversation cache invalidation failed for chat {chat_id}: {str(e)}")
+
+conversation_cache = ConversationCache()
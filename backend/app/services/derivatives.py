@@ -0,0 +1,70 @@
+import asyncio
+import io
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+from app.core.config import settings
+from app.services.storage import blob_store, StoredBlob
+
+logger = logging.getLogger(__name__)
+
+# Производные изображения: имя -> максимальная сторона в пикселях
+DERIVATIVE_SIZES: Dict[str, int] = {
+    "thumbnail": 256,
+    "preview": 768,
+}
+
+def render_derivatives(data: bytes, sizes: Dict[str, int], quality: int) -> Dict[str, bytes]:
+    """
+    Уменьшенные копии изображения в WebP. Выполняется в отдельном процессе,
+    поэтому функция верхнего уровня и импортирует Pillow сама.
+    """
+    from PIL import Image
+
+    result: Dict[str, bytes] = {}
+    with Image.open(io.BytesIO(data)) as source:
+        source = source.convert("RGB")
+        for name, max_side in sizes.items():
+            image = source.copy()
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, format="WEBP", quality=quality, method=4)
+            result[name] = buffer.getvalue()
+    return result
+
+class DerivativeService:
+    """
+    Миниатюра и превью для галереи.
+    Декодирование и сжатие - CPU-работа, поэтому выполняются в пуле процессов
+    и не блокируют event loop. Файлы кладутся в то же хранилище, что и оригинал.
+    """
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=settings.IMAGE_DERIVATIVE_WORKERS)
+        return self._executor
+
+    async def create(self, data: bytes) -> Dict[str, StoredBlob]:
+        """
+        Построить и сохранить производные изображения. Возвращает {имя: StoredBlob}.
+        """
+        loop = asyncio.get_running_loop()
+        rendered = await loop.run_in_executor(
+            self.executor,
+            render_derivatives,
+            data,
+            DERIVATIVE_SIZES,
+            settings.IMAGE_DERIVATIVE_QUALITY
+        )
+        return {name: await blob_store.put(content, "webp") for name, content in rendered.items()}
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+derivative_service = DerivativeService()
@@ -0,0 +1,199 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Tuple
+from uuid import UUID
+from fastapi import Depends
+from sqlalchemy.orm import Session
+from app.core.auth import get_current_user
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.database import get_db
+from app.crud.images import image
+from app.crud.subscriptions import subscription
+from app.models.user import User
+from app.services.anthropic import anthropic_service
+from app.services.plans import plan_catalog, PlanInfo
+from app.services.quota import quota_engine, QuotaWindow
+from app.services.rollups import usage_rollup_service
+from app.services.subscription_sweeper import subscription_sweeper, SubscriptionEvent
+
+FREE_CHAT_REQUESTS_DAILY = 10  # Бесплатные сообщения в день
+FREE_IMAGE_GENERATIONS_MONTHLY = 5  # Бесплатные генерации изображений в месяц
+FREE_TOOL_CARDS_MONTHLY = 0  # Бесплатные карточки инструментов в месяц
+
+
+@dataclass(frozen=True)
+class Entitlements:
+    """
+    Неизменяемый снимок прав пользователя: план, квоты, использование и доступные модели.
+    Использование (used/remaining) - на момент снимка и только для отображения;
+    списание квот всегда идет через атомарные счетчики QuotaEngine.
+    """
+    user_id: UUID
+    plan: Optional[PlanInfo]
+    subscription_id: Optional[UUID]
+    period_end: Optional[datetime]
+    chat_daily_limit: int
+    image_monthly_limit: int
+    tool_cards_monthly_limit: int
+    chat_used_today: int
+    images_used_this_month: int
+    tool_cards_used_this_month: int
+    allowed_models: Tuple[str, ...]
+    model: str
+    bot_style: str
+
+    @property
+    def plan_name(self) -> Optional[str]:
+        return self.plan.name if self.plan else None
+
+    @property
+    def chat_remaining(self) -> int:
+        return max(0, self.chat_daily_limit - self.chat_used_today)
+
+    @property
+    def images_remaining(self) -> int:
+        return max(0, self.image_monthly_limit - self.images_used_this_month)
+
+    @property
+    def tool_cards_remaining(self) -> int:
+        return max(0, self.tool_cards_monthly_limit - self.tool_cards_used_this_month)
+
+@dataclass(frozen=True)
+class ActiveSubscription:
+    subscription_id: UUID
+    plan: PlanInfo
+    period_end: datetime
+
+class EntitlementsService:
+    """
+    Единая точка определения прав пользователя.
+    Активная подписка и снимок прав кэшируются в памяти процесса с коротким TTL,
+    поэтому все проверки в пределах запроса (и соседних запросов) не ходят в БД повторно.
+    После изменения подписки или настроек пользователя кэш сбрасывается через invalidate;
+    в других воркерах изменения видны не позже чем через ENTITLEMENTS_TTL.
+    """
+
+    def __init__(self):
+        # Значение - кортеж (ActiveSubscription | None,), чтобы кэшировать и отсутствие подписки
+        self._subscriptions: LRUCache[Tuple[Optional[ActiveSubscription]]] = LRUCache(
+            maxsize=settings.ENTITLEMENTS_CACHE_SIZE,
+            ttl=settings.ENTITLEMENTS_TTL
+        )
+        self._snapshots: LRUCache[Entitlements] = LRUCache(
+            maxsize=settings.ENTITLEMENTS_CACHE_SIZE,
+            ttl=settings.ENTITLEMENTS_TTL
+        )
+
+    def active_subscription(self, db: Session, user_id: UUID) -> Optional[ActiveSubscription]:
+        """
+        Активная подписка пользователя с планом из каталога.
+        """
+        key = str(user_id)
+        cached = self._subscriptions.get(key)
+        if cached is not None:
+            return cached[0]
+
+        active = None
+        row = subscription.get_active_subscription_row(db, user_id)
+        if row is not None:
+            plan = plan_catalog.get(row.plan_id, db)
+            if plan is not None:
+                active = ActiveSubscription(
+                    subscription_id=row.id,
+                    plan=plan,
+                    period_end=row.current_period_end
+                )
+        self._subscriptions.set(key, (active,))
+        return active
+
+    def limits(self, db: Session, user_id: UUID) -> Tuple[Optional[PlanInfo], int, int, int]:
+        """
+        План и лимиты пользователя: (plan, chat_daily, image_monthly, tool_cards_monthly).
+        """
+        active = self.active_subscription(db, user_id)
+        if active is None:
+            return None, FREE_CHAT_REQUESTS_DAILY, FREE_IMAGE_GENERATIONS_MONTHLY, FREE_TOOL_CARDS_MONTHLY
+        plan = active.plan
+        return plan, plan.chat_requests_daily, plan.image_generations_monthly, plan.tool_cards_monthly
+
+    async def get(self, db: Session, user: User) -> Entitlements:
+        key = str(user.id)
+        cached = self._snapshots.get(key)
+        if cached is not None:
+            return cached
+        snapshot = await self._build(db, user)
+        self._snapshots.set(key, snapshot)
+        return snapshot
+
+    @staticmethod
+    def allowed_models(plan: Optional[PlanInfo]) -> Tuple[str, ...]:
+        """
+        Модели, доступные на плане (без подписки - на бесплатном), из настройки PLAN_MODELS.
+        """
+        if plan is None:
+            return tuple(settings.PLAN_MODELS.get("free", ()))
+        return tuple(settings.PLAN_MODELS.get(plan.name, settings.PLAN_MODELS.get("default", ())))
+
+    def invalidate(self, user_id: UUID) -> None:
+        key = str(user_id)
+        self._subscriptions.pop(key)
+        self._snapshots.pop(key)
+
+    async def on_subscription_event(self, event: SubscriptionEvent) -> None:
+        self.invalidate(event.user_id)
+
+    async def _build(self, db: Session, user: User) -> Entitlements:
+        active = self.active_subscription(db, user.id)
+        plan, chat_daily_limit, image_monthly_limit, tool_cards_monthly_limit = self.limits(db, user.id)
+        allowed_models = self.allowed_models(plan)
+
+        user_id = str(user.id)
+        day = QuotaWindow.daily()
+        month = QuotaWindow.monthly()
+
+        async def seed_chat() -> int:
+            return usage_rollup_service.count_events(db, "chat", user_id, day.start)
+
+        async def seed_images() -> int:
+            # Как LimitsService.count_image_generations: события плюс незавершенные генерации
+            return (
+                usage_rollup_service.count_events(db, "image", user_id, month.start)
+                + image.count_active_generations(db, user_id, month.start)
+            )
+
+        chat_usage = await quota_engine.peek("chat", user_id, chat_daily_limit, day, seed_chat)
+        image_usage = await quota_engine.peek("image", user_id, image_monthly_limit, month, seed_images)
+        # Карточки инструментов не списываются через QuotaEngine - считаем строки tool_usage за месяц
+        tool_cards_used = usage_rollup_service.count_events(db, "tool", user_id, month.start)
+
+        return Entitlements(
+            user_id=user.id,
+            plan=plan,
+            subscription_id=active.subscription_id if active else None,
+            period_end=active.period_end if active else None,
+            chat_daily_limit=chat_daily_limit,
+            image_monthly_limit=image_monthly_limit,
+            tool_cards_monthly_limit=tool_cards_monthly_limit,
+            chat_used_today=chat_usage.used,
+            images_used_this_month=image_usage.used,
+            tool_cards_used_this_month=tool_cards_used,
+            allowed_models=allowed_models,
+            # Без явного выбора пользователя (или если план его не позволяет) - модель по умолчанию
+            model=user.ai_model if user.ai_model in allowed_models else anthropic_service.default_model,
+            bot_style=user.default_bot_style
+        )
+
+entitlements_service = EntitlementsService()
+
+# Истекшие подписки сбрасывают снимок прав сразу, не дожидаясь TTL
+subscription_sweeper.register_handler(entitlements_service.on_subscription_event)
+
+async def get_entitlements(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+) -> Entitlements:
+    """
+    Зависимость FastAPI: снимок прав текущего пользователя.
+    """
+    return await entitlements_service.get(db, current_user)
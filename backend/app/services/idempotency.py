@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.core.redis import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 255
+
+class IdempotencyService:
+    """
+    Обработка заголовка Idempotency-Key для дорогих POST-запросов.
+    Повтор запроса, пока исходный еще выполняется, дожидается его результата;
+    повтор после завершения получает сохраненный ответ без нового вызова Claude/BFL.
+    Ошибки не сохраняются - после них запрос можно повторить.
+    Без Redis ответы хранятся в памяти процесса, с Redis - общие для всех воркеров;
+    если Redis недоступен, запрос обрабатывается так же, как без него.
+    """
+
+    def __init__(self):
+        self._completed: LRUCache[Tuple[str, Any]] = LRUCache(
+            maxsize=settings.IDEMPOTENCY_CACHE_SIZE,
+            ttl=settings.IDEMPOTENCY_TTL
+        )
+        self._in_flight: Dict[str, Tuple[str, asyncio.Future]] = {}
+
+    @staticmethod
+    def fingerprint(payload: Any) -> str:
+        """
+        Отпечаток тела запроса: тот же ключ с другим телом - ошибка клиента.
+        """
+        raw = json.dumps(jsonable_encoder(payload), sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    async def run(
+        self,
+        *,
+        key: Optional[str],
+        scope: str,
+        payload: Any,
+        func: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, bool]:
+        """
+        Выполнить func не более одного раза для ключа.
+        Возвращает (JSON-совместимый результат, был ли он взят из сохраненного ответа).
+        """
+        if not key:
+            return jsonable_encoder(await func()), False
+        if len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail="Idempotency-Key is too long")
+
+        cache_key = f"idempotency:{scope}:{key}"
+        fingerprint = self.fingerprint(payload)
+
+        stored = await self._get_completed(cache_key)
+        if stored is not None:
+            self._check_fingerprint(stored[0], fingerprint)
+            return stored[1], True
+
+        in_flight = self._in_flight.get(cache_key)
+        if in_flight is not None:
+            self._check_fingerprint(in_flight[0], fingerprint)
+            return await asyncio.shield(in_flight[1]), True
+
+        redis = get_async_redis()
+        lock_key = f"{cache_key}:lock"
+        if redis is not None:
+            try:
+                acquired = await redis.set(lock_key, fingerprint, nx=True, ex=settings.IDEMPOTENCY_LOCK_TIMEOUT)
+            except Exception as e:
+                # Без Redis защищаемся от повторов только в пределах процесса
+                logger.warning(f"Failed to acquire idempotency lock {lock_key}: {str(e)}")
+                redis = None
+            else:
+                if not acquired:
+                    return await self._wait_for_other_worker(cache_key, lock_key, fingerprint), True
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        # Ошибку исходного запроса получают только повторы; без них она не должна теряться с предупреждением
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._in_flight[cache_key] = (fingerprint, future)
+        try:
+            result = jsonable_encoder(await func())
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            await self._set_completed(cache_key, fingerprint, result)
+            return result, False
+        finally:
+            self._in_flight.pop(cache_key, None)
+            if redis is not None:
+                try:
+                    await redis.delete(lock_key)
+                except Exception as e:
+                    # Блокировка истечет сама через IDEMPOTENCY_LOCK_TIMEOUT
+                    logger.warning(f"Failed to release idempotency lock {lock_key}: {str(e)}")
+
+    @staticmethod
+    def _check_fingerprint(stored: str, fingerprint: str) -> None:
+        if stored != fingerprint:
+            raise HTTPException(
+                status_code=422,
+                detail="Idempotency-Key was already used with a different request body"
+            )
+
+    async def _get_completed(self, cache_key: str) -> Optional[Tuple[str, Any]]:
+        redis = get_async_redis()
+        if redis is None:
+            return self._completed.get(cache_key)
+        try:
+            raw = await redis.get(cache_key)
+        except Exception as e:
+            logger.warning(f"Failed to read idempotent response {cache_key}: {str(e)}")
+            return self._completed.get(cache_key)
+        if raw is None:
+            return None
+        stored = json.loads(raw)
+        return stored["fingerprint"], stored["result"]
+
+    async def _set_completed(self, cache_key: str, fingerprint: str, result: Any) -> None:
+        redis = get_async_redis()
+        if redis is None:
+            self._completed.set(cache_key, (fingerprint, result))
+            return
+        try:
+            await redis.set(
+                cache_key,
+                json.dumps({"fingerprint": fingerprint, "result": result}, ensure_ascii=False),
+                ex=settings.IDEMPOTENCY_TTL
+            )
+        except Exception as e:
+            # Сохраняем хотя бы в памяти процесса, чтобы повтор в этот воркер не вызвал func снова
+            logger.warning(f"Failed to store idempotent response {cache_key}: {str(e)}")
+            self._completed.set(cache_key, (fingerprint, result))
+
+    async def _wait_for_other_worker(self, cache_key: str, lock_key: str, fingerprint: str) -> Any:
+        """
+        Исходный запрос выполняется другим воркером - ждем его сохраненный ответ.
+        """
+        redis = get_async_redis()
+        self._check_fingerprint(await redis.get(lock_key) or fingerprint, fingerprint)
+        deadline = time.monotonic() + settings.IDEMPOTENCY_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+            stored = await self._get_completed(cache_key)
+            if stored is not None:
+                self._check_fingerprint(stored[0], fingerprint)
+                return stored[1]
+            if not await redis.exists(lock_key):
+                break
+        raise HTTPException(
+            status_code=409,
+            detail="Original request with this Idempotency-Key did not complete, retry later"
+        )
+
+idempotency_service = IdempotencyService()
@@ -0,0 +1,346 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Dict, Optional, Set
+from urllib.parse import urlencode
+from uuid import UUID
+from fastapi import HTTPException
+from sqlalchemy import func, insert, or_, select, update
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.api_usage import ApiUsage
+from app.models.user_images import UserImage
+from app.schemas.image import VALID_STYLES
+from app.services.bfl import bfl_client, generation_times
+from app.services.jobs import job_runner
+from app.services.limits import limits_service
+from app.services.quota import QuotaWindow
+from app.services.storage import blob_store
+from app.services.derivatives import derivative_service
+from app.services.translations import prompt_translator
+
+logger = logging.getLogger(__name__)
+
+# Статусы, в которых генерация еще не завершена
+ACTIVE_STATUSES = ("pending", "processing")
+
+class ImageJobService:
+    """
+    Генерация изображений в фоне.
+    Эндпоинт создает строку user_images в статусе pending и сразу отвечает,
+    генерация идет в JobRunner: pending -> processing -> completed | failed.
+    Одновременно выполняется не больше IMAGE_JOB_CONCURRENCY генераций,
+    каждая (вместе с ожиданием очереди) ограничена IMAGE_JOB_TIMEOUT секундами.
+    Об изменении статуса ждущие клиенты в этом воркере узнают сразу,
+    в остальных - при следующем чтении статуса из БД.
+    """
+
+    def __init__(self):
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._listeners: Dict[UUID, Set[asyncio.Event]] = {}
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.IMAGE_JOB_CONCURRENCY)
+        return self._semaphore
+
+    def submit(self, image_id: UUID, user_id: UUID, window: QuotaWindow) -> asyncio.Task:
+        """
+        Запустить генерацию для строки image_id. Генерация уже зарезервирована в квоте
+        за период window; при неудаче резерв возвращается.
+        """
+        return job_runner.submit(
+            self._run(image_id, user_id, window),
+            name=f"image-{image_id}"
+        )
+
+    def listen(self, image_id: UUID) -> asyncio.Event:
+        """
+        Событие, которое выставляется при каждой смене статуса image_id в этом воркере.
+        После использования нужно вызвать unlisten.
+        """
+        event = asyncio.Event()
+        self._listeners.setdefault(image_id, set()).add(event)
+        return event
+
+    def unlisten(self, image_id: UUID, event: asyncio.Event) -> None:
+        listeners = self._listeners.get(image_id)
+        if listeners is None:
+            return
+        listeners.discard(event)
+        if not listeners:
+            del self._listeners[image_id]
+
+    def _notify(self, image_id: UUID) -> None:
+        for event in self._listeners.get(image_id, ()):
+            event.set()
+
+    async def _run(self, image_id: UUID, user_id: UUID, window: QuotaWindow) -> None:
+        await self._guard(image_id, user_id, window, self._execute(image_id, user_id))
+
+    async def _guard(
+        self,
+        image_id: UUID,
+        user_id: UUID,
+        window: QuotaWindow,
+        work: Awaitable[None]
+    ) -> None:
+        """
+        Выполнить этап генерации с таймаутом; при ошибке перевести изображение в failed
+        и вернуть зарезервированную генерацию.
+        """
+        succeeded = False
+        try:
+            await asyncio.wait_for(work, timeout=settings.IMAGE_JOB_TIMEOUT)
+            succeeded = True
+        except asyncio.TimeoutError:
+            logger.warning(f"Image job {image_id} timed out")
+            await asyncio.to_thread(self._set_status, image_id, "failed", error="Image generation timed out")
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            logger.error(f"Image job {image_id} failed: {detail}", exc_info=not isinstance(e, HTTPException))
+            await asyncio.to_thread(self._set_status, image_id, "failed", error=str(detail))
+        finally:
+            if not succeeded:
+                # Изображение не получено - возвращаем зарезервированную генерацию
+                await limits_service.release_image_generation(str(user_id), window)
+            self._notify(image_id)
+
+    async def _execute(self, image_id: UUID, user_id: UUID) -> None:
+        async with self.semaphore:
+            row = await asyncio.to_thread(self._start, image_id)
+            if row is None:
+                # Строку удалили, пока задача ждала очереди
+                raise ValueError("Image was deleted before generation started")
+            self._notify(image_id)
+            prompt, style, aspect_ratio = row
+
+            # Переводим промпт если нужно (повторы и вариации берутся из кэша)
+            translated_prompt = await prompt_translator.translate(prompt, str(user_id))
+
+            # Добавляем стиль в промпт если указан
+            final_prompt = translated_prompt
+            if style and style != "БЕЗ_СТИЛЯ":
+                final_prompt = f"{translated_prompt}, {VALID_STYLES[style]}"
+
+            webhook_url = self.webhook_url(image_id)
+            if webhook_url:
+                # Webhook может прийти раньше, чем мы сохраним задачу, - промпт сохраняем до отправки
+                await asyncio.to_thread(self._set_values, image_id, translated_prompt=final_prompt)
+            task_id = await bfl_client.submit(final_prompt, aspect_ratio, webhook_url=webhook_url)
+            if webhook_url:
+                # Дальше генерацию завершит webhook (в любом воркере), слот очереди освобождаем
+                await asyncio.to_thread(self._set_values, image_id, bfl_task_id=task_id)
+                logger.info(f"Image job {image_id} submitted as BFL task {task_id}, waiting for webhook")
+                return
+
+            sample_url = await bfl_client.wait_for_result(task_id, aspect_ratio)
+            await self._finish(image_id, user_id, sample_url, translated_prompt=final_prompt)
+
+    async def _finish(self, image_id: UUID, user_id: UUID, sample_url: str, **values) -> None:
+        """
+        Загрузить готовое изображение, сохранить его с производными и завершить генерацию.
+        """
+        image_bytes = await bfl_client.download(sample_url)
+
+        # В БД сохраняем только ссылку на файл в хранилище
+        blob = await blob_store.put(image_bytes, "png")
+        values.update({
+            "image_url": blob.url,
+            "storage_key": blob.key,
+            "size_bytes": blob.size,
+            "content_hash": blob.sha256
+        })
+        try:
+            derivatives = await derivative_service.create(image_bytes)
+            for name, derivative in derivatives.items():
+                values[f"{name}_url"] = derivative.url
+                values[f"{name}_key"] = derivative.key
+        except Exception as e:
+            # Без миниатюр галерея покажет оригинал
+            logger.warning(f"Image job {image_id}: failed to create derivatives: {str(e)}")
+        await asyncio.to_thread(self._complete, image_id, user_id, values)
+        logger.info(f"Image job {image_id} completed")
+
+    @staticmethod
+    def webhook_url(image_id: UUID) -> Optional[str]:
+        """
+        URL для уведомления BFL о готовности или None, если webhook не настроен.
+        В URL передается id изображения: уведомление может прийти раньше,
+        чем задача BFL будет сохранена в строке.
+        """
+        if not settings.BFL_WEBHOOK_URL or not settings.BFL_WEBHOOK_SECRET:
+            return None
+        query = urlencode({"token": settings.BFL_WEBHOOK_SECRET, "image_id": str(image_id)})
+        return f"{settings.BFL_WEBHOOK_URL}?{query}"
+
+    async def complete_from_webhook(self, payload: Dict[str, Any], image_id: Optional[UUID] = None) -> bool:
+        """
+        Обработать уведомление BFL о задаче. Возвращает False, если задача неизвестна
+        или уже обработана (повторная доставка). Загрузка результата идет в фоне.
+        image_id из URL уведомления; без него (задачи, отправленные до его появления)
+        изображение ищется по задаче BFL.
+        """
+        task_id = payload.get("id") or payload.get("task_id")
+        if not task_id:
+            return False
+        try:
+            sample_url = bfl_client.sample_url(payload)
+            error = None
+            if sample_url is None:
+                # Промежуточный статус - ждем следующего уведомления
+                return True
+        except HTTPException as e:
+            sample_url = None
+            error = str(e.detail)
+
+        row = await asyncio.to_thread(self._claim_task, task_id, image_id)
+        if row is None:
+            return False
+        image_id, user_id, aspect_ratio, created_at, submitted_at = row
+        window = QuotaWindow.monthly(created_at)
+
+        if error is not None:
+            await self._guard(image_id, user_id, window, self._fail(error))
+            return True
+
+        generation_times.observe(aspect_ratio, (datetime.now(timezone.utc) - submitted_at).total_seconds())
+        job_runner.submit(
+            self._guard(image_id, user_id, window, self._finish(image_id, user_id, sample_url)),
+            name=f"image-{image_id}"
+        )
+        return True
+
+    @staticmethod
+    async def _fail(error: str) -> None:
+        raise HTTPException(status_code=500, detail=error)
+
+    @staticmethod
+    def _claim_task(task_id: str, image_id: Optional[UUID]):
+        # Отметка о получении webhook атомарно закрепляет задачу за одним обработчиком.
+        # Время отправки задачи (updated_at до отметки) нужно для статистики времени генерации
+        conditions = [UserImage.status == "processing", UserImage.webhook_received_at.is_(None)]
+        if image_id is not None:
+            conditions += [
+                UserImage.id == image_id,
+                or_(UserImage.bfl_task_id.is_(None), UserImage.bfl_task_id == task_id)
+            ]
+        else:
+            conditions.append(UserImage.bfl_task_id == task_id)
+        submitted = select(
+            UserImage.id,
+            UserImage.updated_at.label("submitted_at")
+        ).where(*conditions).with_for_update().subquery()
+
+        db = SessionLocal()
+        try:
+            row = db.execute(
+                update(UserImage)
+                .where(UserImage.id == submitted.c.id, *conditions)
+                .values(webhook_received_at=func.now(), bfl_task_id=task_id, updated_at=func.now())
+                .returning(
+                    UserImage.id,
+                    UserImage.user_id,
+                    UserImage.aspect_ratio,
+                    UserImage.created_at,
+                    submitted.c.submitted_at
+                )
+            ).first()
+            db.commit()
+            return tuple(row) if row is not None else None
+        finally:
+            db.close()
+
+    @staticmethod
+    def _start(image_id: UUID):
+        db = SessionLocal()
+        try:
+            row = db.execute(
+                update(UserImage)
+                .where(UserImage.id == image_id, UserImage.status == "pending")
+                .values(status="processing", updated_at=func.now())
+                .returning(UserImage.prompt, UserImage.style, UserImage.aspect_ratio)
+            ).first()
+            db.commit()
+            return tuple(row) if row is not None else None
+        finally:
+            db.close()
+
+    @staticmethod
+    def _set_values(image_id: UUID, **values) -> None:
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(UserImage)
+                .where(UserImage.id == image_id, UserImage.status == "processing")
+                .values(updated_at=func.now(), **values)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _complete(image_id: UUID, user_id: UUID, values: Dict[str, Any]) -> None:
+        # Событие использования пишется в той же транзакции, что и смена статуса:
+        # сверка квоты не застанет генерацию ни незавершенной, ни учтенной дважды
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(UserImage)
+                .where(UserImage.id == image_id, UserImage.status.in_(ACTIVE_STATUSES))
+                .values(status="completed", updated_at=func.now(), **values)
+            )
+            # Изображение уже сгенерировано и оплачено - учитываем, даже если строку успели удалить
+            db.execute(insert(ApiUsage).values(
+                user_id=user_id,
+                endpoint="/images/generate/",
+                request_type="image",
+                created_at=func.now()
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _set_status(image_id: UUID, status: str, **values) -> None:
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(UserImage)
+                .where(UserImage.id == image_id, UserImage.status.in_(ACTIVE_STATUSES))
+                .values(status=status, updated_at=func.now(), **values)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    async def fail_stale(self) -> None:
+        """
+        Перевести в failed генерации, брошенные остановленным процессом:
+        в pending/processing дольше IMAGE_JOB_TIMEOUT с запасом.
+        Квоту выравнивает сверка счетчиков - failed-строки в ней не учитываются.
+        """
+        count = await asyncio.to_thread(self._fail_stale)
+        if count:
+            logger.info(f"Image jobs: {count} stale generations marked as failed")
+
+    @staticmethod
+    def _fail_stale() -> int:
+        threshold = datetime.now(timezone.utc) - timedelta(
+            seconds=settings.IMAGE_JOB_TIMEOUT + settings.IMAGE_JOB_SWEEP_INTERVAL
+        )
+        db = SessionLocal()
+        try:
+            result = db.execute(
+                update(UserImage)
+                .where(UserImage.status.in_(ACTIVE_STATUSES), UserImage.updated_at < threshold)
+                .values(status="failed", error="Image generation was interrupted", updated_at=func.now())
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            return result.rowcount
+        finally:
+            db.close()
+
+image_job_service = ImageJobService()
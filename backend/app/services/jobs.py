@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Coroutine, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+class JobRunner:
+    """
+    Запуск фоновых задач внутри процесса, вне пути обработки запроса.
+    Хранит ссылки на задачи, чтобы их не собрал GC, и дожидается их при остановке.
+    """
+
+    def __init__(self):
+        self._tasks: Set[asyncio.Task] = set()
+        self._periodic: Set[asyncio.Task] = set()
+
+    def submit(self, coro: Coroutine[Any, Any, Any], *, name: Optional[str] = None) -> asyncio.Task:
+        """
+        Запустить корутину в фоне. Ошибки логируются, результат задачи в этом случае None.
+        """
+        task = asyncio.create_task(self._run(coro, name), name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, coro: Coroutine[Any, Any, Any], name: Optional[str]) -> Any:
+        try:
+            return await coro
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Background job {name or 'unnamed'} failed: {str(e)}", exc_info=True)
+            return None
+
+    def start_periodic(
+        self,
+        func: Callable[[], Awaitable[Any]],
+        *,
+        interval: float,
+        name: str
+    ) -> asyncio.Task:
+        """
+        Запускать func каждые interval секунд до остановки приложения.
+        """
+        async def loop() -> None:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await func()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Periodic job {name} failed: {str(e)}", exc_info=True)
+
+        task = asyncio.create_task(loop(), name=name)
+        self._periodic.add(task)
+        task.add_done_callback(self._periodic.discard)
+        return task
+
+    async def shutdown(self, timeout: float = 10.0) -> None:
+        """
+        Остановить периодические задачи, дождаться завершения фоновых,
+        по таймауту отменить оставшиеся.
+        """
+        for task in list(self._periodic):
+            task.cancel()
+        if self._periodic:
+            await asyncio.gather(*self._periodic, return_exceptions=True)
+        if not self._tasks:
+            return
+        done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+job_runner = JobRunner()
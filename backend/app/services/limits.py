@@ -1,12 +1,37 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Dict, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.models.chat import ChatMessage
-from app.models.subscription import UserSubscription, SubscriptionPlan
+from app.crud.images import image
+from app.db.session import SessionLocal
 from app.models.tool_usage import ToolUsage
+from app.services.quota import quota_engine, QuotaWindow
+from app.services.usage import usage_recorder, UsageEvent
+from app.services.rollups import usage_rollup_service
+from app.services.entitlements import entitlements_service
 
 class LimitsService:
+    @staticmethod
+    def count_chat_messages(db: Session, user_id: str, since: datetime) -> int:
+        """
+        Фактическое число сообщений пользователя с момента since (начало суток UTC).
+        Читает дневные агрегаты и только хвост chat_messages после последней агрегации.
+        Используется только для заполнения и сверки счетчика квоты.
+        """
+        return usage_rollup_service.count_events(db, "chat", user_id, since)
+
+    @staticmethod
+    def count_image_generations(db: Session, user_id: str, since: datetime) -> int:
+        """
+        Фактическое использование квоты изображений с момента since (начало суток UTC):
+        завершенные генерации по событиям api_usage (удаление изображения их не меняет)
+        плюс еще не завершенные генерации.
+        Используется только для заполнения и сверки счетчика квоты.
+        """
+        return (
+            usage_rollup_service.count_events(db, "image", user_id, since)
+            + image.count_active_generations(db, user_id, since)
+        )
+
     @staticmethod
     async def check_chat_limits(
         db: Session,
@@ -14,57 +39,155 @@ class LimitsService:
         throw_exception: bool = True
     ) -> Dict[str, any]:
         """
-        Проверяет лимиты чата для пользователя.
+        Проверяет лимиты чата для пользователя без списания.
         Возвращает dict с информацией о лимитах и их использовании.
         """
-        # Получаем активную подписку
-        subscription = db.query(UserSubscription).filter(
-            UserSubscription.user_id == user_id,
-            UserSubscription.status == "active",
-            UserSubscription.current_period_end > datetime.utcnow()
-        ).first()
-
-        if not subscription:
-            # Бесплатный план
-            daily_limit = 10  # Бесплатные сообщения в день
+        return await LimitsService._chat_limits(db, user_id, consume=False, throw_exception=throw_exception)
+
+    @staticmethod
+    async def consume_chat_message(
+        db: Session,
+        user_id: str
+    ) -> Dict[str, any]:
+        """
+        Атомарно проверяет дневной лимит и списывает одно сообщение.
+        Если лимит исчерпан - ValueError, счетчик не меняется.
+        """
+        return await LimitsService._chat_limits(db, user_id, consume=True, throw_exception=True)
+
+    @staticmethod
+    async def _chat_limits(
+        db: Session,
+        user_id: str,
+        consume: bool,
+        throw_exception: bool
+    ) -> Dict[str, any]:
+        # Без подписки действуют лимиты бесплатного плана
+        plan, daily_limit, _, _ = entitlements_service.limits(db, user_id)
+        plan_name = plan.name if plan else None
+
+        window = QuotaWindow.daily()
+
+        async def seed() -> int:
+            return LimitsService.count_chat_messages(db, user_id, window.start)
+
+        if consume:
+            result = await quota_engine.consume("chat", user_id, daily_limit, window, seed)
         else:
-            plan = db.query(SubscriptionPlan).filter(
-                SubscriptionPlan.id == subscription.plan_id
-            ).first()
-            daily_limit = plan.chat_requests_daily
-
-        # Считаем использованные сообщения за сегодня
-        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        messages_today = db.query(func.count(ChatMessage.id)).filter(
-            ChatMessage.chat.has(user_id=user_id),
-            ChatMessage.role == "user",
-            ChatMessage.created_at >= today_start
-        ).scalar()
-
-        remaining = max(0, daily_limit - messages_today)
-        
-        if remaining == 0 and throw_exception:
+            result = await quota_engine.peek("chat", user_id, daily_limit, window, seed)
+
+        if not result.allowed and throw_exception:
             raise ValueError("Daily message limit exceeded")
 
         return {
+            "plan_name": plan_name,
             "daily_limit": daily_limit,
-            "messages_today": messages_today,
-            "remaining": remaining,
-            "reset_at": (today_start + timedelta(days=1)).isoformat()
+            "messages_today": result.used,
+            "remaining": result.remaining,
+            "reset_at": result.reset_at.isoformat()
+        }
+
+    @staticmethod
+    async def check_image_limits(db: Session, user_id: str) -> Dict[str, any]:
+        """
+        Месячный лимит генераций изображений без списания.
+        """
+        return await LimitsService._image_limits(db, user_id, QuotaWindow.monthly(), consume=False)
+
+    @staticmethod
+    async def reserve_image_generation(
+        db: Session,
+        user_id: str,
+        window: Optional[QuotaWindow] = None
+    ) -> Dict[str, any]:
+        """
+        Атомарно резервирует одну генерацию из месячного лимита.
+        Если лимит исчерпан - ValueError, счетчик не меняется.
+        Если генерация не удалась, резерв возвращается через release_image_generation
+        с тем же window.
+        """
+        return await LimitsService._image_limits(db, user_id, window or QuotaWindow.monthly(), consume=True)
+
+    @staticmethod
+    async def release_image_generation(user_id: str, window: QuotaWindow) -> None:
+        await quota_engine.release("image", user_id, window)
+
+    @staticmethod
+    async def _image_limits(
+        db: Session,
+        user_id: str,
+        window: QuotaWindow,
+        consume: bool
+    ) -> Dict[str, any]:
+        plan, _, monthly_limit, _ = entitlements_service.limits(db, user_id)
+        plan_name = plan.name if plan else None
+
+        async def seed() -> int:
+            return LimitsService.count_image_generations(db, user_id, window.start)
+
+        if consume:
+            result = await quota_engine.consume("image", user_id, monthly_limit, window, seed)
+            if not result.allowed:
+                raise ValueError("Monthly image generation limit exceeded")
+        else:
+            result = await quota_engine.peek("image", user_id, monthly_limit, window, seed)
+
+        return {
+            "plan_name": plan_name,
+            "monthly_limit": monthly_limit,
+            "images_this_month": result.used,
+            "remaining": result.remaining,
+            "reset_at": result.reset_at.isoformat()
         }
 
+    @staticmethod
+    def _reconcile_image_count(user_id: str, window: QuotaWindow) -> int:
+        db = SessionLocal()
+        try:
+            return LimitsService.count_image_generations(db, user_id, window.start)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _reconcile_chat_count(user_id: str, window: QuotaWindow) -> int:
+        db = SessionLocal()
+        try:
+            return LimitsService.count_chat_messages(db, user_id, window.start)
+        finally:
+            db.close()
+
     @staticmethod
     async def update_usage(
         db: Session,
         user_id: str,
         usage_type: str,
-        amount: int = 1
+        amount: int = 1,
+        endpoint: str = "",
+        tokens_used: Optional[int] = None,
+        ip_address: Optional[str] = None,
+        tool_type: Optional[str] = None,
+        prompt: Optional[str] = None,
+        result: Optional[str] = None
     ):
         """
         Обновляет статистику использования.
         usage_type: 'chat', 'image', 'tool'
+        Событие попадает в буфер и записывается в api_usage (и tool_usage для 'tool')
+        фоновой пакетной вставкой, поэтому запрос не ждет INSERT и commit.
         """
-        # Здесь можно добавить логику для записи статистики
-        pass
+        for _ in range(amount):
+            await usage_recorder.record(UsageEvent(
+                user_id=user_id,
+                usage_type=usage_type,
+                endpoint=endpoint,
+                tokens_used=tokens_used,
+                ip_address=ip_address,
+                tool_type=tool_type,
+                prompt=prompt,
+                result=result
+            ))
 
 limits_service = LimitsService()
+
+quota_engine.register_reconciler("chat", QuotaWindow.daily, LimitsService._reconcile_chat_count)
+quota_engine.register_reconciler("image", QuotaWindow.monthly, LimitsService._reconcile_image_count)
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
-from openai import OpenAI
-from typing import Tuple, Literal
+from openai import AsyncOpenAI
+from typing import Any, Dict, Literal, Optional, Tuple
 from app.core.config import settings
 
 class ChatTitleResponse(BaseModel):
@@ -9,18 +9,41 @@ class ChatTitleResponse(BaseModel):
 
 class OpenAIService:
     def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
+        self.client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY)
         self.model = "gpt-4o-mini"
 
-    async def generate_chat_title(self, content: str, max_length: int = 200) -> Tuple[str, str]:
+    @staticmethod
+    def _usage_to_dict(usage: Any) -> Dict[str, int]:
+        """
+        Счетчики токенов в том же формате, что и у AnthropicService.
+        Закэшированная часть промпта учитывается отдельно от новых входных токенов.
+        """
+        if usage is None:
+            return {}
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) or 0
+        return {
+            "input_tokens": (usage.prompt_tokens or 0) - cached,
+            "output_tokens": usage.completion_tokens or 0,
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": cached
+        }
+
+    async def generate_chat_title(
+        self,
+        content: str,
+        max_length: int = 200,
+        usage: Optional[Dict[str, int]] = None
+    ) -> Tuple[str, str]:
         """
         Генерирует название чата и эмодзи на основе содержимого.
-        Возвращает кортеж (title, emoji)
+        Возвращает кортеж (title, emoji).
+        Если передан словарь usage, в него записываются счетчики токенов запроса.
         """
         try:
             truncated_content = content[:max_length]
             
-            completion = self.client.beta.chat.completions.parse(
+            completion = await self.client.beta.chat.completions.parse(
                 model=self.model,
                 messages=[
                     {"role": "system", "content": "Ты генератор названий для чатов. На основе содержимого генерируй короткое название (до 40 символов) и подбирай один эмодзи из списка: 💼 (работа/бизнес), 🎨 (творчество), 🏠 (дом/быт), 🎯 (хобби/развлечения), 👥 (общение/отношения). Используй русский язык для названия."},
@@ -29,6 +52,9 @@ class OpenAIService:
                 response_format=ChatTitleResponse
             )
             
+            if usage is not None:
+                usage.update(self._usage_to_dict(completion.usage))
+
             result = completion.choices[0].message.parsed
             return result.title, result.emoji
 
@@ -36,4 +62,10 @@ class OpenAIService:
             print(f"Error generating chat title: {str(e)}")
             return "Новый чат", "💭"
 
+    async def close(self) -> None:
+        """
+        Закрыть HTTP-клиент OpenAI (вызывается при остановке приложения).
+        """
+        await self.client.close()
+
 openai_service = OpenAIService()
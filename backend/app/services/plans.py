@@ -0,0 +1,133 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, fields
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional
+from uuid import UUID
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.db.session import SessionLocal
+from app.models.subscription import SubscriptionPlan
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "plans:version"
+
+@dataclass(frozen=True)
+class PlanInfo:
+    """
+    Неизменяемый снимок тарифного плана, не привязанный к сессии БД.
+    """
+    id: UUID
+    name: str
+    display_name: str
+    period_type: str
+    price: Decimal
+    chat_requests_daily: int
+    image_generations_monthly: int
+    tool_cards_monthly: int
+    description: Optional[str]
+    is_active: bool
+    is_trial: bool
+    trial_duration_days: Optional[int]
+    created_at: datetime
+
+    @classmethod
+    def from_model(cls, plan: SubscriptionPlan) -> "PlanInfo":
+        return cls(**{field.name: getattr(plan, field.name) for field in fields(cls)})
+
+class PlanCatalog:
+    """
+    Каталог тарифных планов в памяти процесса.
+    Планы меняются редко, поэтому проверка лимитов и список планов не обращаются к БД.
+    Каталог перечитывается по TTL и после изменения планов; с Redis изменение
+    в одном воркере увеличивает общий номер версии, и остальные воркеры
+    перечитывают каталог при следующей проверке версии.
+    """
+
+    def __init__(self):
+        self._by_id: Dict[UUID, PlanInfo] = {}
+        self._by_name: Dict[str, PlanInfo] = {}
+        self._loaded_at: Optional[float] = None
+        self._version: Optional[str] = None
+        self._version_checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self, db: Optional[Session] = None) -> None:
+        """
+        Загрузить все планы (включая неактивные - на них могут ссылаться подписки).
+        """
+        own_session = db is None
+        if own_session:
+            db = SessionLocal()
+        try:
+            version = self._remote_version()
+            plans = [PlanInfo.from_model(plan) for plan in db.query(SubscriptionPlan).all()]
+        finally:
+            if own_session:
+                db.close()
+
+        with self._lock:
+            self._by_id = {plan.id: plan for plan in plans}
+            self._by_name = {plan.name: plan for plan in plans}
+            self._loaded_at = time.monotonic()
+            self._version = version
+            self._version_checked_at = self._loaded_at
+        logger.info(f"Plan catalog loaded: {len(plans)} plans")
+
+    def invalidate(self) -> None:
+        """
+        Сбросить каталог после изменения планов - в этом и во всех остальных воркерах.
+        """
+        with self._lock:
+            self._loaded_at = None
+        redis = get_redis()
+        if redis is not None:
+            try:
+                redis.incr(VERSION_KEY)
+            except Exception as e:
+                logger.warning(f"Failed to publish plan catalog version: {str(e)}")
+
+    def get(self, plan_id: UUID, db: Optional[Session] = None) -> Optional[PlanInfo]:
+        self._ensure_fresh(db)
+        plan = self._by_id.get(plan_id)
+        if plan is None and db is not None:
+            # План мог появиться в другом воркере до того, как мы увидели новую версию
+            self.load(db)
+            plan = self._by_id.get(plan_id)
+        return plan
+
+    def get_by_name(self, name: str, db: Optional[Session] = None) -> Optional[PlanInfo]:
+        self._ensure_fresh(db)
+        return self._by_name.get(name)
+
+    def active(self, db: Optional[Session] = None) -> List[PlanInfo]:
+        self._ensure_fresh(db)
+        return [plan for plan in self._by_id.values() if plan.is_active]
+
+    def _ensure_fresh(self, db: Optional[Session]) -> None:
+        now = time.monotonic()
+        if self._loaded_at is None or now - self._loaded_at > settings.PLAN_CATALOG_TTL:
+            self.load(db)
+            return
+        if now - self._version_checked_at < settings.PLAN_CATALOG_VERSION_CHECK_INTERVAL:
+            return
+        self._version_checked_at = now
+        if self._remote_version() != self._version:
+            self.load(db)
+
+    @staticmethod
+    def _remote_version() -> Optional[str]:
+        redis = get_redis()
+        if redis is None:
+            return None
+        try:
+            return redis.get(VERSION_KEY)
+        except Exception as e:
+            logger.warning(f"Failed to read plan catalog version: {str(e)}")
+            return None
+
+plan_catalog = PlanCatalog()
@@ -0,0 +1,61 @@
+import logging
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+MILLION = Decimal(1_000_000)
+
+@dataclass(frozen=True)
+class ModelPrice:
+    """
+    Цена модели в долларах за миллион токенов.
+    """
+    input: Decimal
+    output: Decimal
+    cache_write: Decimal
+    cache_read: Decimal
+
+# Прайс-листы Anthropic и OpenAI; при смене цен или моделей обновлять здесь
+MODEL_PRICES: Dict[str, ModelPrice] = {
+    "claude-3-haiku-20240307": ModelPrice(Decimal("0.25"), Decimal("1.25"), Decimal("0.30"), Decimal("0.03")),
+    "claude-3-5-haiku-20241022": ModelPrice(Decimal("0.80"), Decimal("4.00"), Decimal("1.00"), Decimal("0.08")),
+    "claude-3-5-sonnet-20241022": ModelPrice(Decimal("3.00"), Decimal("15.00"), Decimal("3.75"), Decimal("0.30")),
+    "claude-3-opus-20240229": ModelPrice(Decimal("15.00"), Decimal("75.00"), Decimal("18.75"), Decimal("1.50")),
+    "gpt-4o-mini": ModelPrice(Decimal("0.15"), Decimal("0.60"), Decimal("0.15"), Decimal("0.075")),
+}
+
+def total_tokens(usage: Mapping[str, int]) -> int:
+    """
+    Все токены запроса: новые входные, запись и чтение кэша, выходные.
+    """
+    return (
+        usage.get("input_tokens", 0)
+        + usage.get("cache_creation_input_tokens", 0)
+        + usage.get("cache_read_input_tokens", 0)
+        + usage.get("output_tokens", 0)
+    )
+
+def cost_usd(model: Optional[str], usage: Mapping[str, int]) -> Decimal:
+    """
+    Стоимость запроса в долларах по счетчикам токенов (формат AnthropicService.usage_to_dict).
+    Для неизвестной модели - 0 с предупреждением в логе.
+    """
+    price = MODEL_PRICES.get(model or "")
+    if price is None:
+        # Снимки моделей OpenAI приходят с датой в имени (gpt-4o-mini-2024-07-18)
+        price = next(
+            (value for name, value in MODEL_PRICES.items() if model and model.startswith(f"{name}-")),
+            None
+        )
+    if price is None:
+        logger.warning(f"No price for model {model}, cost recorded as 0")
+        return Decimal(0)
+    cost = (
+        usage.get("input_tokens", 0) * price.input
+        + usage.get("output_tokens", 0) * price.output
+        + usage.get("cache_creation_input_tokens", 0) * price.cache_write
+        + usage.get("cache_read_input_tokens", 0) * price.cache_read
+    ) / MILLION
+    return cost.quantize(Decimal("0.000001"))
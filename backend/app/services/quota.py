@@ -0,0 +1,304 @@
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from app.core.redis import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# Возвращает фактическое использование за период из БД (для заполнения и сверки счетчика)
+SeedFunc = Callable[[], Awaitable[int]]
+
+@dataclass(frozen=True)
+class QuotaWindow:
+    """
+    Период квоты: идентификатор периода, начало и момент сброса (UTC).
+    """
+    period: str
+    start: datetime
+    reset_at: datetime
+
+    @property
+    def ttl(self) -> int:
+        # Счетчик живет до конца периода плюс запас, чтобы сверка успела его прочитать
+        remaining = (self.reset_at - datetime.now(timezone.utc)).total_seconds()
+        return max(1, int(remaining)) + 3600
+
+    @classmethod
+    def daily(cls, now: Optional[datetime] = None) -> "QuotaWindow":
+        now = now or datetime.now(timezone.utc)
+        start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        return cls(period=start.strftime("%Y-%m-%d"), start=start, reset_at=start + timedelta(days=1))
+
+    @classmethod
+    def monthly(cls, now: Optional[datetime] = None) -> "QuotaWindow":
+        now = now or datetime.now(timezone.utc)
+        start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        reset_at = (start + timedelta(days=32)).replace(day=1)
+        return cls(period=start.strftime("%Y-%m"), start=start, reset_at=reset_at)
+
+# Подсчет фактического использования пользователя за период для сверки.
+# Синхронный: сверка выполняет его в отдельном потоке
+CountFunc = Callable[[str, QuotaWindow], int]
+
+@dataclass(frozen=True)
+class QuotaResult:
+    allowed: bool
+    used: int
+    limit: int
+    reset_at: datetime
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.limit - self.used)
+
+class InMemoryQuotaBackend:
+    """
+    Счетчики в памяти процесса - для разработки и одного воркера.
+    """
+
+    def __init__(self):
+        self._counters: Dict[str, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def _current(self, key: str) -> Optional[int]:
+        item = self._counters.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            del self._counters[key]
+            return None
+        return value
+
+    async def get(self, key: str) -> Optional[int]:
+        with self._lock:
+            return self._current(key)
+
+    async def seed(self, key: str, value: int, ttl: int) -> None:
+        with self._lock:
+            if self._current(key) is None:
+                self._counters[key] = (value, time.monotonic() + ttl)
+
+    async def set(self, key: str, value: int, ttl: int) -> None:
+        with self._lock:
+            self._counters[key] = (value, time.monotonic() + ttl)
+
+    async def compare_and_set(self, key: str, expected: int, value: int) -> bool:
+        with self._lock:
+            if self._current(key) != expected:
+                return False
+            self._counters[key] = (value, self._counters[key][1])
+            return True
+
+    async def try_lock(self, name: str, ttl: int) -> bool:
+        # Один процесс - сверку некому выполнять параллельно
+        return True
+
+    async def consume(self, key: str, amount: int, limit: int) -> Tuple[Optional[bool], int]:
+        with self._lock:
+            current = self._current(key)
+            if current is None:
+                return None, 0
+            if current + amount > limit:
+                return False, current
+            self._counters[key] = (current + amount, self._counters[key][1])
+            return True, current + amount
+
+    async def release(self, key: str, amount: int) -> None:
+        with self._lock:
+            current = self._current(key)
+            if current is not None:
+                self._counters[key] = (max(0, current - amount), self._counters[key][1])
+
+    async def keys(self, pattern_suffix: str) -> List[str]:
+        with self._lock:
+            return [key for key in self._counters if key.endswith(pattern_suffix)]
+
+class RedisQuotaBackend:
+    """
+    Счетчики в Redis, общие для всех воркеров. Проверка и увеличение - один Lua-скрипт.
+    """
+
+    CONSUME_SCRIPT = """
+    local current = redis.call('GET', KEYS[1])
+    if not current then
+        return {-1, 0}
+    end
+    current = tonumber(current)
+    if current + tonumber(ARGV[1]) > tonumber(ARGV[2]) then
+        return {0, current}
+    end
+    return {1, redis.call('INCRBY', KEYS[1], ARGV[1])}
+    """
+
+    RELEASE_SCRIPT = """
+    local current = redis.call('GET', KEYS[1])
+    if current and tonumber(current) > 0 then
+        return redis.call('DECRBY', KEYS[1], math.min(tonumber(current), tonumber(ARGV[1])))
+    end
+    return 0
+    """
+
+    COMPARE_AND_SET_SCRIPT = """
+    local current = redis.call('GET', KEYS[1])
+    if not current or tonumber(current) ~= tonumber(ARGV[1]) then
+        return 0
+    end
+    redis.call('SET', KEYS[1], ARGV[2], 'KEEPTTL')
+    return 1
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._consume = client.register_script(self.CONSUME_SCRIPT)
+        self._release = client.register_script(self.RELEASE_SCRIPT)
+        self._compare_and_set = client.register_script(self.COMPARE_AND_SET_SCRIPT)
+
+    async def get(self, key: str) -> Optional[int]:
+        value = await self.client.get(key)
+        return int(value) if value is not None else None
+
+    async def seed(self, key: str, value: int, ttl: int) -> None:
+        await self.client.set(key, value, ex=ttl, nx=True)
+
+    async def set(self, key: str, value: int, ttl: int) -> None:
+        await self.client.set(key, value, ex=ttl)
+
+    async def consume(self, key: str, amount: int, limit: int) -> Tuple[Optional[bool], int]:
+        status, value = await self._consume(keys=[key], args=[amount, limit])
+        if int(status) < 0:
+            return None, 0
+        return bool(int(status)), int(value)
+
+    async def release(self, key: str, amount: int) -> None:
+        await self._release(keys=[key], args=[amount])
+
+    async def compare_and_set(self, key: str, expected: int, value: int) -> bool:
+        return bool(int(await self._compare_and_set(keys=[key], args=[expected, value])))
+
+    async def try_lock(self, name: str, ttl: int) -> bool:
+        return bool(await self.client.set(name, "1", nx=True, ex=ttl))
+
+    async def keys(self, pattern_suffix: str) -> List[str]:
+        return [key async for key in self.client.scan_iter(match=f"quota:*{pattern_suffix}", count=500)]
+
+class QuotaEngine:
+    """
+    Квоты на основе счетчиков по пользователю и периоду.
+    Проверка и списание атомарны и не зависят от объема истории пользователя.
+    При отсутствии счетчика он один раз заполняется фактическим значением из БД,
+    а фоновая сверка периодически выравнивает счетчики с БД.
+    """
+
+    # Блокировка сверки: за один интервал ее выполняет только один воркер
+    RECONCILE_LOCK = "quota-reconcile:lock"
+
+    def __init__(self):
+        self._backend = None
+        self._reconcilers: Dict[str, Tuple[Callable[[], QuotaWindow], CountFunc]] = {}
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            client = get_async_redis()
+            self._backend = RedisQuotaBackend(client) if client is not None else InMemoryQuotaBackend()
+        return self._backend
+
+    @staticmethod
+    def key(kind: str, user_id: str, window: QuotaWindow) -> str:
+        return f"quota:{kind}:{user_id}:{window.period}"
+
+    async def _ensure_seeded(self, key: str, window: QuotaWindow, seed: SeedFunc) -> None:
+        if await self.backend.get(key) is None:
+            await self.backend.seed(key, await seed(), window.ttl)
+
+    async def peek(
+        self,
+        kind: str,
+        user_id: str,
+        limit: int,
+        window: QuotaWindow,
+        seed: SeedFunc
+    ) -> QuotaResult:
+        """
+        Текущее использование без списания.
+        """
+        key = self.key(kind, user_id, window)
+        used = await self.backend.get(key)
+        if used is None:
+            used = await seed()
+            await self.backend.seed(key, used, window.ttl)
+        return QuotaResult(allowed=used < limit, used=used, limit=limit, reset_at=window.reset_at)
+
+    async def consume(
+        self,
+        kind: str,
+        user_id: str,
+        limit: int,
+        window: QuotaWindow,
+        seed: SeedFunc,
+        amount: int = 1
+    ) -> QuotaResult:
+        """
+        Атомарно проверить квоту и списать amount. Если квоты не хватает, ничего не списывается.
+        """
+        key = self.key(kind, user_id, window)
+        allowed, used = await self.backend.consume(key, amount, limit)
+        if allowed is None:
+            await self._ensure_seeded(key, window, seed)
+            allowed, used = await self.backend.consume(key, amount, limit)
+        return QuotaResult(allowed=bool(allowed), used=used, limit=limit, reset_at=window.reset_at)
+
+    async def release(self, kind: str, user_id: str, window: QuotaWindow, amount: int = 1) -> None:
+        """
+        Вернуть ранее списанную квоту (например, если операция не удалась).
+        """
+        await self.backend.release(self.key(kind, user_id, window), amount)
+
+    def register_reconciler(
+        self,
+        kind: str,
+        window_factory: Callable[[], QuotaWindow],
+        count: CountFunc
+    ) -> None:
+        """
+        Зарегистрировать подсчет фактического использования для периодической сверки.
+        """
+        self._reconcilers[kind] = (window_factory, count)
+
+    async def reconcile(self, lock_ttl: int = 60) -> None:
+        """
+        Сверить счетчики текущего периода с БД и исправить расхождения.
+        Выполняется одним воркером за раз (блокировка на lock_ttl секунд).
+        Значение счетчика читается до подсчета и заменяется только если не изменилось
+        за время подсчета: списания и возвраты, прошедшие параллельно, не теряются,
+        а такой счетчик сверяется в следующий раз.
+        """
+        if not await self.backend.try_lock(self.RECONCILE_LOCK, lock_ttl):
+            return
+        for kind, (window_factory, count) in self._reconcilers.items():
+            window = window_factory()
+            prefix = f"quota:{kind}:"
+            for key in await self.backend.keys(f":{window.period}"):
+                if not key.startswith(prefix):
+                    continue
+                user_id = key[len(prefix):-(len(window.period) + 1)]
+                try:
+                    current = await self.backend.get(key)
+                    if current is None:
+                        continue
+                    actual = await asyncio.to_thread(count, user_id, window)
+                    if current == actual:
+                        continue
+                    if await self.backend.compare_and_set(key, current, actual):
+                        logger.info(f"Quota {key} reconciled: {current} -> {actual}")
+                    else:
+                        logger.debug(f"Quota {key} changed during reconciliation, skipped")
+                except Exception as e:
+                    logger.warning(f"Quota reconciliation failed for {key}: {str(e)}")
+
+quota_engine = QuotaEngine()
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict
+from sqlalchemy import Select, case, func, literal, select, true, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.api_usage import ApiUsage
+from app.models.chat import Chat, ChatMessage
+from app.models.tool_usage import ToolUsage
+from app.models.usage_rollup import UsageDailyRollup, UsageRollupWatermark
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class RollupSource:
+    """
+    Таблица-источник агрегатов.
+    query возвращает select со столбцами user_id, model, event (0/1), tokens и cost
+    для каждой строки источника.
+    """
+    name: str
+    usage_type: str
+    model: Any
+    query: Callable[[], Select]
+
+SOURCES: Dict[str, RollupSource] = {
+    source.usage_type: source
+    for source in (
+        RollupSource(
+            name="chat_messages",
+            usage_type="chat",
+            model=ChatMessage,
+            # Событием считается сообщение пользователя, токены - по всем сообщениям
+            # Стоимость ответов считается по вызовам модели (источник api_usage)
+            query=lambda: select(
+                Chat.user_id.label("user_id"),
+                literal("").label("model"),
+                case((ChatMessage.role == "user", 1), else_=0).label("event"),
+                func.coalesce(ChatMessage.tokens_used, 0).label("tokens"),
+                literal(0).label("cost")
+            ).join(Chat, Chat.id == ChatMessage.chat_id)
+        ),
+        RollupSource(
+            name="api_usage_images",
+            usage_type="image",
+            model=ApiUsage,
+            # Завершенные генерации. В отличие от user_images, api_usage только дополняется:
+            # удаление изображения не уменьшает использованную квоту
+            query=lambda: select(
+                ApiUsage.user_id.label("user_id"),
+                literal("").label("model"),
+                literal(1).label("event"),
+                literal(0).label("tokens"),
+                literal(0).label("cost")
+            ).where(ApiUsage.request_type == "image", ApiUsage.user_id.isnot(None))
+        ),
+        RollupSource(
+            name="tool_usage",
+            usage_type="tool",
+            model=ToolUsage,
+            query=lambda: select(
+                ToolUsage.user_id.label("user_id"),
+                literal("").label("model"),
+                literal(1).label("event"),
+                func.coalesce(ToolUsage.tokens_used, 0).label("tokens"),
+                literal(0).label("cost")
+            )
+        ),
+        RollupSource(
+            name="api_usage",
+            usage_type="llm",
+            model=ApiUsage,
+            # Вызовы LLM (ответы в чате, названия, переводы, пересказы) по моделям
+            query=lambda: select(
+                ApiUsage.user_id.label("user_id"),
+                ApiUsage.model.label("model"),
+                literal(1).label("event"),
+                func.coalesce(ApiUsage.tokens_used, 0).label("tokens"),
+                func.coalesce(ApiUsage.cost_usd, 0).label("cost")
+            ).where(ApiUsage.model.isnot(None), ApiUsage.user_id.isnot(None))
+        ),
+    )
+}
+
+class UsageRollupService:
+    """
+    Инкрементальная агрегация использования в usage_daily_rollups.
+    Для каждого источника хранится водяная метка (created_at, id) последней учтенной строки;
+    за проход обрабатывается не больше ROLLUP_BATCH_SIZE новых строк, агрегаты
+    и метка обновляются в одной транзакции. Строки моложе ROLLUP_LAG секунд
+    не берутся, чтобы не пропустить транзакции, закоммиченные с более ранним created_at.
+    """
+
+    async def run(self) -> None:
+        for source in SOURCES.values():
+            for _ in range(settings.ROLLUP_MAX_BATCHES):
+                has_more = await asyncio.to_thread(self._process_batch, source)
+                if not has_more:
+                    break
+
+    @staticmethod
+    def _keyset_after(source: RollupSource, watermark: UsageRollupWatermark):
+        model = source.model
+        if watermark.last_created_at is None:
+            return true()
+        return tuple_(model.created_at, model.id) > tuple_(watermark.last_created_at, watermark.last_id)
+
+    def _process_batch(self, source: RollupSource) -> bool:
+        """
+        Учесть следующую порцию строк источника. Возвращает True, если остались еще строки.
+        """
+        model = source.model
+        db = SessionLocal()
+        try:
+            db.execute(
+                insert(UsageRollupWatermark).values(source=source.name).on_conflict_do_nothing(
+                    index_elements=["source"]
+                )
+            )
+            # Параллельный проход другого воркера держит метку - пропускаем
+            watermark = db.query(UsageRollupWatermark).filter(
+                UsageRollupWatermark.source == source.name
+            ).with_for_update(skip_locked=True).first()
+            if watermark is None:
+                db.rollback()
+                return False
+
+            cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.ROLLUP_LAG)
+            pending = select(model.created_at, model.id).where(
+                self._keyset_after(source, watermark),
+                model.created_at < cutoff
+            )
+            boundary = db.execute(
+                pending.order_by(model.created_at, model.id)
+                .offset(settings.ROLLUP_BATCH_SIZE - 1).limit(1)
+            ).first()
+            has_more = boundary is not None
+            if boundary is None:
+                boundary = db.execute(
+                    pending.order_by(model.created_at.desc(), model.id.desc()).limit(1)
+                ).first()
+            if boundary is None:
+                db.rollback()
+                return False
+
+            rows = source.query().add_columns(
+                func.date(func.timezone("UTC", model.created_at)).label("day")
+            ).where(
+                self._keyset_after(source, watermark),
+                tuple_(model.created_at, model.id) <= tuple_(boundary.created_at, boundary.id)
+            ).subquery()
+            aggregated = select(
+                rows.c.user_id,
+                rows.c.day,
+                literal(source.usage_type),
+                rows.c.model,
+                func.sum(rows.c.event),
+                func.sum(rows.c.tokens),
+                func.sum(rows.c.cost)
+            ).group_by(rows.c.user_id, rows.c.day, rows.c.model)
+
+            stmt = insert(UsageDailyRollup).from_select(
+                ["user_id", "day", "usage_type", "model", "events", "tokens", "cost_usd"],
+                aggregated,
+                include_defaults=False
+            )
+            db.execute(stmt.on_conflict_do_update(
+                constraint="uq_usage_daily_rollups_user_day_type_model",
+                set_={
+                    "events": UsageDailyRollup.events + stmt.excluded.events,
+                    "tokens": UsageDailyRollup.tokens + stmt.excluded.tokens,
+                    "cost_usd": UsageDailyRollup.cost_usd + stmt.excluded.cost_usd,
+                    "updated_at": func.now()
+                }
+            ))
+
+            watermark.last_created_at = boundary.created_at
+            watermark.last_id = boundary.id
+            db.commit()
+            return has_more
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def count_events(db: Session, usage_type: str, user_id: str, since: datetime) -> int:
+        """
+        Число событий пользователя с начала дня since (полночь UTC) по текущий момент:
+        агрегаты по учтенным строкам плюс строки источника после водяной метки.
+        """
+        source = SOURCES[usage_type]
+        model = source.model
+        watermark = db.query(UsageRollupWatermark).filter(
+            UsageRollupWatermark.source == source.name
+        ).first()
+
+        rolled_up = 0
+        if watermark is not None and watermark.last_created_at is not None:
+            rolled_up = db.query(func.coalesce(func.sum(UsageDailyRollup.events), 0)).filter(
+                UsageDailyRollup.user_id == user_id,
+                UsageDailyRollup.usage_type == usage_type,
+                UsageDailyRollup.day >= since.date()
+            ).scalar()
+
+        tail = source.query().where(model.created_at >= since)
+        if watermark is not None:
+            tail = tail.where(UsageRollupService._keyset_after(source, watermark))
+        tail = tail.subquery()
+        recent = db.execute(
+            select(func.coalesce(func.sum(tail.c.event), 0)).where(tail.c.user_id == user_id)
+        ).scalar()
+        return int(rolled_up) + int(recent)
+
+usage_rollup_service = UsageRollupService()
@@ -0,0 +1,177 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from app.core.config import settings
+
+@dataclass(frozen=True)
+class StoredBlob:
+    """
+    Сохраненный объект: ключ в хранилище, публичный URL, размер и sha256 содержимого.
+    """
+    key: str
+    url: str
+    size: int
+    sha256: str
+
+class BlobStore(ABC):
+    """
+    Интерфейс хранилища файлов с адресацией по содержимому.
+    Ключ объекта - sha256 содержимого, поэтому одинаковые файлы хранятся один раз,
+    а запись идемпотентна. Повторная запись существующего объекта обновляет время
+    его изменения: на этом держится сборка мусора (app/services/blob_gc.py).
+    Реализации: локальная ФС; S3-совместимое хранилище подключается отдельным
+    классом с тем же интерфейсом.
+    """
+
+    @staticmethod
+    def make_key(sha256: str, extension: str) -> str:
+        # Двухуровневое шардирование, чтобы в одном каталоге не было миллионов файлов
+        return f"{sha256[:2]}/{sha256[2:4]}/{sha256}.{extension}"
+
+    @staticmethod
+    def extension(key: str) -> str:
+        return key.rsplit(".", 1)[-1]
+
+    async def put(self, data: bytes, extension: str) -> StoredBlob:
+        sha256 = hashlib.sha256(data).hexdigest()
+        key = self.make_key(sha256, extension)
+        await self._write(key, data)
+        return StoredBlob(key=key, url=self.url(key), size=len(data), sha256=sha256)
+
+    @abstractmethod
+    async def _write(self, key: str, data: bytes) -> None:
+        ...
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    async def list_keys(self, prefix: str) -> List[Tuple[str, float]]:
+        """
+        Объекты первого уровня шардирования prefix ("00".."ff"):
+        список (ключ, время изменения в секундах Unix).
+        """
+        ...
+
+    @abstractmethod
+    async def delete_if_older(self, key: str, before: float) -> bool:
+        """
+        Удалить объект, если он не менялся (и не записывался повторно) с момента before.
+        Возвращает True, если объект удален.
+        """
+        ...
+
+    @abstractmethod
+    def url(self, key: str) -> str:
+        ...
+
+class LocalBlobStore(BlobStore):
+    """
+    Файлы в каталоге MEDIA_ROOT, раздаются приложением (или прокси) по MEDIA_URL.
+    """
+
+    def __init__(self, root: str, base_url: str):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/")
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+    async def _write(self, key: str, data: bytes) -> None:
+        await asyncio.to_thread(self._write_sync, self._path(key), data)
+
+    @staticmethod
+    def _write_sync(path: str, data: bytes) -> None:
+        if os.path.exists(path):
+            # То же содержимое уже сохранено - только отмечаем, что файл снова используется
+            try:
+                os.utime(path)
+                return
+            except FileNotFoundError:
+                # Файл успела удалить сборка мусора - записываем заново
+                pass
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Пишем во временный файл и переименовываем: читатели не увидят недописанный файл
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self._read_sync, self._path(key))
+
+    @staticmethod
+    def _read_sync(path: str) -> Optional[bytes]:
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    async def exists(self, key: str) -> bool:
+        return await asyncio.to_thread(os.path.exists, self._path(key))
+
+    async def delete(self, key: str) -> None:
+        path = self._path(key)
+        try:
+            await asyncio.to_thread(os.remove, path)
+        except FileNotFoundError:
+            pass
+
+    async def list_keys(self, prefix: str) -> List[Tuple[str, float]]:
+        return await asyncio.to_thread(self._list_sync, prefix)
+
+    def _list_sync(self, prefix: str) -> List[Tuple[str, float]]:
+        result: List[Tuple[str, float]] = []
+        for directory, _, files in os.walk(os.path.join(self.root, prefix)):
+            relative = os.path.relpath(directory, self.root).replace(os.sep, "/")
+            for name in files:
+                try:
+                    modified_at = os.stat(os.path.join(directory, name)).st_mtime
+                except FileNotFoundError:
+                    continue
+                result.append((f"{relative}/{name}", modified_at))
+        return result
+
+    async def delete_if_older(self, key: str, before: float) -> bool:
+        return await asyncio.to_thread(self._delete_if_older_sync, self._path(key), before)
+
+    @staticmethod
+    def _delete_if_older_sync(path: str, before: float) -> bool:
+        try:
+            if os.stat(path).st_mtime >= before:
+                return False
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+def create_blob_store() -> BlobStore:
+    if settings.STORAGE_BACKEND == "local":
+        return LocalBlobStore(settings.MEDIA_ROOT, settings.MEDIA_URL)
+    raise ValueError(f"Unknown storage backend: {settings.STORAGE_BACKEND}")
+
+blob_store = create_blob_store()
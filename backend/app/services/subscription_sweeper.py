@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Awaitable, Callable, List
+from uuid import UUID
+from sqlalchemy import case, func, select, update
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.subscription import UserSubscription
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class SubscriptionEvent:
+    """
+    Событие жизненного цикла подписки.
+    type: 'canceled' - период закончился после отмены пользователем,
+    'renewal_due' - период закончился, подписку нужно продлить у платежного провайдера.
+    """
+    type: str
+    subscription_id: UUID
+    user_id: UUID
+    plan_id: UUID
+    period_end: datetime
+
+EventHandler = Callable[[SubscriptionEvent], Awaitable[None]]
+
+class SubscriptionSweeper:
+    """
+    Фоновый перевод истекших подписок из статуса active.
+    Подписки с cancel_at_period_end получают статус canceled, остальные - expired
+    с событием renewal_due. Подписки обрабатываются пачками по SUBSCRIPTION_SWEEP_BATCH
+    с FOR UPDATE SKIP LOCKED, поэтому несколько воркеров не мешают друг другу.
+    """
+
+    def __init__(self):
+        self._handlers: List[EventHandler] = []
+
+    def register_handler(self, handler: EventHandler) -> None:
+        """
+        Подписаться на события истечения подписок (например, для продления у провайдера).
+        """
+        self._handlers.append(handler)
+
+    async def sweep(self) -> None:
+        total = 0
+        while True:
+            events = await asyncio.to_thread(self._expire_batch)
+            total += len(events)
+            for event in events:
+                await self._emit(event)
+            if len(events) < settings.SUBSCRIPTION_SWEEP_BATCH:
+                break
+        if total:
+            logger.info(f"Subscription sweep: {total} subscriptions expired")
+
+    @staticmethod
+    def _expire_batch() -> List[SubscriptionEvent]:
+        db = SessionLocal()
+        try:
+            expired = select(UserSubscription.id).where(
+                UserSubscription.status == "active",
+                UserSubscription.current_period_end <= func.now()
+            ).order_by(UserSubscription.current_period_end).limit(
+                settings.SUBSCRIPTION_SWEEP_BATCH
+            ).with_for_update(skip_locked=True).scalar_subquery()
+
+            rows = db.execute(
+                update(UserSubscription)
+                .where(UserSubscription.id.in_(expired))
+                .values(
+                    status=case(
+                        (UserSubscription.cancel_at_period_end.is_(True), "canceled"),
+                        else_="expired"
+                    ),
+                    updated_at=func.now()
+                )
+                .returning(
+                    UserSubscription.id,
+                    UserSubscription.user_id,
+                    UserSubscription.plan_id,
+                    UserSubscription.status,
+                    UserSubscription.current_period_end
+                )
+                .execution_options(synchronize_session=False)
+            ).all()
+            db.commit()
+        finally:
+            db.close()
+
+        return [
+            SubscriptionEvent(
+                type="canceled" if row.status == "canceled" else "renewal_due",
+                subscription_id=row.id,
+                user_id=row.user_id,
+                plan_id=row.plan_id,
+                period_end=row.current_period_end
+            )
+            for row in rows
+        ]
+
+    async def _emit(self, event: SubscriptionEvent) -> None:
+        logger.info(f"Subscription {event.subscription_id} of user {event.user_id}: {event.type}")
+        for handler in self._handlers:
+            try:
+                await handler(event)
+            except Exception as e:
+                logger.error(f"Subscription event handler failed for {event.subscription_id}: {str(e)}", exc_info=True)
+
+subscription_sweeper = SubscriptionSweeper()
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from typing import Optional, Set
+from uuid import UUID
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.crud.chats import chat
+from app.services.anthropic import anthropic_service
+from app.services.jobs import job_runner
+from app.services.usage import usage_recorder
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_PROMPT = (
+    "Ты ведешь краткий пересказ длинного диалога пользователя с ассистентом. "
+    "Обнови пересказ с учетом новых реплик: сохрани факты о пользователе, принятые решения, "
+    "договоренности и открытые вопросы, опусти приветствия и повторы. "
+    "Пиши по-русски, в третьем лице, не длиннее 300 слов. В ответ пришли только обновленный пересказ."
+)
+
+class ChatSummaryService:
+    """
+    Скользящий пересказ длинных чатов.
+    Когда непересказанных сообщений становится больше порога, самые старые из них
+    (кроме последних SUMMARY_KEEP_RECENT) вливаются в сохраненный пересказ.
+    Работает в фоне после хода диалога, так что размер промпта остается ровным.
+    """
+
+    def __init__(self):
+        self._in_progress: Set[UUID] = set()
+
+    def schedule(self, chat_id: UUID, user_id: UUID) -> Optional[asyncio.Task]:
+        """
+        Запустить обновление пересказа в фоне, если для чата оно еще не идет.
+        user_id - владелец чата, на него записывается стоимость вызова модели.
+        """
+        if chat_id in self._in_progress:
+            return None
+        self._in_progress.add(chat_id)
+        task = job_runner.submit(self._update(chat_id, user_id), name=f"chat-summary-{chat_id}")
+        task.add_done_callback(lambda _: self._in_progress.discard(chat_id))
+        return task
+
+    async def _update(self, chat_id: UUID, user_id: UUID) -> None:
+        db = SessionLocal()
+        try:
+            summary = chat.get_summary(db, chat_id)
+            after = (summary.summarized_until, summary.last_message_id) if summary else None
+
+            keep = settings.SUMMARY_KEEP_RECENT
+            rows = chat.get_messages_after(
+                db,
+                chat_id,
+                after=after,
+                limit=settings.SUMMARY_TRIGGER_MESSAGES + keep
+            )
+            if len(rows) < settings.SUMMARY_TRIGGER_MESSAGES + keep:
+                return
+
+            # Последние keep сообщений остаются в контексте как есть
+            to_fold = rows[:-keep]
+            transcript = "\n\n".join(
+                f"{'Пользователь' if row.role == 'user' else 'Ассистент'}: {row.content}"
+                for row in to_fold
+            )
+            previous = summary.summary if summary else "(пересказа пока нет)"
+
+            response = await anthropic_service.send_message(
+                messages=[{
+                    "role": "user",
+                    "content": f"Текущий пересказ:\n{previous}\n\nНовые реплики:\n{transcript}"
+                }],
+                system=SUMMARY_SYSTEM_PROMPT,
+                max_tokens=settings.SUMMARY_MAX_TOKENS,
+                temperature=0.3,
+                model=settings.SUMMARY_MODEL
+            )
+            await usage_recorder.record_llm_call(str(user_id), "summary", response["model"], response["usage"])
+
+            last = to_fold[-1]
+            chat.save_summary(
+                db,
+                chat_id=chat_id,
+                summary=response["content"][0]["text"],
+                summarized_until=last.created_at,
+                last_message_id=last.id,
+                messages_added=len(to_fold)
+            )
+            logger.info(f"Chat {chat_id}: folded {len(to_fold)} messages into summary")
+        finally:
+            db.close()
+
+chat_summary_service = ChatSummaryService()
@@ -0,0 +1,149 @@
+import asyncio
+import hashlib
+import logging
+import re
+from typing import Dict, Optional
+from sqlalchemy import func, update
+from sqlalchemy.dialects.postgresql import insert
+from app.core.cache import LRUCache
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.prompt_translation import PromptTranslation
+from app.services.anthropic import anthropic_service
+from app.services.usage import usage_recorder
+
+logger = logging.getLogger(__name__)
+
+# Меняется вместе с инструкцией перевода, чтобы старые переводы не использовались
+TRANSLATION_VERSION = "v1"
+
+def is_english(text: str) -> bool:
+    try:
+        # Проверяем, содержит ли текст русские буквы
+        russian_pattern = re.compile('[а-яА-Я]')
+        return not bool(russian_pattern.search(text))
+    except Exception:
+        return False
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Промпт без различий в регистре, пробелах и финальной пунктуации:
+    такие варианты переводятся одинаково.
+    """
+    return re.sub(r"\s+", " ", prompt).strip().rstrip(".!?…").strip().casefold()
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(f"{TRANSLATION_VERSION}:{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+class PromptTranslator:
+    """
+    Перевод промптов генерации изображений на английский с кэшем.
+    Ключ - хэш нормализованного промпта; сначала LRU в памяти процесса,
+    затем таблица prompt_translations, и только при промахе - запрос к Claude.
+    Одновременные запросы с одинаковым промптом ждут один перевод;
+    если начавший перевод запрос отменен, ожидающие выполняют перевод сами.
+    """
+
+    def __init__(self):
+        self._cache: LRUCache[str] = LRUCache(maxsize=settings.TRANSLATION_CACHE_SIZE)
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    async def translate(self, prompt: str, user_id: str) -> str:
+        if is_english(prompt):
+            return prompt
+
+        key = prompt_hash(prompt)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        while key in self._inflight:
+            inflight = self._inflight[key]
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    # Отменили сам ожидающий запрос
+                    raise
+                # Перевод отменили вместе с запросом, который его начал, - переводим сами
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            translated = await self._load_or_translate(key, prompt, user_id)
+            self._cache.set(key, translated)
+            future.set_result(translated)
+            return translated
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Ожидающих может не быть - не оставляем исключение неполученным
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _load_or_translate(self, key: str, prompt: str, user_id: str) -> str:
+        try:
+            stored = await asyncio.to_thread(self._load, key)
+        except Exception as e:
+            # Недоступный кэш не должен мешать генерации
+            logger.warning(f"Failed to read prompt translation cache: {str(e)}")
+            stored = None
+        if stored is not None:
+            return stored
+
+        translation = await anthropic_service.send_message(
+            messages=[{"role": "user", "content": f"В ответ пришли только перевод на английский: {prompt}"}],
+            temperature=0.3
+        )
+        translated = translation["content"][0]["text"]
+        await usage_recorder.record_llm_call(
+            user_id,
+            "translation",
+            translation["model"],
+            translation["usage"],
+            endpoint="/images/generate/"
+        )
+
+        try:
+            await asyncio.to_thread(self._store, key, prompt, translated, translation["model"])
+        except Exception as e:
+            logger.warning(f"Failed to store prompt translation: {str(e)}")
+        return translated
+
+    @staticmethod
+    def _load(key: str) -> Optional[str]:
+        # Чтение и учет попадания - один запрос
+        db = SessionLocal()
+        try:
+            translated = db.execute(
+                update(PromptTranslation)
+                .where(PromptTranslation.prompt_hash == key)
+                .values(hits=PromptTranslation.hits + 1, last_used_at=func.now())
+                .returning(PromptTranslation.translated_text)
+            ).scalar()
+            db.commit()
+            return translated
+        finally:
+            db.close()
+
+    @staticmethod
+    def _store(key: str, prompt: str, translated: str, model: Optional[str]) -> None:
+        db = SessionLocal()
+        try:
+            db.execute(
+                insert(PromptTranslation).values(
+                    prompt_hash=key,
+                    source_text=prompt,
+                    translated_text=translated,
+                    model=model
+                ).on_conflict_do_nothing(index_elements=["prompt_hash"])
+            )
+            db.commit()
+        finally:
+            db.close()
+
+prompt_translator = PromptTranslator()
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, List, Optional
+from sqlalchemy import insert
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.api_usage import ApiUsage
+from app.models.tool_usage import ToolUsage
+from app.services.pricing import cost_usd, total_tokens
+
+logger = logging.getLogger(__name__)
+
+# Сигнал фоновой задаче: записать накопленное и завершиться
+_STOP = object()
+
+@dataclass
+class UsageEvent:
+    user_id: Optional[str]
+    usage_type: str
+    endpoint: str = ""
+    tokens_used: Optional[int] = None
+    ip_address: Optional[str] = None
+    # Только для usage_type == 'tool'
+    tool_type: Optional[str] = None
+    prompt: Optional[str] = None
+    result: Optional[str] = None
+    # Только для вызовов LLM
+    model: Optional[str] = None
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    cache_creation_input_tokens: Optional[int] = None
+    cache_read_input_tokens: Optional[int] = None
+    cost_usd: Optional[Decimal] = None
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+class UsageRecorder:
+    """
+    Буфер событий использования с пакетной записью в api_usage и tool_usage.
+    Запрос только кладет событие в очередь; фоновая задача пишет накопленное
+    одним INSERT на пакет каждые USAGE_FLUSH_INTERVAL секунд или USAGE_FLUSH_BATCH событий.
+    Если очередь заполнена, запрос ждет не дольше USAGE_ENQUEUE_TIMEOUT, затем событие отбрасывается.
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self.dropped = 0
+
+    async def start(self) -> None:
+        if self._flusher is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=settings.USAGE_BUFFER_SIZE)
+        self._flusher = asyncio.create_task(self._run(self._queue), name="usage-flusher")
+
+    async def stop(self) -> None:
+        """
+        Остановить фоновую запись и сбросить все, что осталось в буфере.
+        Фоновая задача не отменяется, а получает сигнал остановки через очередь
+        и записывает собранный пакет вместе с остатком очереди.
+        """
+        if self._flusher is None:
+            return
+        # Новые события с этого момента пишутся сразу, минуя очередь
+        queue, self._queue = self._queue, None
+        await queue.put(_STOP)
+        await self._flusher
+        self._flusher = None
+
+    async def record(self, event: UsageEvent) -> None:
+        if self._queue is None:
+            # Фоновая запись не запущена (например, в скриптах) - пишем сразу
+            await self._flush([event])
+            return
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(event), timeout=settings.USAGE_ENQUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.dropped += 1
+                logger.warning(f"Usage buffer is full, event dropped (total dropped: {self.dropped})")
+
+    async def record_llm_call(
+        self,
+        user_id: Optional[str],
+        purpose: str,
+        model: str,
+        usage: Dict[str, int],
+        endpoint: str = ""
+    ) -> Decimal:
+        """
+        Записать вызов модели со счетчиками токенов и стоимостью.
+        purpose - назначение вызова: 'chat', 'chat_title', 'translation', 'summary'.
+        Возвращает стоимость вызова в долларах.
+        """
+        cost = cost_usd(model, usage)
+        await self.record(UsageEvent(
+            user_id=user_id,
+            usage_type=f"llm:{purpose}",
+            endpoint=endpoint,
+            tokens_used=total_tokens(usage),
+            model=model,
+            input_tokens=usage.get("input_tokens", 0),
+            output_tokens=usage.get("output_tokens", 0),
+            cache_creation_input_tokens=usage.get("cache_creation_input_tokens", 0),
+            cache_read_input_tokens=usage.get("cache_read_input_tokens", 0),
+            cost_usd=cost
+        ))
+        return cost
+
+    @staticmethod
+    def _drain(queue: asyncio.Queue, limit: int) -> list:
+        items = []
+        while len(items) < limit:
+            try:
+                items.append(queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return items
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        stopping = False
+        while not stopping:
+            items = [await queue.get()]
+            deadline = time.monotonic() + settings.USAGE_FLUSH_INTERVAL
+            while _STOP not in items and len(items) < settings.USAGE_FLUSH_BATCH:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+                items.extend(self._drain(queue, settings.USAGE_FLUSH_BATCH - len(items)))
+            if _STOP in items:
+                # Забираем и события, которые ждали места в очереди и попали в нее после сигнала
+                stopping = True
+                items.extend(self._drain(queue, queue.qsize()))
+            batch: List[UsageEvent] = [item for item in items if item is not _STOP]
+            if not batch:
+                continue
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                logger.error(f"Failed to flush {len(batch)} usage events: {str(e)}", exc_info=True)
+
+    async def _flush(self, batch: List[UsageEvent]) -> None:
+        # Синхронная запись в БД не должна занимать event loop
+        await asyncio.to_thread(self._write, batch)
+
+    @staticmethod
+    def _write(batch: List[UsageEvent]) -> None:
+        api_rows = [
+            {
+                "id": uuid.uuid4(),
+                "user_id": event.user_id,
+                "ip_address": event.ip_address,
+                "endpoint": event.endpoint,
+                "request_type": event.usage_type,
+                "tokens_used": event.tokens_used,
+                "model": event.model,
+                "input_tokens": event.input_tokens,
+                "output_tokens": event.output_tokens,
+                "cache_creation_input_tokens": event.cache_creation_input_tokens,
+                "cache_read_input_tokens": event.cache_read_input_tokens,
+                "cost_usd": event.cost_usd,
+                "created_at": event.created_at
+            }
+            for event in batch
+        ]
+        tool_rows = [
+            {
+                "id": uuid.uuid4(),
+                "user_id": event.user_id,
+                "tool_type": event.tool_type or "unknown",
+                "prompt": event.prompt or "",
+                "result": event.result,
+                "tokens_used": event.tokens_used,
+                "created_at": event.created_at
+            }
+            for event in batch
+            if event.usage_type == "tool" and event.user_id
+        ]
+
+        db = SessionLocal()
+        try:
+            db.execute(insert(ApiUsage), api_rows)
+            if tool_rows:
+                db.execute(insert(ToolUsage), tool_rows)
+            db.commit()
+        finally:
+            db.close()
+
+usage_recorder = UsageRecorder()
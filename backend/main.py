@@ -1,10 +1,10 @@
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
 from app.api.endpoints import api_router
 from app.core.config import settings
-from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter
-import redis.asyncio as redis
+from app.core import lifecycle
 
 app = FastAPI(
     title="Lozhka API",
@@ -25,6 +25,14 @@ app.add_middleware(
 # Add routes
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+# Сгенерированные изображения из локального хранилища (в продакшене лучше отдавать прокси)
+if settings.STORAGE_BACKEND == "local":
+    os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+    app.mount(settings.MEDIA_URL, StaticFiles(directory=settings.MEDIA_ROOT), name="media")
+
+app.add_event_handler("startup", lifecycle.on_startup)
+app.add_event_handler("shutdown", lifecycle.on_shutdown)
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to Lozhka API"}
@@ -32,9 +40,3 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
-
-
-@app.on_event("startup")
-async def startup():
-    redis_instance = redis.from_url("redis://localhost", encoding="utf-8", decode_responses=True)
-    await FastAPILimiter.init(redis_instance)
@@ -0,0 +1,164 @@
+"""
+Перенос изображений, сохраненных прямо в user_images.image_url, в хранилище файлов,
+и построение миниатюр и превью для изображений, у которых их нет.
+
+Запуск: python migrate_image_storage.py [--dry-run]
+
+Строки обрабатываются пачками по STORAGE_MIGRATION_BATCH по возрастанию id,
+каждая пачка - отдельная транзакция, поэтому скрипт можно прервать и запустить снова:
+уже перенесенные строки (storage_key заполнен) и строки с миниатюрой пропускаются.
+"""
+import argparse
+import asyncio
+import base64
+import binascii
+import logging
+from typing import Any, Dict, Optional
+from sqlalchemy import select, update
+from app.core.config import settings
+from app.db.session import SessionLocal
+from app.models.user_images import UserImage
+from app.services.derivatives import derivative_service
+from app.services.storage import blob_store
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("migrate_image_storage")
+
+def decode_image(value: str) -> Optional[bytes]:
+    """
+    Байты изображения из старого значения image_url или None, если это уже ссылка.
+    """
+    if value.startswith("\\x"):
+        # bytes, записанные в текстовую колонку, хранятся как hex-представление bytea
+        return bytes.fromhex(value[2:])
+    if value.startswith("data:"):
+        return base64.b64decode(value.split(",", 1)[1])
+    if value.startswith(("http://", "https://", settings.MEDIA_URL)):
+        return None
+    try:
+        return base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+async def derivative_values(image_id: Any, data: bytes) -> Dict[str, str]:
+    """
+    Построить производные изображения; значения колонок *_url и *_key.
+    Ошибка (например, поврежденный файл) не прерывает перенос - галерея покажет оригинал.
+    """
+    try:
+        derivatives = await derivative_service.create(data)
+    except Exception as e:
+        logger.warning(f"Image {image_id}: failed to create derivatives: {str(e)}")
+        return {}
+    values = {}
+    for name, derivative in derivatives.items():
+        values[f"{name}_url"] = derivative.url
+        values[f"{name}_key"] = derivative.key
+    return values
+
+async def migrate(dry_run: bool) -> None:
+    last_id = None
+    moved = skipped = 0
+    while True:
+        db = SessionLocal()
+        try:
+            query = select(UserImage.id, UserImage.image_url).where(
+                UserImage.storage_key.is_(None),
+                UserImage.image_url.isnot(None)
+            )
+            if last_id is not None:
+                query = query.where(UserImage.id > last_id)
+            rows = db.execute(
+                query.order_by(UserImage.id).limit(settings.STORAGE_MIGRATION_BATCH)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            for row in rows:
+                data = decode_image(row.image_url)
+                if data is None:
+                    logger.warning(f"Image {row.id}: image_url is not embedded image data, skipped")
+                    skipped += 1
+                    continue
+                if dry_run:
+                    moved += 1
+                    continue
+                blob = await blob_store.put(data, "png")
+                db.execute(
+                    update(UserImage)
+                    .where(UserImage.id == row.id)
+                    .values(
+                        image_url=blob.url,
+                        storage_key=blob.key,
+                        size_bytes=blob.size,
+                        content_hash=blob.sha256,
+                        **await derivative_values(row.id, data)
+                    )
+                )
+                moved += 1
+            db.commit()
+            logger.info(f"Moved {moved} images, skipped {skipped}")
+        finally:
+            db.close()
+
+    logger.info(f"Done: moved {moved} images, skipped {skipped}" + (" (dry run)" if dry_run else ""))
+
+async def backfill_derivatives(dry_run: bool) -> None:
+    """
+    Миниатюры и превью для изображений, которые уже лежат в хранилище,
+    но были сохранены до появления производных или без них.
+    """
+    last_id = None
+    created = failed = 0
+    while True:
+        db = SessionLocal()
+        try:
+            query = select(UserImage.id, UserImage.storage_key).where(
+                UserImage.storage_key.isnot(None),
+                UserImage.thumbnail_key.is_(None),
+                UserImage.status == "completed"
+            )
+            if last_id is not None:
+                query = query.where(UserImage.id > last_id)
+            rows = db.execute(
+                query.order_by(UserImage.id).limit(settings.STORAGE_MIGRATION_BATCH)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            for row in rows:
+                if dry_run:
+                    created += 1
+                    continue
+                data = await blob_store.get(row.storage_key)
+                values = await derivative_values(row.id, data) if data is not None else {}
+                if not values:
+                    if data is None:
+                        logger.warning(f"Image {row.id}: file {row.storage_key} is missing, skipped")
+                    failed += 1
+                    continue
+                db.execute(update(UserImage).where(UserImage.id == row.id).values(**values))
+                created += 1
+            db.commit()
+            logger.info(f"Derivatives created for {created} images, failed {failed}")
+        finally:
+            db.close()
+
+    logger.info(
+        f"Done: derivatives created for {created} images, failed {failed}" + (" (dry run)" if dry_run else "")
+    )
+
+async def main(dry_run: bool) -> None:
+    try:
+        await migrate(dry_run)
+        await backfill_derivatives(dry_run)
+    finally:
+        derivative_service.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--dry-run", action="store_true", help="только посчитать строки, ничего не менять")
+    args = parser.parse_args()
+    asyncio.run(main(args.dry_run))
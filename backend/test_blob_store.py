@@ -0,0 +1,93 @@
+import asyncio
+import os
+import time
+import pytest
+from app.core.config import settings
+from app.services.blob_gc import BlobGarbageCollector
+from app.services.storage import LocalBlobStore
+
+# Общие файлы одинакового содержимого и их сборка мусора: временный каталог вместо MEDIA_ROOT, без БД
+
+GRACE = 3600
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalBlobStore(str(tmp_path), "/media")
+
+@pytest.fixture(autouse=True)
+def gc_settings(monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_GC_GRACE", GRACE)
+    monkeypatch.setattr(settings, "STORAGE_GC_BATCH", 2)
+
+def age(store: LocalBlobStore, key: str, seconds: float) -> None:
+    modified_at = time.time() - seconds
+    os.utime(store._path(key), (modified_at, modified_at))
+
+def collector(store: LocalBlobStore, referenced: set) -> BlobGarbageCollector:
+    return BlobGarbageCollector(store, lambda keys: referenced & set(keys))
+
+def test_same_content_is_stored_once(store, tmp_path):
+    async def scenario():
+        first = await store.put(b"image", "png")
+        second = await store.put(b"image", "png")
+        assert first.key == second.key
+        files = [name for _, _, names in os.walk(tmp_path) for name in names]
+        assert files == [f"{first.sha256}.png"]
+        assert await store.get(first.key) == b"image"
+    asyncio.run(scenario())
+
+def test_sweep_keeps_shared_file_until_last_reference_is_gone(store):
+    async def scenario():
+        blob = await store.put(b"image", "png")
+        age(store, blob.key, GRACE * 2)
+        # Два изображения ссылаются на один файл; удаление одного из них файл не трогает
+        referenced = {blob.key}
+        assert await collector(store, referenced).sweep() == 0
+        assert await store.exists(blob.key)
+        # Удалено и второе изображение
+        referenced.clear()
+        assert await collector(store, referenced).sweep() == 1
+        assert not await store.exists(blob.key)
+    asyncio.run(scenario())
+
+def test_sweep_skips_files_younger_than_grace(store):
+    async def scenario():
+        # Генерация сохранила файл, но еще не закоммитила строку со ссылкой
+        blob = await store.put(b"fresh", "png")
+        assert await collector(store, set()).sweep() == 0
+        assert await store.exists(blob.key)
+    asyncio.run(scenario())
+
+def test_rewrite_refreshes_file_age(store):
+    async def scenario():
+        blob = await store.put(b"image", "png")
+        age(store, blob.key, GRACE * 2)
+        # Новая генерация с тем же содержимым нашла файл в хранилище
+        await store.put(b"image", "png")
+        assert await collector(store, set()).sweep() == 0
+        assert await store.exists(blob.key)
+    asyncio.run(scenario())
+
+def test_sweep_checks_references_in_batches(store):
+    async def scenario():
+        blobs = [await store.put(f"image-{i}".encode(), "webp") for i in range(5)]
+        for blob in blobs:
+            age(store, blob.key, GRACE * 2)
+        batches = []
+
+        def referenced(keys):
+            batches.append(len(keys))
+            return {blobs[0].key} & set(keys)
+
+        assert await BlobGarbageCollector(store, referenced).sweep() == 4
+        assert max(batches) <= settings.STORAGE_GC_BATCH
+        assert [await store.exists(blob.key) for blob in blobs] == [True, False, False, False, False]
+    asyncio.run(scenario())
+
+def test_delete_if_older_keeps_recently_written_file(store):
+    async def scenario():
+        blob = await store.put(b"image", "png")
+        assert not await store.delete_if_older(blob.key, time.time() - GRACE)
+        assert await store.delete_if_older(blob.key, time.time() + 1)
+        assert not await store.delete_if_older(blob.key, time.time() + 1)
+    asyncio.run(scenario())
@@ -97,8 +97,9 @@ async def test_chat_api():
                 headers=headers
             )
             print("Get messages response:", response.status_code)
-            messages = response.json()
-            print(f"Got {len(messages)} messages")
+            page = response.json()
+            messages = page["items"]
+            print(f"Got {len(messages)} messages, has_more: {page['has_more']}")
 
         except Exception as e:
             print(f"Error during test: {str(e)}")
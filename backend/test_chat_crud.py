@@ -61,7 +61,7 @@ def test_chat_operations():
         print(f"User has {len(user_chats)} chats")
 
         # 6. Получаем сообщения чата
-        chat_messages = chat.get_chat_messages(db, test_chat.id)
+        chat_messages, _ = chat.get_chat_messages(db, test_chat.id)
         print(f"Chat has {len(chat_messages)} messages")
 
         # 7. Обновляем название чата
@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+from uuid import uuid4
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api.endpoints import chat as chat_endpoints
+from app.core.auth import get_current_user
+from app.core.database import get_db
+from app.services.entitlements import entitlements_service, get_entitlements
+from app.services.limits import LimitsService
+from app.services.quota import InMemoryQuotaBackend, quota_engine
+
+# Ход диалога сверх дневного лимита: ответ 429 до сохранения сообщения, без БД и Redis
+
+USER = SimpleNamespace(id=uuid4())
+
+@pytest.fixture
+def client(monkeypatch):
+    app = FastAPI()
+    app.include_router(chat_endpoints.router, prefix="/chats")
+    app.dependency_overrides[get_db] = lambda: SimpleNamespace()
+    app.dependency_overrides[get_current_user] = lambda: USER
+    app.dependency_overrides[get_entitlements] = lambda: SimpleNamespace(model="model", plan_name=None)
+    app.dependency_overrides[chat_endpoints.message_rate_limit] = lambda: None
+
+    monkeypatch.setattr(quota_engine, "_backend", InMemoryQuotaBackend())
+    # Бесплатный план с одним сообщением в день, которое уже отправлено
+    monkeypatch.setattr(entitlements_service, "limits", lambda db, user_id: (None, 1, 0, 0))
+    monkeypatch.setattr(LimitsService, "count_chat_messages", staticmethod(lambda db, user_id, since: 1))
+    monkeypatch.setattr(chat_endpoints.chat, "get_chat", lambda db, chat_id: SimpleNamespace(user_id=USER.id))
+
+    def add_user_message(**kwargs):
+        raise AssertionError("message must not be saved over the limit")
+
+    monkeypatch.setattr(chat_endpoints.chat, "add_user_message", add_user_message)
+    return TestClient(app)
+
+@pytest.mark.parametrize("path", ["messages/", "messages/stream/"])
+def test_over_daily_limit_is_429(client, path):
+    response = client.post(f"/chats/{uuid4()}/{path}", json={"role": "user", "content": "hello"})
+    assert response.status_code == 429
+    assert response.json()["detail"] == "Daily message limit exceeded"
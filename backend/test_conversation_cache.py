@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta, timezone
+from app.services.conversation_cache import InMemoryConversationBackend, position_key
+
+# Тесты окна сообщений в памяти: порядок дописывания при параллельных ходах
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+def entry(message_id: str, seconds: float) -> dict:
+    return {
+        "id": message_id,
+        "role": "user",
+        "content": message_id,
+        "created_at": (START + timedelta(seconds=seconds)).isoformat()
+    }
+
+def test_position_key_orders_by_created_at_then_id():
+    # isoformat без микросекунд короче - сравнение строк created_at тут бы ошиблось
+    assert position_key(entry("b", 1)) < position_key(entry("a", 1.5))
+    assert position_key(entry("a", 2)) < position_key(entry("b", 2))
+
+def test_append_keeps_order():
+    backend = InMemoryConversationBackend(max_chats=10, window=3, ttl=60)
+    backend.set("c1", [entry("m1", 0)], True)
+    backend.append("c1", entry("m2", 1))
+    backend.append("c1", entry("m3", 2))
+    backend.append("c1", entry("m4", 3))
+    messages, complete = backend.get("c1")
+    assert [message["id"] for message in messages] == ["m2", "m3", "m4"]
+    assert not complete
+
+def test_older_append_drops_window():
+    backend = InMemoryConversationBackend(max_chats=10, window=10, ttl=60)
+    backend.set("c1", [entry("m1", 0)], True)
+    backend.append("c1", entry("m3", 2))
+    # Сообщение параллельного хода закоммичено раньше, но дописывается позже
+    backend.append("c1", entry("m2", 1))
+    assert backend.get("c1") is None
+    # Окна нет - дописывание его не заводит
+    backend.append("c1", entry("m4", 3))
+    assert backend.get("c1") is None
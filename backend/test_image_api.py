@@ -54,11 +54,23 @@ async def test_image_api():
             print(f"Response headers: {response.headers}")
             print(f"Response content: {response.text}")
             print("Generate image response:", response.status_code)
-            if response.status_code != 200:
+            if response.status_code != 202:
                 print("Error response:", response.text)
             else:
                 image = response.json()
-                print("Image generated:", image["id"])
+                print("Image submitted:", image["id"], image["status"])
+
+                # Ждем завершения фоновой генерации
+                for _ in range(60):
+                    response = await client.get(
+                        f"{BASE_URL}{API_PREFIX}/images/{image['id']}",
+                        headers=headers
+                    )
+                    image = response.json()
+                    if image["status"] in ("completed", "failed"):
+                        break
+                    await asyncio.sleep(2)
+                print("Image status:", image["status"], image.get("error") or "")
 
                 # 4. Получение списка изображений
                 print("\nGetting user images...")
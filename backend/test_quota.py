@@ -0,0 +1,101 @@
+import asyncio
+from app.services.quota import InMemoryQuotaBackend, QuotaEngine, QuotaWindow
+
+# Тесты QuotaEngine на счетчиках в памяти: без БД и Redis
+
+def make_engine() -> QuotaEngine:
+    engine = QuotaEngine()
+    engine._backend = InMemoryQuotaBackend()
+    return engine
+
+def seed_with(value: int):
+    async def seed() -> int:
+        return value
+    return seed
+
+def test_consume_seeds_and_respects_limit():
+    async def scenario():
+        engine = make_engine()
+        window = QuotaWindow.daily()
+        first = await engine.consume("chat", "u1", 3, window, seed_with(1))
+        assert first.allowed and first.used == 2
+        second = await engine.consume("chat", "u1", 3, window, seed_with(100))
+        assert second.allowed and second.used == 3
+        denied = await engine.consume("chat", "u1", 3, window, seed_with(0))
+        assert not denied.allowed and denied.used == 3
+        # Отказ не меняет счетчик
+        assert (await engine.peek("chat", "u1", 3, window, seed_with(0))).used == 3
+    asyncio.run(scenario())
+
+def test_concurrent_consume_never_exceeds_limit():
+    async def scenario():
+        engine = make_engine()
+        window = QuotaWindow.monthly()
+        results = await asyncio.gather(*(
+            engine.consume("image", "u1", 5, window, seed_with(0)) for _ in range(20)
+        ))
+        assert sum(result.allowed for result in results) == 5
+        assert (await engine.peek("image", "u1", 5, window, seed_with(0))).used == 5
+    asyncio.run(scenario())
+
+def test_release_returns_quota_and_stops_at_zero():
+    async def scenario():
+        engine = make_engine()
+        window = QuotaWindow.monthly()
+        await engine.consume("image", "u1", 1, window, seed_with(0))
+        assert not (await engine.consume("image", "u1", 1, window, seed_with(0))).allowed
+        await engine.release("image", "u1", window)
+        assert (await engine.consume("image", "u1", 1, window, seed_with(0))).allowed
+        await engine.release("image", "u1", window, amount=5)
+        assert (await engine.peek("image", "u1", 1, window, seed_with(7))).used == 0
+    asyncio.run(scenario())
+
+def test_reconcile_corrects_drift():
+    async def scenario():
+        engine = make_engine()
+        window = QuotaWindow.daily()
+        engine.register_reconciler("chat", QuotaWindow.daily, lambda user_id, _: {"u1": 4, "u2": 0}[user_id])
+        await engine.consume("chat", "u1", 10, window, seed_with(0))
+        await engine.consume("chat", "u2", 10, window, seed_with(2))
+        await engine.reconcile()
+        assert (await engine.peek("chat", "u1", 10, window, seed_with(0))).used == 4
+        assert (await engine.peek("chat", "u2", 10, window, seed_with(0))).used == 0
+    asyncio.run(scenario())
+
+def test_reconcile_keeps_consumes_made_while_counting():
+    async def scenario():
+        engine = make_engine()
+        window = QuotaWindow.daily()
+        loop = asyncio.get_running_loop()
+        await engine.consume("chat", "u1", 10, window, seed_with(0))
+
+        def count(user_id: str, _: QuotaWindow) -> int:
+            # Пока идет подсчет (в потоке), пользователь отправляет еще одно сообщение
+            asyncio.run_coroutine_threadsafe(
+                engine.consume("chat", user_id, 10, window, seed_with(0)), loop
+            ).result()
+            return 0
+
+        engine.register_reconciler("chat", QuotaWindow.daily, count)
+        await engine.reconcile()
+        assert (await engine.peek("chat", "u1", 10, window, seed_with(0))).used == 2
+    asyncio.run(scenario())
+
+def test_reconcile_skips_other_periods_and_kinds():
+    async def scenario():
+        engine = make_engine()
+        today = QuotaWindow.daily()
+        month = QuotaWindow.monthly()
+        counted = []
+
+        def count(user_id: str, _: QuotaWindow) -> int:
+            counted.append(user_id)
+            return 0
+
+        engine.register_reconciler("chat", QuotaWindow.daily, count)
+        await engine.consume("chat", "u1", 10, today, seed_with(3))
+        await engine.consume("image", "u2", 10, month, seed_with(3))
+        await engine.reconcile()
+        assert counted == ["u1"]
+        assert (await engine.peek("image", "u2", 10, month, seed_with(0))).used == 4
+    asyncio.run(scenario())